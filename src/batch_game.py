@@ -0,0 +1,847 @@
+"""A lock-step, vectorized simulator for bot vs bot games.
+
+Mirrors Game.turn2 for two players, but advances N games at once and keeps the
+state of every game in numpy arrays instead of one object graph per game.
+Contains vectorized versions of the built in strategies, so that a StratAI
+parameter sweep runs as a single batch, and ScalarStrategy, which plays any
+Strategy through its batch methods.
+
+Cards are stored by their position in the dank relative sort order rather than
+by Card.id: positions 0-26 are the non dank cards by rank then suit, and 27-35
+are the danks by rank. In that order the lowest card of a hand is its first set
+position, and which positions beat which does not depend on the dank suit, so
+a single table serves every game. Hands sort ties (same rank, different non
+dank suits) by suit, where Player keeps them in the order they were drawn.
+"""
+
+# pylint: disable=import-error
+import numpy as np
+
+from card import CARDS, RANK_NUM, RANKS, SUITS
+from deck import shuffled_deals
+from strategy import DONE, NUM_ACTIONS, PASS, S0, S1, S2, StratAI, TAKE
+
+NUM_CARDS = len(CARDS)
+NUM_PLAIN = (len(SUITS) - 1) * len(RANKS)
+MAX_TABLE = 24
+
+
+def _positions(dank_num):
+    """Maps card ids to positions for a dank suit.
+
+    Args:
+        dank_num: The index of the dank suit.
+
+    Returns:
+        An int array with the position of each card id.
+    """
+
+    plain = [suit_num for suit_num in range(len(SUITS)) if suit_num != dank_num]
+    ret = np.zeros(NUM_CARDS, dtype=np.int64)
+    for card in CARDS:
+        if card.suit_num == dank_num:
+            ret[card.id] = NUM_PLAIN + card.rank_num
+        else:
+            ret[card.id] = card.rank_num * len(plain) + plain.index(card.suit_num)
+    return ret
+
+
+# POSITIONS[dank_num][card.id] is the position of a card for a dank suit.
+POSITIONS = np.array([_positions(dank_num) for dank_num in range(len(SUITS))])
+# CARD_IDS[dank_num][position] is the card id of a position, with -1 kept at -1.
+CARD_IDS = np.array([np.append(np.argsort(positions), -1) for positions in POSITIONS])
+CARD_SUITS = np.array([card.suit_num for card in CARDS])
+POS_RANK = np.array([pos // (len(SUITS) - 1) if pos < NUM_PLAIN else pos - NUM_PLAIN for pos in range(NUM_CARDS)])
+POS_DANK = np.arange(NUM_CARDS) >= NUM_PLAIN
+# dank_float_order of each position.
+POS_VALUE = (POS_RANK + len(RANKS) * POS_DANK) / (len(RANKS) + 8)
+# BEATS_POS[attack] is True for every position that beats the attack position.
+BEATS_POS = np.array([[
+    (defense > attack) if attack >= NUM_PLAIN else
+    (defense >= NUM_PLAIN or (defense % 3 == attack % 3 and defense > attack))
+    for defense in range(NUM_CARDS)] for attack in range(NUM_CARDS)])
+
+
+def first(mask):
+    """Returns the first set position of each row.
+
+    Args:
+        mask: Bool array of shape (K, 36).
+
+    Returns:
+        The first set position of each row, -1 for empty rows.
+    """
+
+    pos = mask.argmax(axis=1)
+    return np.where(mask[np.arange(len(mask)), pos], pos, -1)
+
+
+def nth(mask, index):
+    """Returns the set position of each row at a given index.
+
+    Args:
+        mask: Bool array of shape (K, 36).
+        index: The 0 based index of the wanted set position in each row.
+
+    Returns:
+        The position of the index-th set position of each row.
+    """
+
+    return (mask.cumsum(axis=1) > index[:, None]).argmax(axis=1)
+
+
+def collapse(probability, mask):
+    """Vectorized strategy.collapse over the set positions of each row.
+
+    Args:
+        probability: A number 0-1 per row.
+        mask: Bool array of shape (K, 36), with no empty rows.
+
+    Returns:
+        The position strategy.collapse picks in each row.
+    """
+
+    count = mask.sum(axis=1)
+    index = np.minimum(np.floor(probability * count + 0.5).astype(np.int64), count - 1)
+    return nth(mask, index)
+
+
+def first_n(mask, limit):
+    """Keeps the first few set positions of each row.
+
+    Args:
+        mask: Bool array of shape (K, 36).
+        limit: The number of positions to keep in each row.
+
+    Returns:
+        The mask with everything after the limit-th set position cleared.
+    """
+
+    return mask & (mask.cumsum(axis=1) <= limit[:, None])
+
+
+class BatchStrategy:
+    """An interface for vectorized strategies, with S0's logic as default.
+
+    Each method decides for K games at once. hands is a bool array of shape
+    (K, 36) by position and games holds the index of each row's game, for
+    strategies with per game parameters. Cards are returned as positions, -1
+    meaning no card.
+
+    Attributes:
+        defends_all: Whether every card on the table is defended after a pass,
+            as S0 does, or only the last one, as StratRandom does.
+    """
+
+    defends_all = True
+
+    def lead(self, hands, games):
+        """The mandatory first attack of a turn.
+
+        Args:
+            hands: The hands of the attackers.
+            games: The index of each row's game.
+
+        Returns:
+            The position played by each attacker.
+        """
+
+        return first(hands)
+
+    def attack(self, hands, matches, games):
+        """A follow up attack.
+
+        Args:
+            hands: The hands of the attackers.
+            matches: The cards of each hand matching the ranks in play.
+            games: The index of each row's game.
+
+        Returns:
+            The position played by each attacker, -1 when done.
+        """
+
+        return first(matches)
+
+    def pass_card(self, hands, matches, games):
+        """A pass, only offered when passing is legal.
+
+        Args:
+            hands: The hands of the defenders.
+            matches: The cards of each hand matching the rank of the last attack.
+            games: The index of each row's game.
+
+        Returns:
+            The position passed by each defender, -1 to not pass.
+        """
+
+        return first(matches)
+
+    def defend(self, hands, options, games):
+        """A defense of a single card.
+
+        Args:
+            hands: The hands of the defenders.
+            options: The cards of each hand that beat the attack.
+            games: The index of each row's game.
+
+        Returns:
+            The position defended with, -1 to take.
+        """
+
+        return first(options)
+
+    def shed(self, hands, matches, max_shed_allowed, games):
+        """A shed after the defender takes.
+
+        Args:
+            hands: The hands of the attackers.
+            matches: The cards of each hand matching the ranks in play.
+            max_shed_allowed: The maximum amount of cards to shed per row.
+            games: The index of each row's game.
+
+        Returns:
+            Bool array of shape (K, 36) of the cards shed.
+        """
+
+        return first_n(matches, max_shed_allowed)
+
+    def scalar(self, game):
+        """The Strategy whose logic is played in a game, for callers that
+        need it on a hand in another order than by position.
+
+        Args:
+            game: The index of the game.
+
+        Returns:
+            The Strategy, or None if there is no single game version.
+        """
+
+        return None
+
+
+class BatchS0(BatchStrategy):
+    """Vectorized S0.
+    """
+
+    def scalar(self, game):
+        return S0()
+
+
+class BatchS1(BatchStrategy):
+    """Vectorized S1: does not shed danks or pass with a dank.
+    """
+
+    def pass_card(self, hands, matches, games):
+        pos = first(matches)
+        return np.where(POS_DANK[pos], -1, pos)
+
+    def shed(self, hands, matches, max_shed_allowed, games):
+        return first_n(matches & ~POS_DANK, max_shed_allowed)
+
+    def scalar(self, game):
+        return S1()
+
+
+class BatchS2(BatchS1):
+    """Vectorized S2: as S1, and does not shed if card rank > 10.
+    """
+
+    def shed(self, hands, matches, max_shed_allowed, games):
+        return first_n(matches & ~POS_DANK & (POS_RANK < RANK_NUM['J']), max_shed_allowed)
+
+    def scalar(self, game):
+        return S2()
+
+
+class BatchStratAI(BatchS1):
+    """Vectorized StratAI.
+
+    Attributes:
+        shed_val: The shed threshold, a number or an array with one per game.
+        play_val: The play position, a number or an array with one per game.
+    """
+
+    def __init__(self, shed_val, play_val):
+        """Inits BatchStratAI.
+
+        Args:
+            shed_val: The shed threshold, a number or an array with one per game.
+            play_val: The play position, a number or an array with one per game.
+        """
+
+        self.shed_val = shed_val
+        self.play_val = play_val
+
+    def _param(self, value, games):
+        """Selects a parameter for the given games.
+        """
+
+        return value[games] if np.ndim(value) else np.full(len(games), value)
+
+    def lead(self, hands, games):
+        return collapse(self._param(self.play_val, games), hands)
+
+    def attack(self, hands, matches, games):
+        has = matches.any(axis=1)
+        pos = np.full(len(hands), -1)
+        pos[has] = collapse(self._param(self.play_val, games[has]), matches[has])
+        return pos
+
+    def shed(self, hands, matches, max_shed_allowed, games):
+        below = POS_VALUE < self._param(self.shed_val, games)[:, None]
+        return first_n(matches & below, max_shed_allowed)
+
+    def scalar(self, game):
+        games = np.array([game])
+        return StratAI(self._param(self.shed_val, games)[0], self._param(self.play_val, games)[0])
+
+
+class BatchStratRandom(BatchStrategy):
+    """Vectorized StratRandom.
+
+    Attributes:
+        rng: The numpy Generator used for every choice.
+    """
+
+    defends_all = False
+
+    def __init__(self, rng=None):
+        """Inits BatchStratRandom.
+
+        Args:
+            rng: Optional numpy Generator, a fresh unseeded one by default.
+        """
+
+        self.rng = np.random.default_rng() if rng is None else rng
+
+    def _choice(self, mask):
+        """Picks a random set position of each row, -1 for empty rows.
+        """
+
+        count = mask.sum(axis=1)
+        index = np.floor(self.rng.random(len(mask)) * count).astype(np.int64)
+        return np.where(count > 0, nth(mask, index), -1)
+
+    def lead(self, hands, games):
+        return self._choice(hands)
+
+    def attack(self, hands, matches, games):
+        return self._choice(matches)
+
+    def pass_card(self, hands, matches, games):
+        return np.full(len(hands), -1)
+
+    def defend(self, hands, options, games):
+        return self._choice(options)
+
+    def shed(self, hands, matches, max_shed_allowed, games):
+        return first_n(matches, max_shed_allowed) & (self.rng.random(matches.shape) < .5)
+
+
+class ScalarStrategy(BatchStrategy):
+    """Plays a Strategy in a BatchGame through its batch methods.
+
+    Converts positions to card ids and back, and reads the tables and ranks
+    from the turn being played. A defense is asked for once per pass, with
+    every card on the table to defend, and handed out card by card as
+    BatchGame asks for it.
+
+    Attributes:
+        strategy: The Strategy played.
+        batch: The BatchGame or VecEnv played in, set by it.
+        defends_all: As the strategy's defends_all.
+    """
+
+    def __init__(self, strategy):
+        """Inits ScalarStrategy.
+
+        Args:
+            strategy: The Strategy to play.
+        """
+
+        self.strategy = strategy
+        self.batch = None
+        self.defends_all = strategy.defends_all
+        self._defenses = {}
+
+    def _rows(self, games):
+        """Returns the rows of the current turn, the danks and the tables by card id.
+        """
+
+        turn = self.batch.current
+        rows = np.searchsorted(turn.games, games)
+        danks = self.batch.dank[games]
+        return rows, danks, CARD_IDS[danks[:, None], turn.table[rows]]
+
+    @staticmethod
+    def _ids(mask, danks):
+        """Returns a position mask as a card id mask.
+        """
+
+        return mask[np.arange(len(mask))[:, None], POSITIONS[danks]]
+
+    @staticmethod
+    def _legal(cards, *actions):
+        """Returns the legal actions: a card id mask and the given other actions.
+        """
+
+        legal = np.zeros((len(cards), NUM_ACTIONS), dtype=bool)
+        legal[:, :NUM_CARDS] = cards
+        legal[:, list(actions)] = True
+        return legal
+
+    def _attack(self, hands, options, games, *actions):
+        """Asks for attacks and returns the positions played, -1 when done.
+        """
+
+        rows, danks, tables = self._rows(games)
+        atk = self.strategy.attack_batch(self._ids(hands, danks), tables, danks, self.batch.current.ranks[rows],
+                                         self._legal(self._ids(options, danks), *actions))
+        return np.where(atk == DONE, -1, POSITIONS[danks, np.minimum(atk, NUM_CARDS - 1)])
+
+    def lead(self, hands, games):
+        return self._attack(hands, hands, games)
+
+    def attack(self, hands, matches, games):
+        return self._attack(hands, matches, games, DONE)
+
+    def _defense(self, hands, games, options, pass_is_legal, cards_to_defend):
+        """Asks for defenses and keeps them for defend.
+
+        Returns:
+            The first action of each defense.
+        """
+
+        _, danks, tables = self._rows(games)
+        defense = self.strategy.defend_batch(self._ids(hands, danks), tables, danks, pass_is_legal, cards_to_defend,
+                                             self._legal(self._ids(options, danks), TAKE))
+        for row, game in enumerate(games):
+            cards = [int(card) for card in defense[row, :cards_to_defend[row]] if 0 <= card < NUM_CARDS]
+            self._defenses[game] = cards
+        return defense[:, 0]
+
+    def pass_card(self, hands, matches, games):
+        turn = self.batch.current
+        rows = np.searchsorted(turn.games, games)
+        pass_is_legal = self.batch.count(games, turn.attacker[rows]) >= turn.table_len[rows] + 1
+        last = turn.table[rows, turn.table_len[rows] - 1]
+        first_action = self._defense(hands, games, matches | (hands & BEATS_POS[last]), pass_is_legal,
+                                     turn.table_len[rows])
+        passing = first_action >= PASS
+        for game in games[passing]:
+            del self._defenses[game]
+        return np.where(passing, POSITIONS[self.batch.dank[games], np.where(passing, first_action - PASS, 0)], -1)
+
+    def defend(self, hands, options, games):
+        asked = np.array([game not in self._defenses for game in games], dtype=bool)
+        if asked.any():
+            self._defense(hands[asked], games[asked], options[asked], np.zeros(asked.sum(), dtype=bool),
+                          np.ones(asked.sum(), dtype=np.int64))
+        ret = np.full(len(games), -1)
+        for row, game in enumerate(games):
+            cards = self._defenses[game]
+            if cards:
+                ret[row] = POSITIONS[self.batch.dank[game], cards.pop(0)]
+            if not cards:
+                del self._defenses[game]
+        return ret
+
+    def shed(self, hands, matches, max_shed_allowed, games):
+        rows, danks, tables = self._rows(games)
+        shed = self.strategy.shed_batch(self._ids(hands, danks), tables, danks, max_shed_allowed,
+                                        self.batch.current.ranks[rows], self._legal(self._ids(matches, danks), DONE))
+        return shed[np.arange(len(shed))[:, None], CARD_IDS[danks, :NUM_CARDS]]
+
+    def scalar(self, game):
+        return self.strategy
+
+
+class BatchGame:
+    """Plays many two player games in lock step.
+
+    Every call to turn plays one turn of every running game, following
+    Game.turn2, with each phase applied to all games in it at once.
+
+    Attributes:
+        strategies: The BatchStrategy of each seat.
+        current: The Turn being played, for ScalarStrategy.
+        dank: The dank suit index of each game.
+        deck: Int array (N, 36) of card positions from bottom to top.
+        deck_len: The number of cards left in each deck.
+        hands: Bool array (N, 2, 36) of the cards in each hand, by position.
+        sizes: Int array (N, 2) of the number of cards in each hand.
+        out: Bool array (N, 36) of each game's out pile, by position.
+        attacker: The attacking seat of each game.
+        winner: The winning seat of each game, -1 while it is running.
+        turns: A count of turns that have passed in each game.
+    """
+
+    def __init__(self, strategies, deals):
+        """Inits BatchGame and deals 6 cards to each seat.
+
+        Args:
+            strategies: The BatchStrategy of seat 0 and seat 1. A Strategy is
+                played through a ScalarStrategy.
+            deals: Int array (N, 36) of card ids from the bottom of each deck to
+                the top, such as DealStream.block(b) or shuffled_deals.
+        """
+
+        if len(strategies) != 2:
+            raise RuntimeError("BatchGame only plays two player games!")
+
+        deals = np.asarray(deals)
+        num_games = len(deals)
+        self.strategies = [strategy if isinstance(strategy, BatchStrategy) else ScalarStrategy(strategy)
+                           for strategy in strategies]
+        for strategy in self.strategies:
+            if isinstance(strategy, ScalarStrategy):
+                strategy.batch = self
+        self.current = None
+        self.dank = CARD_SUITS[deals[:, 0]]
+        self.deck = POSITIONS[self.dank[:, None], deals]
+        self.deck_len = np.full(num_games, NUM_CARDS)
+        self.hands = np.zeros((num_games, 2, NUM_CARDS), dtype=bool)
+        self.sizes = np.zeros((num_games, 2), dtype=np.int64)
+        self.out = np.zeros((num_games, NUM_CARDS), dtype=bool)
+        self.winner = np.full(num_games, -1)
+        self.turns = np.zeros(num_games, dtype=np.int64)
+
+        games = np.arange(num_games)
+        for _ in range(6):
+            for seat in range(2):
+                self._draw(games, np.full(num_games, seat))
+
+        # Whoever has the lowest dank goes first, else we default to 0.
+        danks = self.hands[:, :, NUM_PLAIN:]
+        lowest = np.where(danks.any(axis=2), danks.argmax(axis=2), NUM_CARDS)
+        self.attacker = (lowest[:, 1] < lowest[:, 0]).astype(np.int64)
+
+    def __len__(self):
+        return len(self.winner)
+
+    def count(self, games, seats):
+        """Returns the number of cards in the given hands.
+
+        Args:
+            games: The game indices.
+            seats: The seat of each game.
+        """
+
+        return self.sizes[games, seats]
+
+    def _draw(self, games, seats):
+        """Draws one card into each given hand, if its deck is not empty.
+        """
+
+        left = self.deck_len[games] > 0
+        games, seats = games[left], seats[left]
+        self.deck_len[games] -= 1
+        self.hands[games, seats, self.deck[games, self.deck_len[games]]] = True
+        self.sizes[games, seats] += 1
+
+    def _draw_up(self, games, seats):
+        """Draws the given hands up to 6 cards, or until the deck runs out.
+        """
+
+        need = np.minimum(np.maximum(6 - self.sizes[games, seats], 0), self.deck_len[games])
+        rows, index = np.nonzero(np.arange(6) < need[:, None])
+        drawn = self.deck[games[rows], self.deck_len[games[rows]] - 1 - index]
+        self.hands[games[rows], seats[rows], drawn] = True
+        self.sizes[games, seats] += need
+        self.deck_len[games] -= need
+
+    def _decide(self, method, games, seats, *args):
+        """Asks each seat's strategy to decide for its games.
+
+        Args:
+            method: The name of the BatchStrategy method.
+            games: The game indices.
+            seats: The seat deciding in each game.
+            *args: Per game arrays passed on to the method.
+
+        Returns:
+            The decisions, in the order of games.
+        """
+
+        ret = None
+        for seat, strategy in enumerate(self.strategies):
+            sel = seats == seat
+            if not sel.any():
+                continue
+            sub = games[sel]
+            res = getattr(strategy, method)(self.hands[sub, seat], *[arg[sel] for arg in args], sub)
+            if ret is None:
+                ret = np.empty((len(games),) + res.shape[1:], dtype=res.dtype)
+            ret[sel] = res
+        return ret
+
+    def _defend(self, turn, rows, all_cards):
+        """Defends the table for the given rows of a turn.
+
+        Strategies that defend all cards defend every card on the table in
+        order, each with what is left of the hand, and take as soon as one
+        fails. Otherwise only the last card is defended.
+
+        Args:
+            turn: The Turn being played.
+            rows: The rows of the turn defending.
+            all_cards: Whether cards_to_defend is the whole table (pass phase)
+                or only the last card.
+        """
+
+        for seat, strategy in enumerate(self.strategies):
+            sub = rows[turn.defender[rows] == seat]
+            if all_cards and strategy.defends_all:
+                multi = turn.table_len[sub] > 1
+                self._defend_all(turn, sub[multi], seat, strategy)
+                sub = sub[~multi]
+            if not len(sub):
+                continue
+            games = turn.games[sub]
+            hands = self.hands[games, seat]
+            last = turn.table[sub, turn.table_len[sub] - 1]
+            pos = strategy.defend(hands, hands & BEATS_POS[last], games)
+            good = pos >= 0
+            turn.take[sub[~good]] = True
+            self.hands[games[good], seat, pos[good]] = False
+            self.sizes[games[good], seat] -= 1
+            turn.add(sub[good], pos[good])
+
+    def _defend_all(self, turn, rows, seat, strategy):
+        """Defends every card on the table in order, for the given rows.
+        """
+
+        if not len(rows):
+            return
+        games = turn.games[rows]
+        hands = self.hands[games, seat]
+        lengths = turn.table_len[rows]
+        defended = np.full((len(rows), lengths.max()), -1)
+        holding = np.ones(len(rows), dtype=bool)
+        for index in range(lengths.max()):
+            live = np.flatnonzero(holding & (index < lengths))
+            options = hands[live] & BEATS_POS[turn.table[rows[live], index]]
+            pos = strategy.defend(hands[live], options, games[live])
+            holding[live[pos < 0]] = False
+            good = pos >= 0
+            hands[live[good], pos[good]] = False
+            defended[live[good], index] = pos[good]
+
+        # Failed defenses put their cards back by not committing the hand.
+        turn.take[rows[~holding]] = True
+        held = np.flatnonzero(holding)
+        self.hands[games[held], seat] = hands[held]
+        self.sizes[games[held], seat] -= lengths[held]
+        for index in range(lengths.max()):
+            cards = defended[held, index]
+            has = cards >= 0
+            turn.add(rows[held[has]], cards[has])
+
+    def turn(self):
+        """Plays one turn of every running game.
+        """
+
+        games = np.flatnonzero(self.winner < 0)
+        turn = Turn(games, self.attacker[games])
+        self.current = turn
+        if not len(turn.games):
+            return
+        every = np.arange(len(turn.games))
+
+        lead = self._decide('lead', turn.games, turn.attacker)
+        self.hands[turn.games, turn.attacker, lead] = False
+        self.sizes[turn.games, turn.attacker] -= 1
+        turn.table[:, 0] = lead
+        turn.table_len[:] = 1
+
+        # Pass phase.
+        rows = every
+        while len(rows):
+            games = turn.games[rows]
+            last = turn.table[rows, turn.table_len[rows] - 1]
+            pass_is_legal = self.count(games, turn.attacker[rows]) >= turn.table_len[rows] + 1
+            matches = self.hands[games, turn.defender[rows]] & (POS_RANK == POS_RANK[last][:, None]) & pass_is_legal[:, None]
+            passed = self._decide('pass_card', games, turn.defender[rows], matches)
+            passing = passed >= 0
+            pass_rows = rows[passing]
+            self.hands[turn.games[pass_rows], turn.defender[pass_rows], passed[passing]] = False
+            self.sizes[turn.games[pass_rows], turn.defender[pass_rows]] -= 1
+            turn.add(pass_rows, passed[passing], ranked=True)
+            turn.attack_count[pass_rows] += 1
+            turn.attacker[pass_rows], turn.defender[pass_rows] = turn.defender[pass_rows], turn.attacker[pass_rows].copy()
+            self._defend(turn, rows[~passing], True)
+            rows = pass_rows
+
+        # Defense phase.
+        rows = every[~turn.take]
+        while len(rows):
+            games = turn.games[rows]
+            attacker_len = self.count(games, turn.attacker[rows])
+            defender_len = self.count(games, turn.defender[rows])
+            rows = rows[(turn.attack_count[rows] < 6) & (defender_len > 0) & (attacker_len > 0) & (turn.table_len[rows] < 12)]
+            if not len(rows):
+                break
+            games = turn.games[rows]
+            matches = self.hands[games, turn.attacker[rows]] & turn.ranks[rows][:, POS_RANK]
+            atk = self._decide('attack', games, turn.attacker[rows], matches)
+            turn.attack_done[rows[atk < 0]] = True
+            play_rows = rows[atk >= 0]
+            self.hands[turn.games[play_rows], turn.attacker[play_rows], atk[atk >= 0]] = False
+            self.sizes[turn.games[play_rows], turn.attacker[play_rows]] -= 1
+            turn.add(play_rows, atk[atk >= 0], ranked=False)
+            turn.attack_count[play_rows] += 1
+            self._defend(turn, play_rows, False)
+            rows = play_rows[~turn.take[play_rows]]
+
+        # Shed phase.
+        attacker_len = self.count(turn.games, turn.attacker)
+        defender_len = self.count(turn.games, turn.defender)
+        table = turn.table_mask()
+        rows = every[turn.take]
+        if len(rows):
+            games = turn.games[rows]
+            matches = self.hands[games, turn.attacker[rows]] & turn.ranks[rows][:, POS_RANK]
+            max_shed_allowed = np.minimum(6 - turn.attack_count[rows], defender_len[rows])
+            shed = self._decide('shed', games, turn.attacker[rows], matches, max_shed_allowed)
+            shed_len = shed.sum(axis=1)
+            self.hands[games, turn.attacker[rows]] &= ~shed
+            self.hands[games, turn.defender[rows]] |= table[rows] | shed
+            self.sizes[games, turn.attacker[rows]] -= shed_len
+            self.sizes[games, turn.defender[rows]] += turn.table_len[rows] + shed_len
+        # Ceased attacks go out, a turn ended by an empty hand leaves its table behind.
+        ceased = ~turn.take & (turn.attack_done | (turn.table_len == 12) | ((attacker_len > 0) & (defender_len > 0)))
+        self.out[turn.games[ceased]] |= table[ceased]
+
+        # Draw: attacker first, a player left with zero cards has won.
+        self._draw_up(turn.games, turn.attacker)
+        won = self.count(turn.games, turn.attacker) == 0
+        self.winner[turn.games[won]] = turn.attacker[won]
+        rows = every[~won]
+        self._draw_up(turn.games[rows], turn.defender[rows])
+        won = self.count(turn.games[rows], turn.defender[rows]) == 0
+        self.winner[turn.games[rows[won]]] = turn.defender[rows[won]]
+
+        self.attacker[turn.games] = np.where(turn.take, turn.attacker, turn.defender)
+        self.turns[turn.games[self.winner[turn.games] < 0]] += 1
+
+    def play(self, max_turns=200):
+        """Plays every game to the end.
+
+        Deterministic strategies can pass the same cards back and forth
+        forever with cards left in the deck, so games still running after
+        max_turns are stopped and keep a winner of -1.
+
+        Args:
+            max_turns: The maximum number of turns to play.
+
+        Returns:
+            The winning seat of each game, -1 for stopped games.
+        """
+
+        for _ in range(max_turns):
+            if (self.winner >= 0).all():
+                break
+            self.turn()
+        return self.winner
+
+
+class Turn:
+    """The state of one turn across the running games of a BatchGame.
+
+    VecEnv keeps a single Turn over all of its games for the tables in play,
+    clearing the rows of the games whose turn ends.
+
+    Attributes:
+        games: The index of each running game; row i of every array is games[i].
+        attacker: The attacking seat, updated by passes.
+        defender: The defending seat, updated by passes.
+        table: Int array (K, MAX_TABLE) of the positions on the table, in order.
+        table_len: The number of cards on each table.
+        ranks: Bool array (K, 9) of the ranks of passed and defending cards.
+        attack_count: Count of attacks and passes this turn.
+        take: Whether the defender takes.
+        attack_done: Whether the attacker ceased the attack.
+    """
+
+    def __init__(self, games, attacker):
+        """Inits Turn with empty tables.
+
+        Args:
+            games: The index of each game.
+            attacker: The attacking seat of each game.
+        """
+
+        self.games = games
+        self.attacker = attacker.copy()
+        self.defender = 1 - self.attacker
+        self.table = np.full((len(games), MAX_TABLE), -1)
+        self.table_len = np.zeros(len(games), dtype=np.int64)
+        self.ranks = np.zeros((len(games), len(RANKS)), dtype=bool)
+        self.attack_count = np.zeros(len(games), dtype=np.int64)
+        self.take = np.zeros(len(games), dtype=bool)
+        self.attack_done = np.zeros(len(games), dtype=bool)
+
+    def add(self, rows, cards, ranked=True):
+        """Puts a card on the table for each row.
+
+        Args:
+            rows: The rows of the turn.
+            cards: The position played in each row.
+            ranked: Whether the card's rank joins the ranks, which Game.turn2
+                does for passes and defenses but not attacks.
+        """
+
+        self.table[rows, self.table_len[rows]] = cards
+        self.table_len[rows] += 1
+        if ranked:
+            self.ranks[rows, POS_RANK[cards]] = True
+
+    def clear(self, rows):
+        """Empties the tables of the given rows.
+        """
+
+        self.table[rows] = -1
+        self.table_len[rows] = 0
+        self.ranks[rows] = False
+        self.attack_count[rows] = 0
+
+    def table_mask(self, rows=None):
+        """Returns the bool array (K, 36) of the cards on each table.
+
+        Args:
+            rows: Optional rows to build the mask of, every row by default.
+        """
+
+        table = self.table if rows is None else self.table[rows]
+        # Empty slots hold -1, which lands in the spare last column.
+        mask = np.zeros((len(table), NUM_CARDS + 1), dtype=bool)
+        mask[np.arange(len(table))[:, None], table] = True
+        return mask[:, :NUM_CARDS]
+
+
+def main():
+    """Runs the same StratAI vs S0 (shed, play) sweep as game.main in one batch.
+    """
+
+    num_games = 100
+    grid = [(shed / 10, play / 10) for shed in range(10) for play in range(10)]
+    shed_val = np.repeat([cell[0] for cell in grid], num_games)
+    play_val = np.repeat([cell[1] for cell in grid], num_games)
+    batch = BatchGame([BatchStratAI(shed_val, play_val), BatchS0()], shuffled_deals(np.random.default_rng(), len(shed_val)))
+    winners = batch.play().reshape(len(grid), num_games)
+    turns = batch.turns.reshape(len(grid), num_games)
+
+    max_score = (0, 0)
+    for cell, (shed, play) in enumerate(grid):
+        ai_wins = int((winners[cell] == 0).sum())
+        s0_wins = int((winners[cell] == 1).sum())
+        print('Finished ' + str(num_games) + ' averaging ' + str(turns[cell].mean()) + ' turns')
+        print('shed: ' + str(shed) + ' play: ' + str(play) + ' ai_wins: ' + str(ai_wins) + ' s0 wins: ' + str(s0_wins))
+        test = float(ai_wins) / s0_wins if s0_wins else float('inf')
+        if test > max_score[0]:
+            max_score = (test, (shed, play))
+    print(max_score)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+"""Benchmarks the game engines, the environment, the strategies and NEAT.
+
+Every benchmark returns named measurements, which are printed and emitted as
+JSON together with the environment they were measured on. Given a baseline
+JSON file from an earlier run, the measurements are compared against it and
+the exit status is 1 if any got worse by more than the threshold.
+
+    Usage:
+
+    python bench.py
+    python bench.py --output=FILE --only game env --games=200 --seed=N
+    python bench.py --baseline=FILE --threshold=0.1
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+# pylint: disable=import-error
+import numpy as np
+
+from deck import DealStream
+from durak_env import DurakEnv
+from game import Game
+from strategy import S0, S1, S2, Strategy, StratAI, StratRandom
+from vec_env import VecEnv
+
+# Strategy name to a factory of the Game strategy.
+STRATEGIES = {
+    'ai': lambda: StratAI(.5, .5),
+    's0': S0,
+    's1': S1,
+    's2': S2,
+    'random': StratRandom,
+}
+MAX_TURNS = 200
+CONFIG = os.path.normpath(os.path.join(os.path.dirname(__file__), '../config/.NEAT'))
+
+
+class Measurement(namedtuple('Measurement', ['value', 'unit', 'higher_is_better'])):
+    """A single benchmark measurement.
+
+    Attributes:
+        value: The measured value.
+        unit: The unit of the value.
+        higher_is_better: Whether a larger value is an improvement.
+    """
+
+    __slots__ = ()
+
+
+def rate(value, unit):
+    """Returns a Measurement where higher is better.
+    """
+
+    return Measurement(value, unit, True)
+
+
+def cost(value, unit):
+    """Returns a Measurement where lower is better.
+    """
+
+    return Measurement(value, unit, False)
+
+
+class Timed(Strategy):
+    """Strategy class that times the decisions of another strategy.
+
+    Attributes:
+        strategy: The timed strategy.
+        seconds: The cumulative seconds per decision method.
+        calls: The call count per decision method.
+    """
+
+    def __init__(self, strategy):
+        super().__init__()
+        self.strategy = strategy
+        self.seconds = {'attack': 0., 'defend': 0., 'shed': 0.}
+        self.calls = {'attack': 0, 'defend': 0, 'shed': 0}
+
+    def _time(self, method, start):
+        """Adds the time since start to a method.
+        """
+
+        self.seconds[method] += time.perf_counter() - start
+        self.calls[method] += 1
+
+    def watch(self, game, num):
+        self.strategy.watch(game, num)
+
+    def attack(self, hand, table, dank, ranks):
+        start = time.perf_counter()
+        ret = self.strategy.attack(hand, table, dank, ranks)
+        self._time('attack', start)
+        return ret
+
+    def defend(self, hand, table, dank, pass_is_legal, cards_to_defend):
+        start = time.perf_counter()
+        ret = self.strategy.defend(hand, table, dank, pass_is_legal, cards_to_defend)
+        self._time('defend', start)
+        return ret
+
+    def shed(self, hand, table, dank, max_shed_allowed, ranks):
+        start = time.perf_counter()
+        ret = self.strategy.shed(hand, table, dank, max_shed_allowed, ranks)
+        self._time('shed', start)
+        return ret
+
+
+def environment():
+    """Returns a dict describing the machine and software measured on.
+    """
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    try:
+        import neat  # pylint: disable=import-outside-toplevel
+        neat_version = getattr(neat, '__version__', 'unknown')
+    except ImportError:
+        neat_version = None
+
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'neat': neat_version,
+    }
+
+
+def bench_game(num_games, seed):
+    """Measures Game.play games per second for every strategy pairing.
+
+    Every pairing plays the same deals, stopping games at MAX_TURNS.
+    """
+
+    deals = DealStream(seed, num_games).block(0)
+    ret = {}
+    for first, second in itertools.combinations_with_replacement(STRATEGIES, 2):
+        random.seed(seed)
+        strategies = [STRATEGIES[first](), STRATEGIES[second]()]
+        start = time.perf_counter()
+        for deal in deals:
+            Game(strategies, False, deal).play(MAX_TURNS)
+        ret['game.play.' + first + ':' + second] = rate(num_games / (time.perf_counter() - start), 'games/s')
+    return ret
+
+
+def random_legal_action(env, rng):
+    """Returns an action choosing a random legal move of the environment.
+    """
+
+    action = rng.random(38)
+    action[np.array(env.gen_legal_moves()) == 0] = 0.
+    return list(action)
+
+
+def bench_env(num_games, seed):
+    """Measures DurakEnv.reset cost, DurakEnv.step steps per second and
+    DurakEnv.run_episode games per second.
+
+    The model plays random legal moves, so every step is timed on states a
+    game actually reaches.
+    """
+
+    random.seed(seed)
+    env = DurakEnv()
+    env.seed(seed)
+    rng = np.random.default_rng(seed)
+    resets = 0.
+    steps = 0
+    stepping = 0.
+    for _ in range(num_games):
+        start = time.perf_counter()
+        env.reset()
+        resets += time.perf_counter() - start
+        action = list(rng.random(38))
+        start = time.perf_counter()
+        _, _, done, _ = env.step(action)
+        stepping += time.perf_counter() - start
+        steps += 1
+        while not done:
+            action = random_legal_action(env, rng)
+            start = time.perf_counter()
+            _, _, done, _ = env.step(action)
+            stepping += time.perf_counter() - start
+            steps += 1
+
+    start = time.perf_counter()
+    for _ in range(num_games):
+        env.reset()
+        env.run_episode(lambda observation: rng.random(38))
+    episodes = num_games / (time.perf_counter() - start)
+
+    return {
+        'env.reset': cost(resets / num_games * 1e6, 'us'),
+        'env.step': rate(steps / stepping, 'steps/s'),
+        'env.run_episode': rate(episodes, 'games/s'),
+    }
+
+
+def bench_env_micro(num_games, seed):
+    """Measures gen_obs and gen_legal_moves on mid game states.
+
+    gen_obs only updates the cards that moved since its last call, so it is
+    timed once per move over whole games of random legal moves. Takes states
+    from the first steps of seeded games, then calls gen_legal_moves
+    repeatedly on every state.
+    """
+
+    random.seed(seed)
+    env = DurakEnv()
+    env.seed(seed)
+    rng = np.random.default_rng(seed)
+    observing = 0.
+    moves = 0
+    for _ in range(min(num_games, 50)):
+        env.reset()
+        condition = env.begin(list(rng.random(38)))
+        while not env.settle(condition):
+            start = time.perf_counter()
+            env.gen_obs(condition)
+            observing += time.perf_counter() - start
+            moves += 1
+            condition = env.apply_action(env.best_legal(rng.random(38)))
+
+    states = []
+    for _ in range(min(num_games, 50)):
+        env.reset()
+        _, _, done, _ = env.step(list(rng.random(38)))
+        for _ in range(4):
+            if done:
+                break
+            states.append(env.snapshot())
+            _, _, done, _ = env.step(random_legal_action(env, rng))
+
+    repeat = 200
+    elapsed = 0.
+    for state in states:
+        env.restore(state)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            env.gen_legal_moves()
+        elapsed += time.perf_counter() - start
+    return {
+        'env.gen_obs': cost(observing / moves * 1e6, 'us'),
+        'env.gen_legal_moves': cost(elapsed / (repeat * len(states)) * 1e6, 'us'),
+    }
+
+
+def bench_vec_env(num_games, seed):
+    """Measures VecEnv.step game steps per second with 256 games.
+
+    Steps random actions, which VecEnv filters to legal moves, until
+    num_games games have finished.
+    """
+
+    vec_env = VecEnv(256, seed)
+    rng = np.random.default_rng(seed)
+    vec_env.reset()
+    steps = 0
+    start = time.perf_counter()
+    while vec_env.episodes < num_games:
+        vec_env.step(rng.random((vec_env.num_envs, 38)))
+        steps += vec_env.num_envs
+    return {'vec_env.step': rate(steps / (time.perf_counter() - start), 'steps/s')}
+
+
+def bench_strategies(num_games, seed):
+    """Measures the mean decision latency of every strategy against S0.
+    """
+
+    deals = DealStream(seed, num_games).block(0)
+    ret = {}
+    for name, factory in STRATEGIES.items():
+        random.seed(seed)
+        timed = Timed(factory())
+        for deal in deals:
+            Game([timed, S0()], False, deal).play(MAX_TURNS)
+        for method, seconds in timed.seconds.items():
+            if timed.calls[method]:
+                ret['strategy.' + name + '.' + method] = cost(seconds / timed.calls[method] * 1e6, 'us')
+    return ret
+
+
+def bench_neat(num_games, seed):
+    """Measures the wall time of evaluating one NEAT generation.
+
+    The initial population is created with a fixed seed and every genome is
+    evaluated serially with neat_run.eval_genomes on the seeded deal stream,
+    so the work is the same on every run. Reproduction is left out, its cost
+    is negligible next to evaluation.
+    """
+
+    # pylint: disable=import-outside-toplevel
+    import neat
+    from neat_run import eval_genomes
+
+    random.seed(seed)
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                         CONFIG)
+    population = neat.Population(config)
+    start = time.perf_counter()
+    for genome in population.population.values():
+        genome.fitness = eval_genomes(genome, config, seed)
+    return {'neat.generation': cost(time.perf_counter() - start, 's')}
+
+
+# Benchmark name to function of (num_games, seed).
+BENCHMARKS = {
+    'game': bench_game,
+    'env': bench_env,
+    'env_micro': bench_env_micro,
+    'vec_env': bench_vec_env,
+    'strategy': bench_strategies,
+    'neat': bench_neat,
+}
+
+
+def run(names, num_games, seed):
+    """Runs benchmarks.
+
+    Args:
+        names: The BENCHMARKS to run.
+        num_games: The number of games per measurement.
+        seed: The seed of every deal stream and random generator.
+
+    Returns:
+        A dict of the environment, the parameters and the measurements.
+    """
+
+    results = {}
+    for name in names:
+        for key, measurement in BENCHMARKS[name](num_games, seed).items():
+            results[key] = measurement._asdict()
+            print('{:40} {:14.3f} {}'.format(key, measurement.value, measurement.unit))
+
+    return {
+        'environment': environment(),
+        'parameters': {'games': num_games, 'seed': seed, 'benchmarks': list(names)},
+        'results': results,
+    }
+
+
+def compare(report, baseline, threshold):
+    """Compares a report against a baseline report.
+
+    Args:
+        report: The dict returned by run.
+        baseline: A dict returned by an earlier run.
+        threshold: The fraction a measurement may get worse by.
+
+    Returns:
+        The names of the measurements that regressed past the threshold.
+    """
+
+    regressions = []
+    for key, result in report['results'].items():
+        if key not in baseline['results']:
+            continue
+        base = baseline['results'][key]['value']
+        value = result['value']
+        if not base:
+            continue
+        change = (value - base) / base
+        worse = -change if result['higher_is_better'] else change
+        flag = ''
+        if worse > threshold:
+            regressions.append(key)
+            flag = ' REGRESSION'
+        print('{:40} {:14.3f} -> {:14.3f} {:+7.1%}{}'.format(key, base, value, change, flag))
+    return regressions
+
+
+def main(names, num_games, seed, output, baseline, threshold):
+    """The main function for the bench module.
+
+    Args:
+        names: The BENCHMARKS to run.
+        num_games: The number of games per measurement.
+        seed: The seed of every deal stream and random generator.
+        output: The file to write the JSON report to, or None for stdout.
+        baseline: A JSON report to compare against, or None.
+        threshold: The fraction a measurement may get worse by.
+
+    Returns:
+        The exit status, 1 if anything regressed past the threshold.
+    """
+
+    report = run(names, num_games, seed)
+    if output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(output, 'w') as stream:
+            json.dump(report, stream, indent=2)
+
+    if baseline is None:
+        return 0
+    with open(baseline) as stream:
+        regressions = compare(report, json.load(stream), threshold)
+    if regressions:
+        print('Regressed past ' + str(threshold) + ': ' + ', '.join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description="Benchmark the Durak engines, environment, strategies and NEAT.")
+    PARSER.add_argument('--only', type=str, nargs='+', default=list(BENCHMARKS), choices=list(BENCHMARKS),
+                        required=False)
+    PARSER.add_argument('--games', type=int, default=200, required=False)
+    PARSER.add_argument('--seed', type=int, default=0, required=False)
+    PARSER.add_argument('--output', type=str, default=None, required=False)
+    PARSER.add_argument('--baseline', type=str, default=None, required=False)
+    PARSER.add_argument('--threshold', type=float, default=.1, required=False)
+    ARGS = PARSER.parse_args()
+
+    sys.exit(main(ARGS.only, ARGS.games, ARGS.seed, ARGS.output, ARGS.baseline, ARGS.threshold))
@@ -0,0 +1,158 @@
+"""A module used to represent sets of cards as bitboards.
+
+A bitboard is a 36-bit integer where bit i is set when CARDS[i] is in the set,
+so membership, rank matching and removal are single bit operations. Hands,
+the table, the out pile and the deck remainder all keep a bitboard alongside
+their card lists.
+"""
+
+from card import CARDS, RANKS, SUITS
+
+FULL_MASK = (1 << len(CARDS)) - 1
+RANK_MASKS = [sum(card.bit for card in CARDS if card.rank_num == rank_num) for rank_num in range(len(RANKS))]
+RANK_MASKS_BY_NAME = {rank: RANK_MASKS[rank_num] for rank_num, rank in enumerate(RANKS)}
+SUIT_MASKS = {suit: sum(card.bit for card in CARDS if card.suit == suit) for suit in SUITS}
+# Cards of a strictly higher rank than the index, in any suit.
+HIGHER_MASKS = [sum(RANK_MASKS[rank_num + 1:]) for rank_num in range(len(RANKS))]
+
+
+def to_mask(cards):
+    """Builds a bitboard from cards.
+
+    Args:
+        cards: An iterable of cards.
+
+    Returns:
+        The bitboard of the cards.
+    """
+
+    mask = 0
+    for card in cards:
+        mask |= card.bit
+    return mask
+
+
+def from_mask(mask):
+    """Lists the cards in a bitboard.
+
+    Args:
+        mask: The bitboard.
+
+    Returns:
+        The list of cards in the bitboard, ordered by id.
+    """
+
+    cards = []
+    while mask:
+        low = mask & -mask
+        cards.append(CARDS[low.bit_length() - 1])
+        mask ^= low
+    return cards
+
+
+def ids(mask):
+    """Lists the card ids in a bitboard.
+
+    Args:
+        mask: The bitboard.
+
+    Returns:
+        The list of set bit indices, in increasing order.
+    """
+
+    ret = []
+    while mask:
+        low = mask & -mask
+        ret.append(low.bit_length() - 1)
+        mask ^= low
+    return ret
+
+
+def count(mask):
+    """Counts the cards in a bitboard.
+
+    Args:
+        mask: The bitboard.
+
+    Returns:
+        The number of set bits.
+    """
+
+    return bin(mask).count('1')
+
+
+def lowest(mask):
+    """Returns the lowest id card in a bitboard.
+
+    Args:
+        mask: The bitboard.
+
+    Returns:
+        The card with the lowest id or None if the bitboard is empty.
+    """
+
+    if not mask:
+        return None
+    return CARDS[(mask & -mask).bit_length() - 1]
+
+
+def rank_mask(ranks):
+    """Builds the bitboard of all cards matching a collection of ranks.
+
+    Args:
+        ranks: An iterable of rank strings, such as the ranks dict of a turn.
+
+    Returns:
+        The bitboard of every card with one of the ranks.
+    """
+
+    mask = 0
+    for rank in ranks:
+        mask |= RANK_MASKS_BY_NAME[rank]
+    return mask
+
+
+def beats_mask(attack, dank):
+    """Builds the bitboard of all cards that beat an attack card.
+
+    Args:
+        attack: The card being defended against.
+        dank: The suit of the dank card.
+
+    Returns:
+        Higher cards of the same suit, plus every dank if the attack is not a dank.
+    """
+
+    mask = HIGHER_MASKS[attack.rank_num] & SUIT_MASKS[attack.suit]
+    if attack.suit != dank:
+        mask |= SUIT_MASKS[dank]
+    return mask
+
+
+# BEATS[dank][attack.id] is the bitboard of every card that beats the attack.
+# Its non dank cards all share the attack's suit and sort below its danks, and
+# within a suit id order is rank order, so the lowest defense by
+# CARD_COMPARATORS value is the lowest bit of the non dank part, else of the rest.
+BEATS = {dank: [beats_mask(card, dank) for card in CARDS] for dank in SUITS}
+NON_DANK_MASKS = {dank: FULL_MASK & ~SUIT_MASKS[dank] for dank in SUITS}
+
+
+def lowest_beating(hand_mask, attack, dank):
+    """Returns the lowest valued card in a hand that beats an attack card.
+
+    Args:
+        hand_mask: Bitboard of the hand.
+        attack: The card being defended against.
+        dank: The suit of the dank card.
+
+    Returns:
+        The lowest card by CARD_COMPARATORS value that can defend or None.
+    """
+
+    options = hand_mask & BEATS[dank][attack.id]
+    if not options:
+        return None
+    plain = options & NON_DANK_MASKS[dank]
+    if plain:
+        options = plain
+    return CARDS[(options & -options).bit_length() - 1]
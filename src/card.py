@@ -2,9 +2,12 @@
 
 Represents a playing card from a Durak deck, which is a standard deck but with
 the cards 2-5 removed.
+
+Every one of the 36 cards is interned: constructing a Card returns the single
+shared instance for that rank and suit, so cards compare and hash by identity
+and carry precomputed integer indices for table lookups.
 """
 
-import functools
 import itertools
 
 
@@ -14,42 +17,58 @@ class Card:
     Attributes:
         rank: The value of a card, 6-A.
         suit: The suit of the card: Diamonds, Spades, Clubs, or Hearts.
+        rank_num: The index of the rank in RANKS, 0-8.
+        suit_num: The index of the suit in SUITS, 0-3.
+        id: The index of the card in CARDS, 0-35.
+        bit: The card's bit in a bitboard, 1 << id.
     """
 
-    def __init__(self, rank, suit):
-        """Inits the Card with a rank and a suit.
+    __slots__ = ('rank', 'suit', 'rank_num', 'suit_num', 'id', 'bit')
+
+    def __new__(cls, rank, suit):
+        """Returns the interned Card with a rank and a suit.
 
         Args:
             rank: The rank of the card.
             suit: The suit of the card.
         """
 
-        if rank not in RANKS:
+        if rank not in RANK_NUM:
             raise TypeError("Invalid rank {} for initialized card!".format(rank))
-        if suit not in SUITS:
+        if suit not in SUIT_NUM:
             raise TypeError("Invalid suit {} for initialized card!".format(suit))
 
-        self.rank = rank
-        self.suit = suit
+        card = _INTERNED.get((rank, suit))
+        if card is None:
+            card = super().__new__(cls)
+            card.rank = rank
+            card.suit = suit
+            card.rank_num = RANK_NUM[rank]
+            card.suit_num = SUIT_NUM[suit]
+            card.id = card.rank_num * len(SUITS) + card.suit_num
+            card.bit = 1 << card.id
+            _INTERNED[(rank, suit)] = card
+        return card
+
+    def __reduce__(self):
+        # Unpickled cards are re-interned rather than copied.
+        return Card, (self.rank, self.suit)
 
     def __str__(self):
         return str(self.rank) + ' of ' + str(self.suit)
 
-    def __eq__(self, o):
-        if not isinstance(0, Card):
-            return False
-        return self.rank == o.rank and self.suit == o.suit
-
-    def __hash__(self):
-        return hash(self.suit + self.rank)
-
 
 # Constants representing possible cards and attributes of cards.
 RANKS = list(reversed(['A', 'K', 'Q', 'J', '10', '9', '8', '7', '6']))
 SUITS = ['Diamonds', 'Spades', 'Clubs', 'Hearts']
-CARDS = [Card(rank, suit) for rank, suit in itertools.product(RANKS, SUITS)]
 RANK_NUM = {rank: index for index, rank in enumerate(RANKS)}
-CARD_COMPARATORS = {}
+SUIT_NUM = {suit: index for index, suit in enumerate(SUITS)}
+_INTERNED = {}
+CARDS = [Card(rank, suit) for rank, suit in itertools.product(RANKS, SUITS)]
+
+# Integer sort key of each card relative to each dank suit: rank, plus 9 for danks.
+SORT_KEYS = {dank: {card: card.rank_num + (len(RANKS) if card.suit == dank else 0) for card in CARDS} for dank in SUITS}
+CARD_COMPARATORS = {dank: SORT_KEYS[dank].__getitem__ for dank in SUITS}
 
 
 def dank_float_order(card, dank_suit):
@@ -62,7 +81,7 @@ def dank_float_order(card, dank_suit):
     Returns:
         The value.
     """
-    val = RANK_NUM[card.rank]
+    val = card.rank_num
     val += (9 if card.suit == dank_suit else 0)
     val = float(val) / (len(RANKS) + 8)
     return val
@@ -92,10 +111,10 @@ def create_comparator(dank_suit):
         """
 
         if (card1.suit == dank_suit and card2.suit == dank_suit) or (dank_suit not in (card1.suit, card2.suit)):
-            if RANK_NUM[card1.rank] > RANK_NUM[card2.rank]:
+            if card1.rank_num > card2.rank_num:
                 return 1
 
-            if RANK_NUM[card1.rank] < RANK_NUM[card2.rank]:
+            if card1.rank_num < card2.rank_num:
                 return -1
 
             return 0
@@ -106,10 +125,6 @@ def create_comparator(dank_suit):
     return compare
 
 
-for dank in SUITS:
-    CARD_COMPARATORS[dank] = functools.cmp_to_key(create_comparator(dank))
-
-
 def suited(card, suit):
     """Tells if the card matches the suit.
 
@@ -2,10 +2,18 @@
 
 Represents a deck of cards for a game of Durak, which contains 36 cards, from
 6 to Ace in the four standard suits, Diamonds, Spades, and Clubs.
+
+Also contains the DealStream class, which generates reproducible shuffled
+deals in batches from a seeded numpy generator, and mirror_deal, which swaps
+the hands of a two player deal for duplicate evaluation.
 """
 
 from random import shuffle
 
+# pylint: disable=import-error
+import numpy as np
+
+from bitboard import FULL_MASK
 from card import CARDS
 
 
@@ -14,13 +22,19 @@ class Deck:
 
     Attributes:
         cards: The list of cards in the deck.
+        mask: Bitboard of the cards remaining in the deck.
     """
 
-    def __init__(self):
+    def __init__(self, order=None):
         """Inits Deck.
+
+        Args:
+            order: Optional card ids from bottom to top, such as a row of a
+                DealStream. Defaults to the unshuffled order of CARDS.
         """
 
-        self.cards = CARDS.copy()
+        self.cards = CARDS.copy() if order is None else [CARDS[i] for i in order]
+        self.mask = FULL_MASK
 
     def __len__(self):
         return len(self.cards)
@@ -37,7 +51,9 @@ class Deck:
 
         if not self.is_empty():
             # Takes the -1th card by default.
-            return self.cards.pop()
+            card = self.cards.pop()
+            self.mask &= ~card.bit
+            return card
         return None
 
     def flip(self):
@@ -64,3 +80,111 @@ class Deck:
         """ Randomizes the order of the deck.
         """
         shuffle(self.cards)
+
+
+def shuffled_deals(rng, num_deals):
+    """Shuffles many decks at once.
+
+    Args:
+        rng: The numpy Generator to shuffle with.
+        num_deals: The number of decks.
+
+    Returns:
+        An int array of shape (num_deals, 36), each row a permutation of card
+        ids from the bottom of the deck to the top.
+    """
+
+    return rng.permuted(np.tile(np.arange(len(CARDS)), (num_deals, 1)), axis=1)
+
+
+def mirror_deal(deal):
+    """Swaps the hands of a two player deal.
+
+    Both Game and DurakEnv deal the top 12 cards alternately, one card at a
+    time, so swapping each pair of them swaps the two hands. The rest of the
+    deck and the dank are unchanged. Playing a deal and its mirror with the
+    seats swapped cancels out most of the luck of the deal.
+
+    Args:
+        deal: Card ids from the bottom of the deck to the top.
+
+    Returns:
+        A new int array of the mirrored deal.
+    """
+
+    mirrored = np.array(deal)
+    top = mirrored[len(CARDS) - 12:]
+    top[0::2], top[1::2] = top[1::2].copy(), top[0::2].copy()
+    return mirrored
+
+
+class DealStream:
+    """A reproducible stream of shuffled deals.
+
+    Deals are generated block_size at a time as an integer permutation matrix
+    of card ids. Block b of a worker comes from its own generator, seeded by
+    the seed and (worker, b), so any deal index can be regenerated on its own
+    and workers never share a stream.
+
+    Attributes:
+        seed: The root seed of the stream.
+        block_size: The number of deals generated at once.
+        worker: The index of the child stream.
+    """
+
+    def __init__(self, seed, block_size=256, worker=0):
+        """Inits DealStream.
+
+        Args:
+            seed: The root seed of the stream.
+            block_size: The number of deals generated at once.
+            worker: The index of the child stream.
+        """
+
+        self.seed = seed
+        self.block_size = block_size
+        self.worker = worker
+        self._block_index = None
+        self._block = None
+
+    def block(self, block_index):
+        """Generates a block of deals.
+
+        Args:
+            block_index: The index of the block in the stream.
+
+        Returns:
+            An int array of shape (block_size, 36), each row a permutation of
+            card ids from the bottom of the deck to the top.
+        """
+
+        sequence = np.random.SeedSequence(self.seed, spawn_key=(self.worker, block_index))
+        return shuffled_deals(np.random.default_rng(sequence), self.block_size)
+
+    def deal(self, index):
+        """Returns a single deal of the stream.
+
+        Args:
+            index: The index of the deal in the stream.
+
+        Returns:
+            A permutation of card ids from the bottom of the deck to the top.
+        """
+
+        block_index, row = divmod(index, self.block_size)
+        if block_index != self._block_index:
+            self._block = self.block(block_index)
+            self._block_index = block_index
+        return self._block[row]
+
+    def spawn(self, num_workers):
+        """Creates independent child streams for parallel workers.
+
+        Args:
+            num_workers: The number of child streams.
+
+        Returns:
+            A list of DealStreams sharing this seed, one per worker index.
+        """
+
+        return [DealStream(self.seed, self.block_size, worker) for worker in range(num_workers)]
@@ -12,9 +12,9 @@ import gym
 import numpy as np
 from gym import spaces
 
+from batch_game import BatchGame, BatchS0, BatchStratAI
 from card import CARDS
-from game import Game
-from strategy import S0, S1, S2, StratAI
+from deck import shuffled_deals
 
 # logging.basicConfig(level=logging.INFO)
 
@@ -23,16 +23,8 @@ PRODUCTS = ['a', 'd', 's']
 SUMS = ['done', 'take']
 TOTAL_OPTIONS = len(CARDS) + len(['done', 'take'])
 
-OPTIONS_DICT = {}
-TOTAL = 0
-for c in CARDS:
-    OPTIONS_DICT[TOTAL] = c
-    TOTAL += 1
-
-OPTIONS_DICT[TOTAL] = 'done'
-TOTAL += 1
-OPTIONS_DICT[TOTAL] = 'take'
-CARD_TO_OBS = {card: i for i, card in enumerate(CARDS)}
+# Action index to option; card options share their index with Card.id.
+OPTIONS_DICT = CARDS + ['done', 'take']
 logging.debug("%s", OPTIONS_DICT)
 logging.debug("%s", len(OPTIONS_DICT))
 logging.debug("%s", OPTIONS_DICT[35])
@@ -112,7 +104,6 @@ class DurakEnvDummy(gym.Env):
         """The main function for the game.
         """
 
-        turns = []
         s0_wins = 1
         s1_wins = 0
         s2_wins = 0
@@ -121,22 +112,13 @@ class DurakEnvDummy(gym.Env):
         action_list = list(action)
         if action_list[0] < 0 or action_list[0] > 1 or action_list[1] < 0 or action_list[1] > 1:
             return [1], 0, True, None
-        for _ in range(num_games):
-
-            game = Game([StratAI(action_list[0], action_list[1]), S0()], False)
-            game_instance = game.play()
-
-            turns.append(float(game.turns))
-            if isinstance(game_instance.strategy, S0):
-                s0_wins += 1
-            elif isinstance(game_instance.strategy, S1):
-                s1_wins += 1
-            elif isinstance(game_instance.strategy, S2):
-                s2_wins += 1
-            elif isinstance(game_instance.strategy, StratAI):
-                ai_wins += 1
-
-        print('Finished ' + str(num_games) + ' averaging ' + str(sum(turns) / len(turns)) + ' turns')
+        batch = BatchGame([BatchStratAI(action_list[0], action_list[1]), BatchS0()], shuffled_deals(np.random.default_rng(), num_games))
+        winners = batch.play()
+        turns = batch.turns.astype(float)
+        s0_wins += int((winners == 1).sum())
+        ai_wins += int((winners == 0).sum())
+
+        print('Finished ' + str(num_games) + ' averaging ' + str(turns.mean()) + ' turns')
         print('s0 wins: ' + str(s0_wins))
         print('s1 wins: ' + str(s1_wins))
         print('s2 wins: ' + str(s2_wins))
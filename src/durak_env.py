@@ -7,15 +7,19 @@ train a machine learning model to play it.
 
 import logging
 import random
+from collections import namedtuple
 
 # pylint: disable=import-error
 import gym
 import numpy as np
 from gym import spaces
 
-from card import Card, CARDS, RANK_NUM
-from deck import Deck
+from bitboard import BEATS, RANK_MASKS, count, from_mask, ids, to_mask
+from card import Card, CARD_COMPARATORS, CARDS
+from deck import DealStream, Deck, mirror_deal
+from knowledge import Tracker
 from player import Player
+from record import ENV
 from strategy import Attack, Defense, S0, S1, S2, StratRandom
 
 # logging.basicConfig(level=logging.INFO)
@@ -25,16 +29,8 @@ PRODUCTS = ['a', 'd', 's']
 SUMS = ['done', 'take']
 TOTAL_OPTIONS = len(CARDS) + len(['done', 'take'])
 
-OPTIONS_DICT = {}
-TOTAL = 0
-for c in CARDS:
-    OPTIONS_DICT[TOTAL] = c
-    TOTAL += 1
-
-OPTIONS_DICT[TOTAL] = 'done'
-TOTAL += 1
-OPTIONS_DICT[TOTAL] = 'take'
-CARD_TO_OBS = {card: i for i, card in enumerate(CARDS)}
+# Action index to option; card options share their index with Card.id.
+OPTIONS_DICT = CARDS + ['done', 'take']
 
 logging.debug("%s", OPTIONS_DICT)
 logging.debug("%s", len(OPTIONS_DICT))
@@ -48,12 +44,27 @@ WIN = 'W'
 LOSE = 'L'
 CONTINUE = 'C'
 
+# Seats of the knowledge Tracker.
+MODEL = 0
+OPPONENT = 1
+
+# Observation size, and the index of its 3 state values.
+OBS_SIZE = 219
+OBS_STATE = 6 * 36
+# The reward of a won game, every other step is worth 0.
+WIN_REWARD = 10
+
+# The observation of a finished game.
+NO_OBS = np.zeros(OBS_SIZE)
+NO_OBS.flags.writeable = False
+
 
 class Model:
     """Model is a wrapper for the AI hand.
 
         Attributes:
             hand: The cards in the model's hand.
+            hand_mask: Bitboard of the cards in the model's hand.
     """
 
     def __init__(self):
@@ -61,6 +72,7 @@ class Model:
         """
 
         self.hand = []
+        self.hand_mask = 0
 
     def __len__(self):
         return len(self.hand)
@@ -74,6 +86,7 @@ class Model:
 
         if card is not None:
             self.hand.append(card)
+            self.hand_mask |= card.bit
 
     def take_table(self, cards):
         """Adds cards to the model's hand.
@@ -83,6 +96,7 @@ class Model:
         """
 
         self.hand += cards
+        self.hand_mask |= to_mask(cards)
 
     def remove_card(self, card):
         """Removes a card from the model's hand.
@@ -92,6 +106,46 @@ class Model:
         """
 
         self.hand.remove(card)
+        self.hand_mask &= ~card.bit
+
+
+class EnvState(namedtuple('EnvState', [
+        'game_started', 'model_hand', 'model_mask', 'opponent_strategy', 'opponent_hand', 'opponent_mask', 'deck',
+        'deck_mask', 'out_pile', 'table', 'ranks', 'rank_mask', 'attack_count', 'state', 'dank', 'table_card',
+        'first_shed', 'shed_so_far', 'allowed_to_shed', 'turns', 'counters', 'knowledge'])):
+    """An immutable snapshot of a DurakEnv between steps.
+
+    Cards and strategies are shared with the environment, only the tuples
+    holding them are new, so a snapshot costs a few small copies.
+
+    Attributes:
+        game_started: Whether or not the game has been started.
+        model_hand: The cards in the model's hand.
+        model_mask: Bitboard of the model's hand.
+        opponent_strategy: The strategy of the opponent.
+        opponent_hand: The cards in the opponent's hand.
+        opponent_mask: Bitboard of the opponent's hand.
+        deck: The cards of the deck from bottom to top.
+        deck_mask: Bitboard of the deck.
+        out_pile: The cards that are out of the game.
+        table: The cards on the current attack/defense.
+        ranks: The ranks of cards in table, in the order they were added.
+        rank_mask: Bitboard of every card matching a rank in ranks.
+        attack_count: Count of attacks this turn.
+        state: The phase of the game DFA, 'a', 'd' or 's'.
+        dank: The dank suit.
+        table_card: Card at the bottom of the deck.
+        first_shed: True if first shed of the turn, false otherwise.
+        shed_so_far: Number of cards shed so far.
+        allowed_to_shed: Total number of cards the Model could shed.
+        turns: The number of turns taken so far.
+        counters: The legal moves, successful attacks, successful defenses
+            and takes of the model.
+        knowledge: A copy of the environment's Tracker, or None before the
+            game has started.
+    """
+
+    __slots__ = ()
 
 
 class DurakEnv(gym.Env):
@@ -112,6 +166,7 @@ class DurakEnv(gym.Env):
         turns: The number of turns taken so far.
         table: The cards on the current attack/defense.
         ranks: Hash table of ranks of cards in table.
+        rank_mask: Bitboard of every card matching a rank in ranks.
         attack_count: Count of attacks this turn.
         state: String representing the state of the game DFA.
         dank: String representing the dank suit.
@@ -119,15 +174,30 @@ class DurakEnv(gym.Env):
         strategies: The list of strategies that may be randomly chosen.
         opponent: Bot that plays against the Model.
         print_trace: Whether or not to print trace of the game.
-        first_shed: True if first shed of the turn, false otherwise.
+        first_shed: True outside of a shed, when the shed counters are unset.
         shed_so_far: Number of cards shed so far.
         allowed_to_shed: Total number of cards the Model could shed.
+        legal: Bool array of 38, the legal moves of the model, updated by
+            every step. Read it through action_mask.
+        auto_play: Whether step plays forced moves itself, returning only
+            when the model has a choice to make.
+        skipped_steps: The number of forced moves played this game.
+        macro_shed: Whether a step in a shed sheds a whole set of cards, the
+            card entries of the action above .5, rather than one card.
         model: Model object wrapper, mostly manages Model's hand.
         legal_moves: The count of legal moves the model has done.
         successful_attacks The count of successful attacks the model has done.
         successful_defenses: The count of successful defenses the model has done.
         takes: The count of takes the model has done.
         player1: Whether it is player 1's turn
+        deals: DealStream used by reset when the environment is seeded.
+        next_deal: Index of the deal the next seeded reset uses by default.
+        recorder: The record.RecordWriter fed every decision, or None.
+        duplicate: Whether seeded resets play every deal twice, the second
+            time with the hands and the first attacker swapped.
+        mirrored: Whether the current game plays the mirror of its deal.
+        knowledge: The knowledge.Tracker of what the model (seat MODEL) and
+            the opponent (seat OPPONENT) have seen, None before dealing.
     """
 
     def __init__(self):
@@ -140,7 +210,7 @@ class DurakEnv(gym.Env):
         self.action_space = self.action_space = spaces.Box(low=np.array([0] * 38), high=np.array([1] * 38))
 
         # Bit vector of valid option
-        self.observation_space = spaces.MultiDiscrete([1] * 219)
+        self.observation_space = spaces.MultiDiscrete([1] * OBS_SIZE)
 
         self.game_started = False
         self.deck = None
@@ -149,11 +219,12 @@ class DurakEnv(gym.Env):
         self.turns = 0
         self.table = []
         self.ranks = {}
+        self.rank_mask = 0
         self.attack_count = 0
         self.state = None
         self.dank = None
         self.table_card = None
-        self.strategies = [Player("Bot", S0()), Player("Bot", S1()), Player("Bot", S2()), Player("Bot", StratRandom())]
+        self.strategies = [S0(), S1(), S2(), StratRandom()]
         self.opponent = None
         self.print_trace = False
         self.first_shed = True
@@ -165,27 +236,51 @@ class DurakEnv(gym.Env):
         self.successful_defenses = 0
         self.takes = 0
         self.player1 = True
-
-    def add_attack(self, card):
+        self.deals = None
+        self.next_deal = 0
+        self.recorder = None
+        self.duplicate = False
+        self.mirrored = False
+        self.knowledge = None
+        self._obs = np.zeros(OBS_SIZE)
+        self._obs_view = self._obs.view()
+        self._obs_view.flags.writeable = False
+        self._obs_codes = None
+        self._obs_masks = None
+        self._obs_last = None
+        self.auto_play = False
+        self.skipped_steps = 0
+        self.macro_shed = False
+        self.legal = np.zeros(TOTAL_OPTIONS, dtype=bool)
+        self._legal_view = self.legal.view()
+        self._legal_view.flags.writeable = False
+        self._legal_cards = 0
+
+    def add_attack(self, card, seat):
         """Adds card to the table and updates ranks.
 
         Args:
             card: Card to be added to the table
+            seat: MODEL or OPPONENT, whoever played the card.
 
         Returns:
         """
 
         self.table.append(card)
         self.ranks[card.rank] = 0
+        self.rank_mask |= RANK_MASKS[card.rank_num]
         self.attack_count += 1
+        self.knowledge.play(seat, (card,))
 
     def clear_table(self):
         """Method to clean up variables related to the table.
         """
 
         self.out_pile += self.table
+        self.knowledge.out()
         self.table = []
         self.ranks = {}
+        self.rank_mask = 0
         self.attack_count = 0
 
     def mandatory_opponent_attack(self, info):
@@ -196,11 +291,13 @@ class DurakEnv(gym.Env):
         """
 
         atk = self.opponent.attack(self.table, self.ranks)
+        if self.recorder is not None:
+            self.recorder.attack(atk)
         if self.print_trace:
             print('Opponent starts attack with ' + str(atk[1]))
         if atk[0] != Attack.play:
             raise RuntimeError(info)
-        self.add_attack(atk[1])
+        self.add_attack(atk[1], OPPONENT)
         self.state = 'd'
         del atk
 
@@ -215,8 +312,13 @@ class DurakEnv(gym.Env):
         """
 
         if len(player) < 6:
+            seat = MODEL if player is self.model else OPPONENT
             for _ in range(6 - len(player)):
-                player.take(self.deck.draw())
+                card = self.deck.draw()
+                if card is None:
+                    break
+                player.take(card)
+                self.knowledge.draw(seat, card)
             if len(player) == 0:
                 return True
 
@@ -241,18 +343,18 @@ class DurakEnv(gym.Env):
         if move < 36:
             # Made a defense move.
             card = OPTIONS_DICT[move]
-            # Defend against attack.
-            attack = self.table[-1]
-            if card in self.model.hand:
-                if card.suit == attack.suit and RANK_NUM[card.rank] > RANK_NUM[attack.rank]:
-                    # Higher in same suit, dank or non.
-                    return True
-
-                if attack.suit != self.dank and card.suit == self.dank:
-                    # Or defense is dank suit and attack is not.
-                    return True
+            # Defend against attack: higher in same suit, or dank against a non dank.
+            return bool(self.model.hand_mask & card.bit & BEATS[self.dank][self.table[-1].id])
         return False
 
+    def shed_left(self):
+        """Returns the number of cards the model may still shed this turn.
+        """
+
+        if self.first_shed:
+            return min(6 - self.attack_count, len(self.opponent))
+        return self.allowed_to_shed - self.shed_so_far
+
     def legal_shed(self, move):
         """Determines whether a shed is a legal action or not.
 
@@ -262,27 +364,18 @@ class DurakEnv(gym.Env):
         Returns:
             Whether or not the shed is legal.
                 'Done' is always a legal shed.
-                Shed card is legal if card is in hand and rank matches table.
+                Shed card is legal if card is in hand, rank matches table
+                and the model has not shed as many cards as it may.
         """
 
-        # First shed state of the round.
-        if self.first_shed:
-            self.first_shed = False
-            self.allowed_to_shed = min(6 - self.attack_count, len(self.opponent))
-            self.shed_so_far = 0
         # Done is always legal during a shed.
         if move == 36:
-            self.first_shed = True
-            self.allowed_to_shed = -1
             return True
 
         # Shed action
         if move < 36:
             card = OPTIONS_DICT[move]
-            if card in self.model.hand and card.rank in self.ranks and self.shed_so_far < self.allowed_to_shed:
-                self.first_shed = False
-                self.shed_so_far += 1
-                return True
+            return bool(self.model.hand_mask & self.rank_mask & card.bit) and self.shed_left() > 0
 
         return False
 
@@ -303,7 +396,7 @@ class DurakEnv(gym.Env):
         # Has chosen to play a card.
         if move < 36:
             card = OPTIONS_DICT[move]
-            if card in self.model.hand and (card.rank in self.ranks or len(self.table) == 0):
+            if self.model.hand_mask & card.bit and (self.rank_mask & card.bit or len(self.table) == 0):
                 return True
         # 'done'
         elif move == 36:
@@ -316,61 +409,323 @@ class DurakEnv(gym.Env):
 
         Goes from one state of the game to the next based on the input action
         that it receives and returns relevant information.
-        detail.
+        detail. With auto_play, the forced moves that follow are played too.
 
         Args:
             action: The action to take on this step.
 
         Returns:
-            A representation of the current state of the game,
+            A representation of the current state of the game, read-only
+            and overwritten by the next step as explained in gen_obs,
             a representation ofs the fitness of this genome,
             a representation of whether or not the game is done,
             additional information that may be useful.
         """
 
         if not self.game_started:
-            self.game_started = True
-            self.deck.shuffle_deck()
-            # Deal cards.
-            for _ in range(6):
-                self.opponent.take(self.deck.draw())
-                self.model.take(self.deck.draw())
+            ret = self.start(action)
+        elif self.macro_shed and self.state == 's':
+            ret = self.play_shed(self.shed_choice(action))
+        else:
+            ret = self.play_action(self.best_legal(action))
+        if self.auto_play:
+            return self.play_forced(ret)
+        return ret
+
+    def start(self, action):
+        """Deals the cards and takes the first step of a game.
 
-            self.table_card = self.deck.flip()
-            self.dank = self.table_card.suit
-            self.opponent.dank = self.dank
+        Args:
+            action: The first action, action[0] < .5 for the model to attack
+                first. Ignored in duplicate mode, where the model attacks
+                first unless the game is mirrored.
+
+        Returns:
+            The same as step.
+        """
+
+        return self.gen_return(self.begin(action))
 
-            # AI attacks first.
-            if action[0] < .5:
-                self.state = "a"
-                logging.info('Model attacks first')
-                return self.gen_return(CONTINUE)
+    def begin(self, action):
+        """Deals the cards and plays up to the first decision of the model.
+
+        Args:
+            action: The first action, action[0] < .5 for the model to attack
+                first. Ignored in duplicate mode, where the model attacks
+                first unless the game is mirrored.
+
+        Returns:
+            CONTINUE, the game state left for gen_return or settle.
+        """
 
-            logging.info('bot attacks first')
-            # Bot attacks first.
-            self.mandatory_opponent_attack(info="Atk[0] != Attack.play, bot is not attacking at start.")
-            return self.gen_return(CONTINUE)
+        self.game_started = True
+        # The mirrored game of a duplicate deal swaps the first attacker along with the hands.
+        model_first = not self.mirrored if self.duplicate else action[0] < .5
+        if self.recorder is not None:
+            if self.deals is not None:
+                self.recorder.seed = self.deals.seed
+                self.recorder.deal_index = self.next_deal - 1
+            self.recorder.start(ENV, [card.id for card in self.deck.cards], ['Model', self.opponent.strategy],
+                                0 if model_first else 1)
+        # Deal cards.
+        for _ in range(6):
+            self.opponent.take(self.deck.draw())
+            self.model.take(self.deck.draw())
+
+        self.table_card = self.deck.flip()
+        self.dank = self.table_card.suit
+        self.opponent.dank = self.dank
+        hand_masks = [None, None]
+        hand_masks[MODEL] = self.model.hand_mask
+        hand_masks[OPPONENT] = self.opponent.hand_mask
+        self.knowledge = Tracker(hand_masks, self.table_card)
+        self.reset_obs()
+
+        # AI attacks first.
+        if model_first:
+            self.state = "a"
+            logging.info('Model attacks first')
+            return CONTINUE
+
+        logging.info('bot attacks first')
+        # Bot attacks first.
+        self.mandatory_opponent_attack(info="Atk[0] != Attack.play, bot is not attacking at start.")
+        return CONTINUE
+
+    def best_legal(self, action):
+        """Returns the legal move an action rates highest.
+
+        The rating of a move is abs(action[move] + .01), the lowest index
+        winning ties. Only the legal moves are looked at, which for a list
+        action, such as the output of a network, is faster than filtering
+        every entry with numpy.
 
-        legal_moves = self.gen_legal_moves()
+        Args:
+            action: The action, a sequence of 38 values.
+        """
+
+        best = None
+        best_value = -1.
+        legal = self.legal
+        for move in ids(self._legal_cards):
+            value = abs(action[move] + .01)
+            if value > best_value:
+                best = move
+                best_value = value
+        for move in (36, 37):
+            if legal[move] and abs(action[move] + .01) > best_value:
+                best = move
+                best_value = abs(action[move] + .01)
+        return best
+
+    def forced_action(self):
+        """Returns the only legal action, or None if there is a choice.
+        """
+
+        cards = self._legal_cards
+        flags = int(self.legal[36]) + int(self.legal[37])
+        if cards == 0 and flags == 1:
+            return 36 if self.legal[36] else 37
+        if flags == 0 and cards and cards & (cards - 1) == 0:
+            return cards.bit_length() - 1
+        return None
+
+    def play_forced(self, ret):
+        """Plays forced moves until the model has a choice or the game ends.
+
+        A forced move is the one legal action, such as done in a shed with no
+        matching card or take when nothing beats the attack. It is played as
+        step would play it for any action, so rewards and game outcomes are
+        unchanged, and counted as a legal move.
+
+        Args:
+            ret: The return of the step just taken.
+
+        Returns:
+            The return of the last step played, its info with the number of
+            forced moves played as 'skipped_steps'.
+        """
+
+        skipped = 0
+        while not ret[2]:
+            move = self.forced_action()
+            if move is None:
+                break
+            ret = self.play_action(move)
+            skipped += 1
+        self.skipped_steps += skipped
+        ret[3]['skipped_steps'] = skipped
+        return ret
+
+    def run_episode(self, policy_fn, max_steps=None, first_action=None):
+        """Plays a whole game with a policy, as a step loop would.
+
+        Starts a reset game and asks the policy for every decision of the
+        model until the game ends. The policy gets the observation as step
+        returns it, a read-only view of the buffer, and returns an action as
+        step takes it. Forced moves and sheds follow auto_play and
+        macro_shed. Between decisions only the observation buffer and the
+        legal moves are updated; no return tuple or info dict is built until
+        the game is over.
+
+        That saves little: the moves themselves and the opponent cost the
+        same either way, and over 1500 games with the same actions this is
+        only 2-7% faster than the step loop, about 10% with auto_play.
+
+        Args:
+            policy_fn: Function of an observation to an action.
+            max_steps: Optional number of decisions after which the game is
+                left unfinished.
+            first_action: The first action, as for the first step. Sampled
+                from action_space by default.
+
+        Returns:
+            The reward of the last move, whether the game is done, and the
+            info of the last move with the number of policy calls as 'steps'
+            and the number of forced moves played as 'skipped_steps'.
+
+        Raises:
+            RuntimeError: The game has already started.
+        """
+
+        if self.game_started:
+            raise RuntimeError('run_episode needs a reset environment.')
+        if first_action is None:
+            first_action = self.action_space.sample()
+        condition = self.begin(first_action)
+        steps = 0
+        while not self.settle(condition):
+            if self.auto_play:
+                move = self.forced_action()
+                if move is not None:
+                    condition = self.apply_action(move)
+                    self.skipped_steps += 1
+                    continue
+            if max_steps is not None and steps >= max_steps:
+                break
+            action = policy_fn(self.gen_obs(condition))
+            steps += 1
+            if self.macro_shed and self.state == 's':
+                condition = self.apply_shed(self.shed_choice(action))
+            else:
+                condition = self.apply_action(self.best_legal(action))
+
+        info = self.gen_info(condition)
+        info['steps'] = steps
+        info['skipped_steps'] = self.skipped_steps
+        return WIN_REWARD if condition == WIN else 0, condition in (WIN, LOSE), info
+
+    def shed_choice(self, action):
+        """Filters an action to a whole shed, for macro_shed.
+
+        Args:
+            action: The action, card entries above .5 asking to shed the card.
+
+        Returns:
+            The bitboard of the legal cards asked for, the highest rated ones
+            if more are asked for than may be shed.
+        """
+
+        values = np.asarray(action)
+        chosen = [card_id for card_id in ids(self.legal_cards()) if values[card_id] > .5]
+        chosen.sort(key=lambda card_id: -values[card_id])
+        mask = 0
+        for card_id in chosen[:self.shed_left()]:
+            mask |= 1 << card_id
+        return mask
+
+    def play_shed(self, shed_mask):
+        """Sheds a set of cards and ends the shed in a single step.
+
+        Args:
+            shed_mask: The bitboard of the cards to shed, possibly empty.
+
+        Returns:
+            The same as step.
+
+        Raises:
+            RuntimeError: The shed is illegal, as in apply_shed.
+        """
 
-        filtered = np.multiply(np.array(legal_moves), np.abs((np.array(action)) + .01))
+        return self.gen_return(self.apply_shed(shed_mask))
 
-        filtered_action = int(np.argmax(filtered))
-        assert isinstance(filtered_action, int)
+    def apply_shed(self, shed_mask):
+        """Sheds a set of cards and ends the shed, as play_shed.
+
+        Args:
+            shed_mask: The bitboard of the cards to shed, possibly empty.
+
+        Returns:
+            WIN, LOSE or CONTINUE, the game state left for gen_return or
+            settle.
+
+        Raises:
+            RuntimeError: Not in a shed, or a card is not in hand, does not
+                match the ranks, or is one more than the model may shed.
+        """
+
+        if self.state != 's':
+            raise RuntimeError('Macro shed outside of a shed.')
+        if shed_mask & ~(self.model.hand_mask & self.rank_mask) or count(shed_mask) > self.shed_left():
+            raise RuntimeError("Model made an illegal shed: " + ', '.join(str(card) for card in from_mask(shed_mask)))
+        for card in from_mask(shed_mask):
+            if self.recorder is not None:
+                self.recorder.action(card.id)
+            self.model.remove_card(card)
+            self.add_attack(card, MODEL)
+            self.shed_so_far += 1
+        # Done ends the shed as it does when shedding card by card.
+        return self.apply_action(36)
+
+    def play_action(self, filtered_action):
+        """Proceeds through a step with an action already filtered to a move.
+
+        step picks the legal move the action rates highest and plays it
+        here. Callers that filter actions themselves call this directly
+        once the game has started.
+        Legality is read from the action mask, not checked again.
+
+        Args:
+            filtered_action: The index of the move in OPTIONS_DICT.
+
+        Returns:
+            The same as step.
+        """
+
+        return self.gen_return(self.apply_action(filtered_action))
+
+    def apply_action(self, filtered_action):
+        """Plays a move filtered from an action, as play_action.
+
+        Args:
+            filtered_action: The index of the move in OPTIONS_DICT.
+
+        Returns:
+            WIN, LOSE or CONTINUE, the game state left for gen_return or
+            settle.
+        """
+
+        if self.recorder is not None:
+            self.recorder.action(filtered_action)
         move = OPTIONS_DICT[filtered_action]
         self.legal_moves += 1
         if self.state == 'a':
-            if self.legal_attack(filtered_action):
+            if self.legal[filtered_action]:
                 # AI plays a card.
                 if isinstance(move, Card):
                     self.model.remove_card(move)
-                    self.add_attack(move)
+                    self.add_attack(move, MODEL)
                     defense = self.opponent.defend(self.table, False, 1)
+                    if self.recorder is not None:
+                        self.recorder.defend(defense)
                     # Both players still have cards or drawing potential.
                     logging.info(defense[0])
                     if defense[0] == Defense.defend:
                         self.table += defense[1]
-                        self.ranks.update({card.rank: 0 for card in defense[1]})
+                        self.knowledge.play(OPPONENT, defense[1])
+                        for card in defense[1]:
+                            self.ranks[card.rank] = 0
+                            self.rank_mask |= RANK_MASKS[card.rank_num]
                         logging.info('Table object: %s', ', '.join([str(x) for x in self.table]))
                         # Check for end of turn conditions.
                         if len(self.table) == 12 or len(self.model) == 0 or len(self.opponent) == 0:
@@ -380,24 +735,27 @@ class DurakEnv(gym.Env):
                             # Draw cards, attacker then defender
                             if self.player_draw(self.model):
                                 # Model wins on attack.
-                                return self.gen_return(WIN)
+                                return WIN
 
                             if self.player_draw(self.opponent):
                                 # Bot wins defending in attack phase.
-                                return self.gen_return(LOSE)
+                                return LOSE
 
                             # Bot attacks table.
                             self.mandatory_opponent_attack('Opponent is not attacking on first attack after turn end')
-                            return self.gen_return(CONTINUE)
+                            return CONTINUE
                         # Turn is not over, Model is attacking again
                         self.state = 'a'
-                        return self.gen_return(CONTINUE)
+                        return CONTINUE
                     if defense[0] == Defense.take:
                         self.state = 's'  # Model will be shedding in next step
+                        self.first_shed = False
+                        self.allowed_to_shed = min(6 - self.attack_count, len(self.opponent))
+                        self.shed_so_far = 0
                         if self.print_trace:
                             print('Opponent has chosen to take')
                         self.successful_attacks += 1
-                        return self.gen_return(CONTINUE)
+                        return CONTINUE
                     raise RuntimeError('Opponent has passed cards')
                 if move == 'done':  # AI is done in attack context
                     self.clear_table()
@@ -412,42 +770,45 @@ class DurakEnv(gym.Env):
                     logging.info('Bot attack after done')
                     logging.info(' '.join([str(x) for x in self.table]))
                     # Model will be defending next turn.
-                    return self.gen_return(CONTINUE)
+                    return CONTINUE
                 raise RuntimeError('Legal_attack true but not attack or move.')
             # Punish and end.
             logging.error('Model has played illegal move')
             logging.error(str(move))
             logging.error('move %s', move)
-            logging.error('filtered actions: %s', filtered)
+            logging.error('legal moves: %s', self.gen_legal_moves())
             logging.info('legal_attack %s', self.legal_attack(filtered_action))
             raise RuntimeError("Model made an illegal move")
         # Defend state logic.
         if self.state == "d":
             # Bot has already attacked.
-            if self.legal_defense(filtered_action):
+            if self.legal[filtered_action]:
                 if isinstance(move, Card):
                     self.table.append(move)
                     self.model.remove_card(move)
+                    self.knowledge.play(MODEL, (move,))
                     if len(self.table) == 12 or len(self.model) == 0 or len(self.opponent) == 0:
                         # Turn is over
                         self.clear_table()
                         # Draw cards, attacker (opponent) then defender (model)
                         if self.player_draw(self.opponent):
                             # Bot wins defending in attack phase.
-                            return self.gen_return(LOSE)
+                            return LOSE
                         if self.player_draw(self.model):
                             # Model wins on attack.
-                            return self.gen_return(WIN)
+                            return WIN
                         # If game hasn't ended, the turn is over and the bot successfully defends.
                         self.state = "a"
-                        return self.gen_return(CONTINUE)
+                        return CONTINUE
 
                     atk = self.opponent.attack(self.table, self.ranks)
+                    if self.recorder is not None:
+                        self.recorder.attack(atk)
                     logging.info(atk[0])
                     if atk[0] == Attack.play:
-                        self.add_attack(atk[1])
+                        self.add_attack(atk[1], OPPONENT)
                         self.state = 'd'
-                        return self.gen_return(CONTINUE)
+                        return CONTINUE
 
                     if atk[0] == Attack.done:
                         self.clear_table()
@@ -469,15 +830,19 @@ class DurakEnv(gym.Env):
                     # Bot gets to shed.
                     self.takes += 1
                     shed = self.opponent.shed(self.table, min((6 - self.attack_count, len(self.model))), self.ranks)
+                    if self.recorder is not None:
+                        self.recorder.shed(shed)
+                    self.knowledge.play(OPPONENT, shed)
                     if self.print_trace:
                         print("opponent sheds: " + ", ".join([str(x) for x in shed]))
 
                     if self.player_draw(self.opponent):
                         # Opponent has won on their shed.
-                        return self.gen_return(LOSE)
+                        return LOSE
 
                     self.table += shed
                     self.model.take_table(self.table)
+                    self.knowledge.take(MODEL)
                     # self.table = [] before clear table to prevent out pile duplicate.
                     self.table = []
                     self.clear_table()
@@ -491,7 +856,7 @@ class DurakEnv(gym.Env):
                 logging.error('Model has played illegal move')
                 logging.error(str(move))
                 logging.error('move %s', move)
-                logging.error('filtered actions: %s', filtered)
+                logging.error('legal moves: %s', self.gen_legal_moves())
                 logging.error('action %s', filtered_action)
                 logging.info('legal_Defense %s', self.legal_defense(filtered_action))
                 raise RuntimeError("Model made an illegal move")
@@ -499,16 +864,19 @@ class DurakEnv(gym.Env):
         # Shed state logic.
         elif self.state == "s":
             logging.info('state s')
-            if self.legal_shed(filtered_action):
+            if self.legal[filtered_action]:
                 if isinstance(move, Card):
                     # Shed 1 card -> return to shed.
                     self.model.remove_card(move)
-                    self.add_attack(move)
+                    self.add_attack(move, MODEL)
+                    self.shed_so_far += 1
                     self.state = 's'
                 elif move == 'done':
                     # Done -> attack.
                     self.first_shed = True
+                    self.allowed_to_shed = -1
                     self.opponent.take_table(self.table)
+                    self.knowledge.take(OPPONENT)
 
                     # self.table = [] before clear table to prevent duplicates in out pile
                     self.table = []
@@ -519,8 +887,8 @@ class DurakEnv(gym.Env):
                     # Opponent shouldn't have to draw here.
                     if self.player_draw(self.model):
                         # Model has won by shedding last cards.
-                        return self.gen_return(WIN)
-                    return self.gen_return(CONTINUE)
+                        return WIN
+                    return CONTINUE
 
                 else:
                     logging.info('move %s', move)
@@ -536,13 +904,29 @@ class DurakEnv(gym.Env):
                 logging.error('len opponent %s', str(len(self.opponent)))
                 logging.error(str(move))
                 logging.error('move %s', move)
-                logging.error('filtered actions: %s', list(filtered))
+                logging.error('legal moves: %s', self.gen_legal_moves())
                 logging.info('legal_attack %s', self.legal_attack(filtered_action))
                 raise RuntimeError("Model made an illegal move")
 
         logging.info("%s", self.state)
 
-        return self.gen_return(CONTINUE)
+        return CONTINUE
+
+    def legal_cards(self):
+        """Returns the bitboard of the cards the model may play.
+
+        Runs on the bitboards of the model's hand and the table ranks.
+        """
+
+        if self.state == 'a':
+            if len(self.table) != 0:
+                return self.model.hand_mask & self.rank_mask
+            return self.model.hand_mask
+        if self.state == 'd':
+            return self.model.hand_mask & BEATS[self.dank][self.table[-1].id]
+        if self.state == 's' and self.shed_left() > 0:
+            return self.model.hand_mask & self.rank_mask
+        return 0
 
     def gen_legal_moves(self):
         """Generates a set of legal moves.
@@ -552,75 +936,111 @@ class DurakEnv(gym.Env):
         """
 
         ret = [0] * 38
-        if self.state == 'a':
-            if len(self.table) != 0:
-                ret[36] = 1
-            for card in self.model.hand:
-                if self.legal_attack(CARD_TO_OBS[card]):
-                    ret[CARD_TO_OBS[card]] = 1
-
+        for index in ids(self.legal_cards()):
+            ret[index] = 1
+        if self.state == 's' or (self.state == 'a' and len(self.table) != 0):
+            ret[36] = 1
         if self.state == 'd':
             ret[37] = 1
-            for card in self.model.hand:
-                if self.legal_defense(CARD_TO_OBS[card]):
-                    ret[CARD_TO_OBS[card]] = 1
+        return ret
 
-        # legal_shed called AFTER
-        if self.state == 's':
-            ret[36] = 1
-            if self.first_shed:
-                allowed_sheds = min(6 - self.attack_count, len(self.opponent))
-                if allowed_sheds > 0:
-                    for card in self.model.hand:
-                        if card.rank in self.ranks:
-                            ret[CARD_TO_OBS[card]] = 1
-            else:
-                if self.shed_so_far < self.allowed_to_shed:
-                    for card in self.model.hand:
-                        if card.rank in self.ranks:
-                            ret[CARD_TO_OBS[card]] = 1
+    def update_legal(self):
+        """Updates the legal move mask after the state changed.
 
-        return ret
+        Only the entries of cards whose legality changed are written.
+        """
+
+        legal = self.legal
+        cards = self.legal_cards()
+        for card_id in ids(cards ^ self._legal_cards):
+            legal[card_id] = not legal[card_id]
+        self._legal_cards = cards
+        legal[36] = self.state == 's' or (self.state == 'a' and len(self.table) != 0)
+        legal[37] = self.state == 'd'
+
+    def action_mask(self):
+        """Returns the legal moves for action masking.
+
+        Returns:
+            A read-only bool array of 38, True for every legal action index,
+            updated in place by every step.
+        """
+
+        return self._legal_view
 
-    def gen_obs(self, condition):
+    def gen_obs(self, condition, out=None):
         """Generates observations to send to the model.
 
+        The observation is kept in one buffer that is updated in place from
+        the cards that moved since the last call, found by comparing the
+        model's knowledge bitboards with the ones it was last built from.
+        Rows 0-4 of 36 hold where each card is: 0 if unknown, 1 if on the
+        table, 2 if in hand, 3 if in the out pile and 4 for the table card.
+        Row 5 marks the attack to defend, and the last 3 values the state.
+
+        Args:
+            condition: WIN, LOSE, or CONTINUE.
+            out: Optional float array of 219 to copy the observation into.
+
         Returns:
-            An observation based on game state.
+            out if given, else a read-only view of the buffer, which the next
+            step overwrites: copy it to keep it.
         """
+
         if condition in (WIN, LOSE):
-            return np.zeros(219, )
-        # 0 if unknown.
-        ret = [0] * 36
-        # 1 if on table.
-        for card in self.table:
-            ret[CARD_TO_OBS[card]] = 1
-        # 2 if in hand.
-        for card in self.model.hand:
-            ret[CARD_TO_OBS[card]] = 2
-
-        # 3 if in out pile.
-        for card in self.out_pile:
-            ret[CARD_TO_OBS[card]] = 3
-
-        # 4 if table card.
-        ret[CARD_TO_OBS[self.table_card]] = 4
-        ret2 = np.zeros(shape=(6, 36), )
-        state = [0, 0, 0]
+            if out is None:
+                return NO_OBS
+            out[:] = 0.
+            return out
+
+        buffer = self._obs
+        codes = self._obs_codes
+        knowledge = self.knowledge[MODEL]
+        table = knowledge.table
+        hand = knowledge.hand
+        gone = knowledge.gone
+        changed = (table ^ self._obs_masks[0]) | (hand ^ self._obs_masks[1]) | (gone ^ self._obs_masks[2])
+        for card_id in ids(changed & ~self.table_card.bit):
+            bit = 1 << card_id
+            code = 1 if table & bit else 2 if hand & bit else 3 if gone & bit else 0
+            buffer[codes[card_id] * 36 + card_id] = 0.
+            buffer[code * 36 + card_id] = 1.
+            codes[card_id] = code
+        self._obs_masks = (table, hand, gone)
+
+        if self._obs_last is not None:
+            buffer[self._obs_last] = 0.
+            self._obs_last = None
+        buffer[OBS_STATE:] = 0.
         if self.state == 'a':
-            state[0] = 1
+            buffer[OBS_STATE] = 1.
         elif self.state == 's':
-            state[1] = 1
+            buffer[OBS_STATE + 1] = 1.
         elif self.state == 'd':
-            state[2] = 1
-            last_card = self.table[-1]
-            obs = CARD_TO_OBS[last_card]
-            ret2[5][obs] = 1
+            buffer[OBS_STATE + 2] = 1.
+            self._obs_last = 5 * 36 + self.table[-1].id
+            buffer[self._obs_last] = 1.
+
+        if out is None:
+            return self._obs_view
+        out[:] = buffer
+        return out
 
-        for index, value in enumerate(ret):
-            ret2[value][index] = 1
+    def reset_obs(self):
+        """Rebuilds the observation buffer from scratch on the next gen_obs.
+
+        Called once the cards are dealt, and after restore.
+        """
 
-        return np.concatenate((ret2.flatten(), state))
+        self._obs[:] = 0.
+        # Every card starts unknown, then the table card is marked.
+        self._obs[:36] = 1.
+        self._obs_codes = [0] * 36
+        self._obs[self.table_card.id] = 0.
+        self._obs[4 * 36 + self.table_card.id] = 1.
+        self._obs_codes[self.table_card.id] = 4
+        self._obs_masks = (0, 0, 0)
+        self._obs_last = None
 
     def gen_info(self, condition):
         """Generates info to return.
@@ -651,10 +1071,31 @@ class DurakEnv(gym.Env):
             The observation, the reward, whether the run is done, and the info.
         """
 
-        bonus = 10 if condition == WIN else 0
-        done = bool(condition in (WIN, LOSE))
+        bonus = WIN_REWARD if condition == WIN else 0
+        done = self.settle(condition)
         return self.gen_obs(condition), bonus, done, self.gen_info(condition)
 
+    def settle(self, condition):
+        """Updates the legal moves, and the record of a finished game, after
+        a move.
+
+        Args:
+            condition: WIN, LOSE, or CONTINUE.
+
+        Returns:
+            Whether the game is done.
+        """
+
+        done = condition in (WIN, LOSE)
+        if done:
+            self.legal[:] = False
+            self._legal_cards = 0
+        else:
+            self.update_legal()
+        if done and self.recorder is not None:
+            self.recorder.end(0 if condition == WIN else 1, self.turns)
+        return done
+
     # def gen_score(self):
     #     """Generates a reward to return.
     #     """
@@ -666,22 +1107,148 @@ class DurakEnv(gym.Env):
     #
     #     return 0
 
-    def reset(self):
+    def seed(self, seed=None):
+        """Seeds the deals so that games can be replayed exactly.
+
+        Args:
+            seed: The root seed of the DealStream, or None to go back to
+                shuffling with the global random module.
+
+        Returns:
+            The list of seeds used, as expected by gym.
+        """
+
+        self.deals = None if seed is None else DealStream(seed)
+        self.next_deal = 0
+        if seed is not None:
+            # Who attacks first comes from the sampled first action.
+            self.action_space.seed(seed)
+        return [seed]
+
+    def snapshot(self):
+        """Captures the state of the environment between steps.
+
+        Returns:
+            An EnvState that restore can return to any number of times.
+        """
+
+        return EnvState(
+            self.game_started,
+            tuple(self.model.hand),
+            self.model.hand_mask,
+            self.opponent.strategy,
+            tuple(self.opponent.hand),
+            self.opponent.hand_mask,
+            tuple(self.deck.cards),
+            self.deck.mask,
+            tuple(self.out_pile),
+            tuple(self.table),
+            tuple(self.ranks),
+            self.rank_mask,
+            self.attack_count,
+            self.state,
+            self.dank,
+            self.table_card,
+            self.first_shed,
+            self.shed_so_far,
+            self.allowed_to_shed,
+            self.turns,
+            (self.legal_moves, self.successful_attacks, self.successful_defenses, self.takes),
+            None if self.knowledge is None else self.knowledge.copy(),
+        )
+
+    def restore(self, state):
+        """Returns the environment to a snapshot.
+
+        The deck, model and opponent keep their objects when they exist, so
+        restoring inside a search does not allocate new ones.
+
+        Args:
+            state: The EnvState to restore.
+        """
+
+        if self.deck is None:
+            self.deck = Deck()
+        if self.model is None:
+            self.model = Model()
+        if self.opponent is None or self.opponent.strategy is not state.opponent_strategy:
+            self.opponent = Player("Bot", state.opponent_strategy)
+
+        self.game_started = state.game_started
+        self.model.hand = list(state.model_hand)
+        self.model.hand_mask = state.model_mask
+        self.opponent.hand = list(state.opponent_hand)
+        self.opponent.hand_mask = state.opponent_mask
+        # The dealt hand is only sorted by the opponent's first draw.
+        self.opponent.hand_sorted = (state.dank is not None
+                                     and self.opponent.hand == sorted(state.opponent_hand,
+                                                                      key=CARD_COMPARATORS[state.dank]))
+        self.opponent.dank = state.dank
+        self.deck.cards = list(state.deck)
+        self.deck.mask = state.deck_mask
+        self.out_pile = list(state.out_pile)
+        self.table = list(state.table)
+        self.ranks = dict.fromkeys(state.ranks, 0)
+        self.rank_mask = state.rank_mask
+        self.attack_count = state.attack_count
+        self.state = state.state
+        self.dank = state.dank
+        self.table_card = state.table_card
+        self.first_shed = state.first_shed
+        self.shed_so_far = state.shed_so_far
+        self.allowed_to_shed = state.allowed_to_shed
+        self.turns = state.turns
+        self.legal_moves, self.successful_attacks, self.successful_defenses, self.takes = state.counters
+        self.knowledge = None if state.knowledge is None else state.knowledge.copy()
+        if self.knowledge is not None:
+            self.reset_obs()
+        self.update_legal()
+
+    def reset(self, deal_index=None):
         """Resets the game to the starting state.
+
+        When seeded, the deck comes from the deal stream and the opponent
+        strategy is picked round robin from the deal index, so a given
+        (seed, deal_index) replays the same game for the same actions, as long
+        as the opponent is not StratRandom.
+
+        In duplicate mode, deal indices 2i and 2i + 1 both play deal i of the
+        stream against the same opponent strategy, the odd one mirrored so the
+        model holds the hand the opponent held. The model attacks first in the
+        even game and the opponent in the odd one, whatever the first action.
+
+        Args:
+            deal_index: The deal to play when seeded, defaults to the next one.
         """
 
         self.game_started = False
-        self.deck = Deck()
+        self.mirrored = False
+        if self.deals is None:
+            if self.duplicate:
+                raise RuntimeError('Duplicate deals need a seeded environment.')
+            self.deck = Deck()
+            self.opponent = Player("Bot", random.choice(self.strategies))
+            self.deck.shuffle_deck()
+        else:
+            if deal_index is None:
+                deal_index = self.next_deal
+            self.next_deal = deal_index + 1
+            if self.duplicate:
+                deal_index, mirrored = divmod(deal_index, 2)
+                self.mirrored = bool(mirrored)
+            deal = self.deals.deal(deal_index)
+            self.deck = Deck(mirror_deal(deal) if self.mirrored else deal)
+            self.opponent = Player("Bot", self.strategies[deal_index % len(self.strategies)])
         self.out_pile = []
         self.players = []
         self.turns = 0
         self.table = []
         self.ranks = {}
+        self.rank_mask = 0
         self.attack_count = 0
         self.state = None
         self.dank = None
         self.table_card = None
-        self.opponent = random.choice(self.strategies)
         self.first_shed = True
         self.shed_so_far = None
         self.allowed_to_shed = None
@@ -691,6 +1258,10 @@ class DurakEnv(gym.Env):
         self.successful_defenses = 0
         self.takes = 0
         self.player1 = True
+        self.knowledge = None
+        self.legal[:] = False
+        self._legal_cards = 0
+        self.skipped_steps = 0
 
     def render(self, mode='human'):
         """Will not be used.
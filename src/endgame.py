@@ -0,0 +1,500 @@
+"""A perfect information solver for two player endgames.
+
+Once the deck is empty nothing is hidden: every card is in a hand, on the
+table or out of the game, and the rest of the game is a deterministic two
+player game. Contains the EndgameSolver class, which searches it to the end
+following the rules of Game.resume_turn, and the Endgame class, a Strategy
+that plays a fallback heuristic until the deck runs out and solved moves
+after.
+
+The search returns the winning seat and stops at the first move that wins
+for the player to move, the alpha-beta cutoff of a win/loss game, with lines
+that repeat a position scored as draws. Positions are keyed by a Zobrist
+hash of where each card is and whose decision it is, updated move by move,
+in a fixed size transposition table.
+
+    Usage:
+
+    python endgame.py
+"""
+
+import random
+import time
+from collections import namedtuple
+
+from bitboard import BEATS, RANK_MASKS, count, ids, rank_mask, to_mask
+from card import CARDS, RANKS
+from deck import DealStream
+from game import Game
+from ismcts import as_return
+from strategy import S0, Strategy
+
+# Phases of a position, as in Game.resume_turn, with the first attack as 'lead'.
+LEAD, PASS, ATTACK, DEFEND, SHED = range(5)
+PHASES = {'lead': LEAD, 'pass': PASS, 'attack': ATTACK, 'defend': DEFEND, 'shed': SHED}
+
+# The result of a position that can repeat forever.
+DRAW = -1
+# Deeper lines raise SearchLimit rather than hit the recursion limit.
+MAX_DEPTH = 400
+
+# RANK_OF[card.id] is the bitboard of every card of the same rank.
+RANK_OF = [RANK_MASKS[card.rank_num] for card in CARDS]
+
+_RNG = random.Random(0)
+# Zobrist keys of each card in seat 0's hand, seat 1's hand, on the table and
+# left to defend, of each rank that can be played, and of whose decision it
+# is as ZOBRIST_SIDE[attacker][phase][attack_count].
+ZOBRIST_HANDS = [[_RNG.getrandbits(64) for _ in CARDS] for _ in range(2)]
+ZOBRIST_TABLE = [_RNG.getrandbits(64) for _ in CARDS]
+ZOBRIST_PENDING = [_RNG.getrandbits(64) for _ in CARDS]
+ZOBRIST_RANKS = [_RNG.getrandbits(64) for _ in RANKS]
+ZOBRIST_SIDE = [[[_RNG.getrandbits(64) for _ in range(7)] for _ in PHASES] for _ in range(2)]
+
+
+def zobrist(keys, mask):
+    """Returns the xor of the keys of every card in a bitboard.
+
+    Args:
+        keys: The Zobrist keys of a location, by card id.
+        mask: The bitboard.
+    """
+
+    ret = 0
+    for card_id in ids(mask):
+        ret ^= keys[card_id]
+    return ret
+
+
+def _rank_keys(ranks):
+    """Returns the xor of the keys of every rank in a ranks bitboard.
+    """
+
+    ret = 0
+    for rank_num, mask in enumerate(RANK_MASKS):
+        if ranks & mask:
+            ret ^= ZOBRIST_RANKS[rank_num]
+    return ret
+
+
+class Position(namedtuple('Position', ['hands', 'table', 'pending', 'ranks', 'attacker', 'phase', 'attack_count',
+                                       'key'])):
+    """A decision point of an endgame, with all cards as bitboards.
+
+    Use make_position to build one; moves derives the key of every next
+    position from its parent's by xoring in what changed.
+
+    Attributes:
+        hands: The bitboard of each seat's hand.
+        table: Bitboard of the cards on the table.
+        pending: Bitboard of the table cards still to defend.
+        ranks: Bitboard of every card matching a rank that can be played,
+            the ranks dict of Game.turn2.
+        attacker: The attacking seat.
+        phase: One of LEAD, PASS, ATTACK, DEFEND and SHED.
+        attack_count: Count of passes and attacks after the first.
+        key: The Zobrist hash of the position.
+    """
+
+    __slots__ = ()
+
+    def mover(self):
+        """Returns the seat that decides at this position.
+        """
+
+        return 1 - self.attacker if self.phase in (PASS, DEFEND) else self.attacker
+
+
+def make_position(hands, table, pending, ranks, attacker, phase, attack_count):
+    """Builds a Position and hashes it from scratch.
+
+    Args:
+        hands: The bitboard of each seat's hand.
+        table: Bitboard of the cards on the table.
+        pending: Bitboard of the table cards still to defend.
+        ranks: Bitboard of every card matching a rank that can be played.
+        attacker: The attacking seat.
+        phase: One of LEAD, PASS, ATTACK, DEFEND and SHED.
+        attack_count: Count of passes and attacks after the first.
+
+    Returns:
+        The Position.
+    """
+
+    key = (ZOBRIST_SIDE[attacker][phase][attack_count] ^ zobrist(ZOBRIST_HANDS[0], hands[0])
+           ^ zobrist(ZOBRIST_HANDS[1], hands[1]) ^ zobrist(ZOBRIST_TABLE, table) ^ zobrist(ZOBRIST_PENDING, pending)
+           ^ _rank_keys(ranks))
+    return Position(hands, table, pending, ranks, attacker, phase, attack_count, key)
+
+
+def end_turn(hands, attacker, take):
+    """Ends a turn, as the draw step of Game.turn2 does with an empty deck.
+
+    Args:
+        hands: The bitboard of each seat's hand.
+        attacker: The attacking seat.
+        take: Whether the defender took.
+
+    Returns:
+        The winning seat, or the LEAD position of the next turn.
+    """
+
+    if not hands[attacker]:
+        return attacker
+    if not hands[1 - attacker]:
+        return 1 - attacker
+    return make_position(hands, 0, 0, 0, attacker if take else 1 - attacker, LEAD, 0)
+
+
+def _assignments(pending, hand, dank):
+    """Yields every way to defend each pending card with a distinct card.
+
+    Args:
+        pending: The card ids to defend, in order.
+        hand: Bitboard of the defender's hand.
+        dank: The suit of the Dank card.
+
+    Yields:
+        Tuples of defending card ids aligned with pending.
+    """
+
+    if not pending:
+        yield ()
+        return
+    for defense in ids(hand & BEATS[dank][pending[0]]):
+        for rest in _assignments(pending[1:], hand & ~CARDS[defense].bit, dank):
+            yield (defense,) + rest
+
+
+def moves(position, dank):
+    """Yields the moves of a position and where they lead.
+
+    Moves are (kind, cards) tuples as in ismcts.as_return, with card ids. A
+    pass phase defense lists its cards in the order of ids(pending).
+
+    Args:
+        position: The Position.
+        dank: The suit of the Dank card.
+
+    Yields:
+        (move, result) pairs, result being the next Position or the winning
+        seat.
+    """
+
+    hands, table, pending, ranks, attacker, phase, attack_count, key = position
+    defender = 1 - attacker
+    attacker_hand = hands[attacker]
+    defender_hand = hands[defender]
+    attacker_keys = ZOBRIST_HANDS[attacker]
+    defender_keys = ZOBRIST_HANDS[defender]
+    # The key without whose decision it is.
+    key ^= ZOBRIST_SIDE[attacker][phase][attack_count]
+
+    def with_hands(attacker_hand, defender_hand):
+        ret = [0, 0]
+        ret[attacker] = attacker_hand
+        ret[defender] = defender_hand
+        return tuple(ret)
+
+    def new_rank(card_id, ranks):
+        return 0 if ranks & RANK_OF[card_id] else ZOBRIST_RANKS[CARDS[card_id].rank_num]
+
+    if phase == LEAD:
+        for card_id in ids(attacker_hand):
+            bit = CARDS[card_id].bit
+            child_key = (key ^ attacker_keys[card_id] ^ ZOBRIST_TABLE[card_id] ^ ZOBRIST_PENDING[card_id]
+                         ^ ZOBRIST_SIDE[attacker][PASS][0])
+            yield ('play', (card_id,)), Position(with_hands(attacker_hand & ~bit, defender_hand), bit, bit, 0,
+                                                 attacker, PASS, 0, child_key)
+
+    elif phase == PASS:
+        pending_ids = ids(pending)
+        # Every pending card shares the rank of the first attack.
+        if count(attacker_hand) >= count(table) + 1:
+            for card_id in ids(defender_hand & RANK_OF[pending_ids[0]]):
+                bit = CARDS[card_id].bit
+                child_key = (key ^ defender_keys[card_id] ^ ZOBRIST_TABLE[card_id] ^ ZOBRIST_PENDING[card_id]
+                             ^ new_rank(card_id, ranks) ^ ZOBRIST_SIDE[defender][PASS][attack_count + 1])
+                yield ('pass', (card_id,)), Position(with_hands(attacker_hand, defender_hand & ~bit), table | bit,
+                                                     pending | bit, ranks | RANK_OF[card_id], defender, PASS,
+                                                     attack_count + 1, child_key)
+        cleared = key ^ zobrist(ZOBRIST_PENDING, pending) ^ ZOBRIST_SIDE[attacker][ATTACK][attack_count]
+        for defense in _assignments(pending_ids, defender_hand, dank):
+            mask = 0
+            child_ranks = ranks
+            child_key = cleared
+            for card_id in defense:
+                mask |= CARDS[card_id].bit
+                child_key ^= defender_keys[card_id] ^ ZOBRIST_TABLE[card_id] ^ new_rank(card_id, child_ranks)
+                child_ranks |= RANK_OF[card_id]
+            yield ('defend', defense), Position(with_hands(attacker_hand, defender_hand & ~mask), table | mask, 0,
+                                                child_ranks, attacker, ATTACK, attack_count, child_key)
+        yield ('take', ()), Position(hands, table, pending, ranks, attacker, SHED, attack_count,
+                                     key ^ ZOBRIST_SIDE[attacker][SHED][attack_count])
+
+    elif phase == ATTACK:
+        if not (attack_count < 6 and defender_hand and attacker_hand and count(table) < 12):
+            # The defense phase is over without a decision.
+            yield ('done', ()), end_turn(hands, attacker, False)
+            return
+        for card_id in ids(attacker_hand & ranks):
+            bit = CARDS[card_id].bit
+            child_key = (key ^ attacker_keys[card_id] ^ ZOBRIST_TABLE[card_id] ^ ZOBRIST_PENDING[card_id]
+                         ^ ZOBRIST_SIDE[attacker][DEFEND][attack_count + 1])
+            yield ('play', (card_id,)), Position(with_hands(attacker_hand & ~bit, defender_hand), table | bit, bit,
+                                                 ranks, attacker, DEFEND, attack_count + 1, child_key)
+        yield ('done', ()), end_turn(hands, attacker, False)
+
+    elif phase == DEFEND:
+        attack_id = pending.bit_length() - 1
+        cleared = key ^ ZOBRIST_PENDING[attack_id] ^ ZOBRIST_SIDE[attacker][ATTACK][attack_count]
+        for card_id in ids(defender_hand & BEATS[dank][attack_id]):
+            bit = CARDS[card_id].bit
+            child_key = cleared ^ defender_keys[card_id] ^ ZOBRIST_TABLE[card_id] ^ new_rank(card_id, ranks)
+            yield ('defend', (card_id,)), Position(with_hands(attacker_hand, defender_hand & ~bit), table | bit, 0,
+                                                   ranks | RANK_OF[card_id], attacker, ATTACK, attack_count,
+                                                   child_key)
+        yield ('take', ()), Position(hands, table, pending, ranks, attacker, SHED, attack_count,
+                                     key ^ ZOBRIST_SIDE[attacker][SHED][attack_count])
+
+    else:
+        matches = attacker_hand & ranks
+        limit = min(6 - attack_count, count(defender_hand))
+        # Every subset of the matches within the limit, largest first.
+        shed = matches
+        while True:
+            if count(shed) <= limit:
+                yield ('shed', tuple(ids(shed))), end_turn(with_hands(attacker_hand & ~shed, defender_hand | table | shed),
+                                                          attacker, True)
+            if not shed:
+                break
+            shed = (shed - 1) & matches
+
+
+class SearchLimit(Exception):
+    """Raised when a solve visits more nodes than its budget, or goes deeper
+    than the recursion limit allows.
+    """
+
+
+class EndgameSolver:
+    """Solves endgame positions for a dank suit.
+
+    Passing the same cards back and forth can repeat a position forever, as
+    deterministic bots do in Game. A position repeated on the current line
+    counts as a DRAW. Draws depend on the line that reached them, so only
+    wins and losses are kept in the transposition table.
+
+    Attributes:
+        dank: The suit of the Dank card.
+        tt_size: The number of transposition table slots, a power of 2.
+        tt: The transposition table, slots of (key, winner) or None.
+        nodes: Positions searched by the last solve.
+        hits: Transposition table hits of the last solve.
+        latency: Seconds taken by the last solve.
+    """
+
+    def __init__(self, dank, tt_size=1 << 18):
+        """Inits EndgameSolver.
+
+        Args:
+            dank: The suit of the Dank card.
+            tt_size: The number of transposition table slots, rounded up to a
+                power of 2. Each slot keeps the last position hashed to it.
+        """
+
+        self.dank = dank
+        self.tt_size = 1 << max(tt_size - 1, 0).bit_length()
+        self.tt = [None] * self.tt_size
+        self.nodes = 0
+        self.hits = 0
+        self.latency = 0.
+        self._max_nodes = None
+        self._line = set()
+
+    def _winner(self, position):
+        """Returns the winning seat of a position under perfect play, or DRAW.
+        """
+
+        key = position.key
+        slot = key & (self.tt_size - 1)
+        entry = self.tt[slot]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1]
+        if key in self._line:
+            return DRAW
+
+        self.nodes += 1
+        if (self._max_nodes is not None and self.nodes > self._max_nodes) or len(self._line) >= MAX_DEPTH:
+            raise SearchLimit()
+        mover = position.mover()
+        winner = 1 - mover
+        self._line.add(key)
+        try:
+            for _, result in moves(position, self.dank):
+                if not isinstance(result, int):
+                    result = self._winner(result)
+                if result == mover:
+                    winner = mover
+                    break
+                if result == DRAW:
+                    winner = DRAW
+        finally:
+            self._line.discard(key)
+        if winner != DRAW:
+            self.tt[slot] = (key, winner)
+        return winner
+
+    def solve(self, position, max_nodes=None):
+        """Finds the winner of a position and a move that gets there.
+
+        Args:
+            position: The Position to solve.
+            max_nodes: Optional budget of positions to search.
+
+        Returns:
+            The winning seat or DRAW, and the best move for the player to
+            move: a winning move, else a drawing move, else the first move.
+
+        Raises:
+            SearchLimit: The budget ran out.
+        """
+
+        start = time.perf_counter()
+        self.nodes = 0
+        self.hits = 0
+        self._max_nodes = max_nodes
+        self._line = {position.key}
+        try:
+            mover = position.mover()
+            best = None
+            for move, result in moves(position, self.dank):
+                if not isinstance(result, int):
+                    result = self._winner(result)
+                if best is None or result == mover or (result == DRAW and best[0] != mover):
+                    best = (result, move)
+                if result == mover:
+                    break
+            return best
+        finally:
+            self.latency = time.perf_counter() - start
+
+
+class Endgame(Strategy):
+    """Strategy class that solves the game once the deck is empty.
+
+    Plays the fallback strategy while cards are left to draw. After that the
+    other hand is every card not seen elsewhere, so it is read from the
+    watched game rather than deduced. Needs Game to call watch.
+
+    Attributes:
+        fallback: The strategy used before the endgame, or when a solve runs
+            over max_nodes.
+        tt_size: The transposition table slots of each game's solver.
+        max_nodes: Optional budget of positions per solve.
+        game: The Game being played.
+        solver: The EndgameSolver of the current game.
+        latencies: Seconds taken by every solve so far.
+    """
+
+    def __init__(self, fallback=None, tt_size=1 << 18, max_nodes=50000):
+        """Inits Endgame.
+
+        Args:
+            fallback: The strategy used before the endgame, S0 by default.
+            tt_size: The transposition table slots of each game's solver.
+            max_nodes: Budget of positions per solve, None for no limit.
+        """
+
+        super().__init__()
+        self.fallback = S0() if fallback is None else fallback
+        self.tt_size = tt_size
+        self.max_nodes = max_nodes
+        self.game = None
+        self.solver = None
+        self.latencies = []
+
+    def watch(self, game, num):
+        self.game = game
+        self.solver = None
+        self.fallback.watch(game, num)
+
+    def _solve(self, hand, table, ranks, phase, attack_count, pending):
+        """Solves the current decision and plays the best move.
+
+        Returns:
+            The return value of the strategy call, or None to fall back.
+        """
+
+        game = self.game
+        if game is None or len(game.deck) > 0:
+            return None
+        if self.solver is None:
+            self.solver = EndgameSolver(game.dank, self.tt_size)
+
+        position = make_position(tuple(player.hand_mask for player in game.players), to_mask(table), pending,
+                                 rank_mask(ranks), game.attacker, phase, attack_count)
+        try:
+            _, (kind, card_ids) = self.solver.solve(position, self.max_nodes)
+        except SearchLimit:
+            return None
+        finally:
+            self.latencies.append(self.solver.latency)
+
+        cards = [CARDS[card_id] for card_id in card_ids]
+        if kind == 'defend' and phase == PASS:
+            # Put the defenses in table order.
+            by_attack = dict(zip(ids(pending), cards))
+            cards = [by_attack[card.id] for card in table]
+        for card in cards:
+            hand.remove(card)
+        return as_return((kind, tuple(cards)))
+
+    def attack(self, hand, table, dank, ranks):
+        if len(table) == 0:
+            ret = self._solve(hand, table, ranks, LEAD, 0, 0)
+        else:
+            ret = self._solve(hand, table, ranks, ATTACK, len(table) // 2 - 1, 0)
+        return self.fallback.attack(hand, table, dank, ranks) if ret is None else ret
+
+    def defend(self, hand, table, dank, pass_is_legal, cards_to_defend):
+        # As in ISMCTS.defend, the ranks are those of every card after the first.
+        ranks = dict.fromkeys(card.rank for card in table[1:])
+        if cards_to_defend == len(table):
+            ret = self._solve(hand, table, ranks, PASS, len(table) - 1, to_mask(table))
+        else:
+            ret = self._solve(hand, table, ranks, DEFEND, (len(table) + 1) // 2 - 1, table[-1].bit)
+        return self.fallback.defend(hand, table, dank, pass_is_legal, cards_to_defend) if ret is None else ret
+
+    def shed(self, hand, table, dank, max_shed_allowed, ranks):
+        ret = self._solve(hand, table, ranks, SHED, 6 - max_shed_allowed, 0)
+        return self.fallback.shed(hand, table, dank, max_shed_allowed, ranks) if ret is None else ret
+
+
+def main():
+    """Plays Endgame against S0 and reports solve latency.
+    """
+
+    num_games = 200
+    deals = DealStream(random.randrange(1 << 32))
+    wins = 0
+    latencies = []
+    for index in range(num_games):
+        endgame = Endgame()
+        seat = index % 2
+        strategies = [S0(), S0()]
+        strategies[seat] = endgame
+        winning_player = Game(strategies, False, deals.deal(index)).play(300)
+        wins += winning_player is not None and winning_player.num == seat
+        latencies += endgame.latencies
+
+    latencies.sort()
+    print('endgame wins: ' + str(wins) + ' of ' + str(num_games))
+    print('solves: ' + str(len(latencies)) + ' mean: ' + str(sum(latencies) / len(latencies)) + ' s')
+    print('p50: ' + str(latencies[len(latencies) // 2]) + ' s p99: ' + str(latencies[len(latencies) * 99 // 100])
+          + ' s max: ' + str(latencies[-1]) + ' s')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""Compares strategies with sequential statistical tests.
+
+Instead of a fixed number of games per comparison, games are played in blocks
+and a test is run on the wins so far after every block. The comparison stops
+as soon as the test decides that seat 0 wins more or less than half of the
+decided games, or when the game budget runs out.
+
+Contains confidence intervals on a win rate (wilson_interval, beta_interval),
+the SPRT, WilsonTest and BayesTest stopping rules, compare, which plays a
+strategy pair until its test decides, and main, which sweeps the (shed, play)
+grid of StratAI against S0 like game.main.
+
+Stopped games, which hit the turn limit, count as neither a win nor a loss.
+
+    Usage:
+
+    python evaluation.py
+    python evaluation.py --test=sprt --grid=5 --block-size=50 --max-games=2000 --seed=N
+"""
+
+import argparse
+import math
+from collections import namedtuple
+from statistics import NormalDist
+
+# pylint: disable=import-error
+import numpy as np
+
+from tournament import STRATEGIES, play_unit
+
+# Decisions of a test.
+BETTER = 1
+WORSE = -1
+UNDECIDED = 0
+DECISIONS = {BETTER: 'better', WORSE: 'worse', UNDECIDED: 'undecided'}
+
+
+def wilson_interval(wins, games, confidence=.95):
+    """Returns the Wilson score interval of a win rate.
+
+    Args:
+        wins: The number of wins.
+        games: The number of decided games.
+        confidence: The probability the interval covers the true win rate.
+
+    Returns:
+        The lower and upper bound, (0, 1) without games.
+    """
+
+    if games == 0:
+        return 0., 1.
+    z = NormalDist().inv_cdf(.5 + confidence / 2)
+    rate = float(wins) / games
+    center = (rate + z * z / (2 * games)) / (1 + z * z / games)
+    half = z / (1 + z * z / games) * math.sqrt(rate * (1 - rate) / games + z * z / (4 * games * games))
+    return max(0., center - half), min(1., center + half)
+
+
+def beta_posterior(wins, losses, prior=(1, 1), points=2001):
+    """Returns the Beta posterior of a win rate on a grid.
+
+    Args:
+        wins: The number of wins.
+        losses: The number of losses.
+        prior: The alpha and beta of the Beta prior, uniform by default.
+        points: The number of grid points on [0, 1].
+
+    Returns:
+        The grid and the cumulative distribution on it.
+    """
+
+    grid = np.linspace(0., 1., points)
+    alpha = wins + prior[0]
+    beta = losses + prior[1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_density = (alpha - 1) * np.log(grid) + (beta - 1) * np.log1p(-grid)
+    log_density[np.isnan(log_density)] = -np.inf
+    density = np.exp(log_density - log_density.max())
+    cdf = np.cumsum(density)
+    return grid, cdf / cdf[-1]
+
+
+def beta_interval(wins, losses, confidence=.95, prior=(1, 1)):
+    """Returns the equal tailed Bayesian credible interval of a win rate.
+
+    Args:
+        wins: The number of wins.
+        losses: The number of losses.
+        confidence: The posterior probability of the interval.
+        prior: The alpha and beta of the Beta prior, uniform by default.
+
+    Returns:
+        The lower and upper bound.
+    """
+
+    grid, cdf = beta_posterior(wins, losses, prior)
+    tail = (1 - confidence) / 2
+    return float(grid[np.searchsorted(cdf, tail)]), float(grid[min(np.searchsorted(cdf, 1 - tail), len(grid) - 1)])
+
+
+def prob_better(wins, losses, prior=(1, 1)):
+    """Returns the posterior probability that the win rate is above one half.
+    """
+
+    grid, cdf = beta_posterior(wins, losses, prior)
+    return 1. - float(cdf[np.searchsorted(grid, .5)])
+
+
+class SPRT:
+    """Wald's sequential probability ratio test on a win rate.
+
+    Tests a win rate of .5 - delta against .5 + delta. Accepting either
+    hypothesis decides the comparison.
+
+    Attributes:
+        delta: The distance of both hypotheses from one half.
+        lower: The log likelihood ratio to accept .5 - delta at.
+        upper: The log likelihood ratio to accept .5 + delta at.
+    """
+
+    def __init__(self, delta=.05, alpha=.05, beta=.05):
+        """Inits SPRT.
+
+        Args:
+            delta: The distance of both hypotheses from one half.
+            alpha: The probability of deciding better when the rate is
+                .5 - delta.
+            beta: The probability of deciding worse when the rate is
+                .5 + delta.
+        """
+
+        self.delta = delta
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+
+    def llr(self, wins, losses):
+        """Returns the log likelihood ratio of .5 + delta over .5 - delta.
+        """
+
+        good = .5 + self.delta
+        bad = .5 - self.delta
+        return wins * math.log(good / bad) + losses * math.log(bad / good)
+
+    def decide(self, wins, losses):
+        """Returns BETTER, WORSE or UNDECIDED.
+        """
+
+        llr = self.llr(wins, losses)
+        if llr >= self.upper:
+            return BETTER
+        if llr <= self.lower:
+            return WORSE
+        return UNDECIDED
+
+    def interval(self, wins, losses):
+        """Returns the Wilson interval, reported alongside the test.
+        """
+
+        return wilson_interval(wins, wins + losses)
+
+
+class WilsonTest:
+    """Decides once the Wilson interval of the win rate excludes one half.
+
+    The interval is checked after every block, so its error rate is higher
+    than the nominal one. Use a high confidence.
+
+    Attributes:
+        confidence: The confidence of the interval.
+        min_games: The decided games required before deciding.
+    """
+
+    def __init__(self, confidence=.99, min_games=50):
+        self.confidence = confidence
+        self.min_games = min_games
+
+    def decide(self, wins, losses):
+        """Returns BETTER, WORSE or UNDECIDED.
+        """
+
+        if wins + losses < self.min_games:
+            return UNDECIDED
+        lower, upper = self.interval(wins, losses)
+        if lower > .5:
+            return BETTER
+        if upper < .5:
+            return WORSE
+        return UNDECIDED
+
+    def interval(self, wins, losses):
+        """Returns the Wilson interval of the win rate.
+        """
+
+        return wilson_interval(wins, wins + losses, self.confidence)
+
+
+class BayesTest:
+    """Decides once the win rate is above or below one half with high
+    posterior probability.
+
+    Attributes:
+        threshold: The posterior probability required to decide.
+        min_games: The decided games required before deciding.
+    """
+
+    def __init__(self, threshold=.99, min_games=50):
+        self.threshold = threshold
+        self.min_games = min_games
+
+    def decide(self, wins, losses):
+        """Returns BETTER, WORSE or UNDECIDED.
+        """
+
+        if wins + losses < self.min_games:
+            return UNDECIDED
+        better = prob_better(wins, losses)
+        if better >= self.threshold:
+            return BETTER
+        if better <= 1 - self.threshold:
+            return WORSE
+        return UNDECIDED
+
+    def interval(self, wins, losses):
+        """Returns the credible interval of the win rate.
+        """
+
+        return beta_interval(wins, losses, self.threshold)
+
+
+# Test name to its class.
+TESTS = {
+    'sprt': SPRT,
+    'wilson': WilsonTest,
+    'bayes': BayesTest,
+}
+
+
+class Comparison(namedtuple('Comparison', ['pair', 'cell', 'games', 'wins', 'losses', 'stopped', 'decision',
+                                           'interval'])):
+    """The outcome of compare.
+
+    Attributes:
+        pair: The two strategy names.
+        cell: The (shed, play) parameters of 'ai' seats.
+        games: The number of games played.
+        wins: The number of seat 0 wins.
+        losses: The number of seat 1 wins.
+        stopped: The number of games stopped at the turn limit.
+        decision: BETTER, WORSE or UNDECIDED for seat 0.
+        interval: The interval of the seat 0 win rate from the test.
+    """
+
+    __slots__ = ()
+
+
+def compare(pair, cell, test, seed, block_size=50, max_games=2000, engine='batch'):
+    """Plays a strategy pair in blocks until the test decides.
+
+    Block b is block b of the seed's DealStream, so every cell compared
+    with the same seed plays the same deals in the same order.
+
+    Args:
+        pair: Two strategy names from tournament.STRATEGIES.
+        cell: The (shed, play) parameters for 'ai' seats.
+        test: An SPRT, WilsonTest or BayesTest.
+        seed: The root seed of the DealStream.
+        block_size: The number of games between tests.
+        max_games: The game budget, after which the comparison is undecided.
+        engine: 'batch' or 'game', as in tournament.play_unit.
+
+    Returns:
+        A Comparison.
+    """
+
+    games = wins = losses = stopped = 0
+    decision = UNDECIDED
+    block_index = 0
+    while games < max_games:
+        result = play_unit(tuple(pair), cell, seed, block_index, block_size, engine)
+        block_index += 1
+        games += result['games']
+        wins += result['wins'][0]
+        losses += result['wins'][1]
+        stopped += result['stopped']
+        decision = test.decide(wins, losses)
+        if decision != UNDECIDED:
+            break
+
+    return Comparison(tuple(pair), cell, games, wins, losses, stopped, decision, test.interval(wins, losses))
+
+
+def main(pair, grid, test_name, seed, block_size, max_games, engine):
+    """The main function for the evaluation module.
+
+    Compares every (shed, play) cell of the grid and prints the decision,
+    interval and games played per cell, then the games saved against
+    playing max_games everywhere.
+
+    Args:
+        pair: Two strategy names, 'ai' seats take the grid cell.
+        grid: The number of steps per axis of the (shed, play) grid.
+        test_name: A name from TESTS.
+        seed: The root seed, a random one by default.
+        block_size: The number of games between tests.
+        max_games: The game budget per cell.
+        engine: 'batch' or 'game'.
+    """
+
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    print('seed: ' + str(seed))
+    test = TESTS[test_name]()
+    cells = [(shed / grid, play / grid) for shed in range(grid) for play in range(grid)] if 'ai' in pair else [()]
+
+    total = 0
+    best = None
+    for cell in cells:
+        comparison = compare(pair, cell, test, seed, block_size, max_games, engine)
+        total += comparison.games
+        decided = comparison.wins + comparison.losses
+        rate = float(comparison.wins) / decided if decided else .5
+        print(':'.join(pair) + ' ' + str(cell) + ' ' + DECISIONS[comparison.decision] + ' after '
+              + str(comparison.games) + ' games, win rate ' + '{:.3f}'.format(rate) + ' in '
+              + '[{:.3f}, {:.3f}]'.format(*comparison.interval) + ' stopped: ' + str(comparison.stopped))
+        if best is None or rate > best[0]:
+            best = (rate, cell)
+
+    print('games: ' + str(total) + ' of ' + str(len(cells) * max_games) + ' for a fixed budget')
+    print('best: ' + str(best))
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description="Compare Durak strategies with sequential tests.")
+    PARSER.add_argument('--pair', type=str, default='ai:s0', required=False,
+                        help="seat0:seat1 strategy names from " + ', '.join(STRATEGIES))
+    PARSER.add_argument('--grid', type=int, default=10, required=False)
+    PARSER.add_argument('--test', type=str, default='sprt', choices=list(TESTS), required=False)
+    PARSER.add_argument('--seed', type=int, default=None, required=False)
+    PARSER.add_argument('--block-size', type=int, default=50, required=False)
+    PARSER.add_argument('--max-games', type=int, default=2000, required=False)
+    PARSER.add_argument('--engine', type=str, default='batch', choices=['batch', 'game'], required=False)
+    ARGS = PARSER.parse_args()
+
+    main(ARGS.pair.split(':'), ARGS.grid, ARGS.test, ARGS.seed, ARGS.block_size, ARGS.max_games, ARGS.engine)
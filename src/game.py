@@ -4,10 +4,18 @@ Mostly used for playing bots against each other and developing strategies.
 """
 
 import logging
+from collections import namedtuple
+from time import perf_counter
 
-from card import CARD_COMPARATORS, RANK_NUM
-from deck import Deck
+# pylint: disable=import-error
+import numpy as np
+
+from bitboard import count, to_mask
+from card import CARD_COMPARATORS
+from deck import DealStream, Deck, mirror_deal
+from knowledge import Tracker
 from player import Player
+from record import GAME
 from strategy import Attack, Defense, S0, S1, S2, StratAI
 
 
@@ -23,6 +31,117 @@ def pad_after(input_str):
     return input_str + ' ' * (15 - len(input_str))
 
 
+class GameState(namedtuple('GameState', ['hands', 'hand_masks', 'deck', 'deck_mask', 'out_pile', 'out_mask', 'attacker', 'turns',
+                                         'knowledge'], defaults=(None,))):
+    """An immutable snapshot of a Game between turns.
+
+    turn2 plays a whole turn at once, so the table and ranks are always empty
+    between turns and are not stored. Cards are shared with the game, only
+    the tuples holding them are new, so a snapshot costs a few small copies.
+
+    Attributes:
+        hands: A tuple of each player's hand, in hand order.
+        hand_masks: The bitboard of each player's hand.
+        deck: The cards of the deck from bottom to top.
+        deck_mask: Bitboard of the deck.
+        out_pile: The cards that are out of the game.
+        out_mask: Bitboard of the out pile.
+        attacker: The index of the attacking player.
+        turns: A count of turns that have passed.
+        knowledge: A copy of the game's Tracker, or None to rebuild one
+            from the hands and out pile, forgetting what was picked up.
+    """
+
+    __slots__ = ()
+
+
+class GameProfiler:
+    """Cumulative time and call counts of the parts of Game turns.
+
+    A Game given a GameProfiler times every phase of its turns, every
+    strategy decision and its invariant checks, and counts games and turns.
+    Phase times include the decisions and checks made during the phase.
+    Without a profiler, Game only pays a None check per phase.
+
+    Attributes:
+        seconds: Cumulative seconds per name of PARTS.
+        calls: Call count per name of PARTS.
+        games: The number of games played to the end or stopped.
+        stopped: The number of games stopped at the turn limit.
+        turns: The sum of turns over those games.
+    """
+
+    PARTS = ('phase.lead', 'phase.pass', 'phase.defense', 'phase.shed', 'phase.resolve', 'phase.draw',
+             'strategy.attack', 'strategy.defend', 'strategy.shed', 'check.table', 'check.verify_hand')
+
+    def __init__(self):
+        self.seconds = None
+        self.calls = None
+        self.games = 0
+        self.stopped = 0
+        self.turns = 0
+        self.reset()
+
+    def reset(self):
+        """Clears every time and count.
+        """
+
+        self.seconds = dict.fromkeys(self.PARTS, 0.)
+        self.calls = dict.fromkeys(self.PARTS, 0)
+        self.games = 0
+        self.stopped = 0
+        self.turns = 0
+
+    def lap(self, name, start):
+        """Adds the time since start to a part.
+
+        Args:
+            name: The name of the part.
+            start: The perf_counter value the part started at.
+
+        Returns:
+            The current perf_counter value, the start of the next part.
+        """
+
+        now = perf_counter()
+        self.seconds[name] += now - start
+        self.calls[name] += 1
+        return now
+
+    def end_game(self, turns, stopped):
+        """Counts a finished or stopped game.
+        """
+
+        self.games += 1
+        self.stopped += stopped
+        self.turns += turns
+
+    def snapshot(self):
+        """Returns a copy of the data as a dict.
+
+        Returns:
+            A dict of the games, stopped games, turns, turns per game, and
+            per part its seconds, calls and microseconds per call.
+        """
+
+        return {
+            'games': self.games,
+            'stopped': self.stopped,
+            'turns': self.turns,
+            'turns_per_game': float(self.turns) / self.games if self.games else 0.,
+            'parts': {name: {'seconds': self.seconds[name], 'calls': self.calls[name],
+                             'us_per_call': self.seconds[name] / self.calls[name] * 1e6 if self.calls[name] else 0.}
+                      for name in self.PARTS},
+        }
+
+    def __str__(self):
+        lines = ['games: ' + str(self.games) + ' stopped: ' + str(self.stopped) + ' turns: ' + str(self.turns)]
+        for name, part in self.snapshot()['parts'].items():
+            lines.append('{:20} {:10.4f} s {:10} calls {:10.2f} us/call'.format(name, part['seconds'], part['calls'],
+                                                                             part['us_per_call']))
+        return '\n'.join(lines)
+
+
 class Game:
     """Represents a game.
 
@@ -34,9 +153,14 @@ class Game:
         turns: A count of turns that have passed.
         table: The cards on the table.
         attacker: The player that is attacking.
+        out_pile: The cards that are out of the game.
+        out_mask: Bitboard of the out pile.
+        knowledge: The knowledge.Tracker of what each player has seen.
+        recorder: The record.RecordWriter fed every decision, or None.
+        profiler: The GameProfiler timing every turn, or None.
     """
 
-    def __init__(self, strategies, print_trace):
+    def __init__(self, strategies, print_trace, deal=None, recorder=None, profiler=None):
         """Inits Game with strategy and print trace data.
 
         Deal 6 to each.
@@ -45,13 +169,23 @@ class Game:
         Args:
             strategies: Contains the instantiated strategies for the players.
             print_trace: Whether or not to print a human readable trace.
+            deal: Optional deck order of card ids, such as DealStream.deal(i),
+                to replay a given game. The deck is shuffled randomly otherwise.
+            recorder: Optional record.RecordWriter fed every decision.
+            profiler: Optional GameProfiler timing every turn.
         """
 
         self.print_trace = print_trace
-        deck = Deck()
-        deck.shuffle_deck()
+        deck = Deck(deal)
+        if deal is None:
+            deck.shuffle_deck()
         self.deck = deck
+        self.recorder = recorder
+        self.profiler = profiler
+        if recorder is not None:
+            order = [card.id for card in deck.cards]
         self.out_pile = []
+        self.out_mask = 0
 
         if len(strategies) == 0:
             raise RuntimeError("Number of players is 0!")
@@ -82,15 +216,61 @@ class Game:
             player.dank = self.dank
             player.sort()
             for card in player.hand:
-                if card.suit == self.dank and RANK_NUM[card.rank] < min_rank:
+                if card.suit == self.dank and card.rank_num < min_rank:
                     min_start = (player.num, card)
-                    min_rank = RANK_NUM[card.rank]
+                    min_rank = card.rank_num
         if min_start is not None:
             self.attacker = min_start[0]
+        self.knowledge = Tracker([player.hand_mask for player in self.players], self.table_card)
+
+        for player in self.players:
+            player.strategy.watch(self, player.num)
+        if recorder is not None:
+            recorder.start(GAME, order, strategies, self.attacker)
 
         self.game_started = False
         self.state = None
 
+    def snapshot(self):
+        """Captures the state of the game between turns.
+
+        Returns:
+            A GameState that restore can return to any number of times.
+        """
+
+        return GameState(
+            tuple(tuple(player.hand) for player in self.players),
+            tuple(player.hand_mask for player in self.players),
+            tuple(self.deck.cards),
+            self.deck.mask,
+            tuple(self.out_pile),
+            self.out_mask,
+            self.attacker,
+            self.turns,
+            self.knowledge.copy(),
+        )
+
+    def restore(self, state):
+        """Returns the game to a snapshot taken by this game or a copy of it.
+
+        Args:
+            state: The GameState to restore.
+        """
+
+        for player, hand, hand_mask in zip(self.players, state.hands, state.hand_masks):
+            player.hand = list(hand)
+            player.hand_mask = hand_mask
+        self.deck.cards = list(state.deck)
+        self.deck.mask = state.deck_mask
+        self.out_pile = list(state.out_pile)
+        self.out_mask = state.out_mask
+        self.attacker = state.attacker
+        self.turns = state.turns
+        if state.knowledge is None:
+            self.knowledge = Tracker(state.hand_masks, self.table_card if state.deck else None, state.out_mask)
+        else:
+            self.knowledge = state.knowledge.copy()
+
     def add_mod(self, start, offset):
         """Returns the player that is offset after the start.
 
@@ -116,6 +296,20 @@ class Game:
         next_player = self.players[self.add_mod(self.attacker, 2)]
         return attacker, defender, next_player
 
+    def draw_up(self, player):
+        """Draws a player's hand up to 6 cards, or until the deck runs out.
+
+        Args:
+            player: The player drawing.
+        """
+
+        for _ in range(6 - len(player)):
+            card = self.deck.draw()
+            if card is None:
+                return
+            player.take(card)
+            self.knowledge.draw(player.num, card)
+
     def inc_attacker(self, increment):
         """Updates the attacker value mod number of players.
 
@@ -125,11 +319,25 @@ class Game:
 
         self.attacker = (self.attacker + increment) % len(self.players)
 
-    def play(self):
+    def play(self, max_turns=None):
         """Begins and runs the game.
+
+        Args:
+            max_turns: Optional turn limit. Deterministic strategies can pass
+                the same cards back and forth forever, so a game still running
+                after max_turns is stopped and None is returned.
+
+        Returns:
+            The winning player, or None for a stopped game.
         """
 
         while True:
+            if max_turns is not None and self.turns >= max_turns:
+                if self.recorder is not None:
+                    self.recorder.end(None, self.turns)
+                if self.profiler is not None:
+                    self.profiler.end_game(self.turns, True)
+                return None
             if self.print_trace:
                 print('====== Turn ' + str(self.turns) + '===========')
                 print('Dank: ' + self.dank, ' Deck: ' + str(len(self.deck)))
@@ -147,6 +355,10 @@ class Game:
 
         if self.print_trace:
             print('Player ' + str(winning_player.num) + ' has won!')
+        if self.recorder is not None:
+            self.recorder.end(winning_player.num, self.turns)
+        if self.profiler is not None:
+            self.profiler.end_game(self.turns, False)
 
         return winning_player
 
@@ -154,17 +366,27 @@ class Game:
         """Turn reflecting a guaranteed 2 person game.
         """
 
+        profiler = self.profiler
+        if profiler is not None:
+            start = perf_counter()
         ranks = {}
 
-        attacker, defender, next_player = self.get_players()
+        attacker, defender, _ = self.get_players()
         table = []
+        if profiler is not None:
+            mark = perf_counter()
         atk = attacker.attack(table, ranks)
+        if profiler is not None:
+            profiler.lap('strategy.attack', mark)
+        if self.recorder is not None:
+            self.recorder.attack(atk)
 
         # It definitely does, this is to catch errors.
         if atk[0] != Attack.play:
             raise RuntimeError("Atk[0] != Attack.play, bot is attacking at start.")
 
         table.append(atk[1])
+        self.knowledge.play(attacker.num, table)
 
         logging.debug("%s", self.dank)
         logging.debug("%s", attacker)
@@ -172,82 +394,169 @@ class Game:
         logging.debug("%s", defender)
         logging.debug("%s", self.dank)
 
+        if profiler is not None:
+            profiler.lap('phase.lead', start)
+        return self.resume_turn(table, ranks, 'pass', 0)
+
+    def resume_turn(self, table, ranks, phase, attack_count):
+        """Plays the rest of a turn from one of its decision points.
+
+        turn2 enters at the pass phase after the first attack. Search based
+        strategies enter wherever they were asked to decide, on a copy of the
+        game, to play the turn out.
+
+        Args:
+            table: The cards on the table, updated in place.
+            ranks: The ranks of passed and defending cards, updated in place.
+            phase: 'pass' when the defender answers the whole table and may
+                pass, 'defend' when the defender answers the last attack of
+                the defense phase, 'attack' when the attacker may attack
+                again and 'shed' when the defender has taken.
+            attack_count: Count of passes and attacks after the first.
+
+        Returns:
+            The winning player, or None if the game goes on.
+        """
+
+        profiler = self.profiler
+        if profiler is not None:
+            start = perf_counter()
+        knowledge = self.knowledge
+        attacker, defender, next_player = self.get_players()
+        take = phase == 'shed'
+        done = False
+
         # Pass phase.
-        pass_count = 0
-        attack_count = 0
+        if phase == 'pass':
+            pass_count = 0
+            while True:
+                pass_is_legal = (len(next_player) >= len(table) + 1)
+                if profiler is not None:
+                    mark = perf_counter()
+                defense = defender.defend(table, pass_is_legal, len(table))
+                if profiler is not None:
+                    profiler.lap('strategy.defend', mark)
+                if self.recorder is not None:
+                    self.recorder.defend(defense)
+                if defense[1]:
+                    knowledge.play(defender.num, defense[1])
+                if defense[0] == Defense.pass_to:
+                    if self.print_trace:
+                        print('Player ' + str(defender.num) + ' Passes with: ' + str(defense[1][0]))
+                    pass_count += 1
+                    attack_count += 1
+                    self.inc_attacker(1)
+                    attacker, defender, next_player = self.get_players()
+                    table += defense[1]
+                    ranks.update({x.rank: 0 for x in defense[1]})
+                    continue
 
-        while True:
-            pass_is_legal = (len(next_player) >= len(table) + 1)
-            defense = defender.defend(table, pass_is_legal, len(table))
-            if defense[0] == Defense.pass_to:
+                if defense[0] == Defense.take:
+                    take = True
+                    break
+
+                if defense[0] == Defense.defend:
+                    if self.print_trace:
+                        print('Player ' + str(defender.num) + ' defends with ' + ', '.join([str(x) for x in defense[1]]))
+                    table += defense[1]
+                    ranks.update({x.rank: 0 for x in defense[1]})
+                    break
+
+            if pass_count > 3:
+                raise RuntimeError("Bug in game.turn, pass_count > 3")
+            phase = 'attack'
+            if profiler is not None:
+                start = profiler.lap('phase.pass', start)
+
+        # Defense phase.
+        while not take:
+            if phase == 'attack':
+                # Loops until table reaches 12 (fully attacked) or len(defender) == 0 (defender is out of cards).
+                if not (attack_count < 6 and len(defender) > 0 and len(attacker) > 0 and len(table) < 12):
+                    break
+                if profiler is not None:
+                    mark = perf_counter()
+                atk = attacker.attack(table, ranks)
+                if profiler is not None:
+                    profiler.lap('strategy.attack', mark)
+                if self.recorder is not None:
+                    self.recorder.attack(atk)
+                if atk[0] != Attack.play:
+                    # Attacker is done, drop to the end of turn.
+                    done = True
+                    break
                 if self.print_trace:
-                    print('Player ' + str(defender.num) + ' Passes with: ' + str(defense[1][0]))
-                pass_count += 1
+                    print('Player ' + str(attacker.num) + ' Attacks with: ' + str(atk[1]))
                 attack_count += 1
-                self.inc_attacker(1)
-                attacker, defender, next_player = self.get_players()
+                table.append(atk[1])
+                knowledge.play(attacker.num, (atk[1],))
+
+            # Defender must defend then try again until defender takes or player is done.
+            if profiler is not None:
+                mark = perf_counter()
+            defense = defender.defend(table, False, 1)
+            if profiler is not None:
+                profiler.lap('strategy.defend', mark)
+            if self.recorder is not None:
+                self.recorder.defend(defense)
+            phase = 'attack'
+            if defense[0] == Defense.defend:
+                knowledge.play(defender.num, defense[1])
+                # Attack-defense continues until one gives up or cards have reached min(6, len(defender)).
                 table += defense[1]
                 ranks.update({x.rank: 0 for x in defense[1]})
-                continue
-
-            if defense[0] == Defense.take:
-                break
-
-            if defense[0] == Defense.defend:
                 if self.print_trace:
                     print('Player ' + str(defender.num) + ' defends with ' + ', '.join([str(x) for x in defense[1]]))
-                table += defense[1]
-                ranks.update({x.rank: 0 for x in defense[1]})
-                break
+                continue
 
-        if pass_count > 3:
-            raise RuntimeError("Bug in game.turn, pass_count > 3")
+            if defense[0] == Defense.take:
+                # Break out and drop to shed phase.
+                take = True
 
-        # Defense phase.
-        # Used to check for 2 passes in a row.
-        attacker, defender, next_player = self.get_players()
-        if defense[0] != Defense.take:
-            while attack_count < 6 and len(defender) > 0 and len(attacker) > 0 and len(table) < 12:
-                # Loops until table reaches 12 (fully attacked) or len(defender) == 0 (defender is out of cards).
-                atk = attacker.attack(table, ranks)
-                if atk[0] == Attack.play:
-                    if self.print_trace:
-                        print('Player ' + str(attacker.num) + ' Attacks with: ' + str(atk[1]))
-                    attack_count += 1
-                    # Defender must defend then try again until defender takes or player is done.
-                    table.append(atk[1])
-                    defense = defender.defend(table, False, 1)
-                    if defense[0] == Defense.defend:
-                        # Attack-defense continues until one gives up or cards have reached min(6, len(defender)).
-                        table += defense[1]
-                        ranks.update({x.rank: 0 for x in defense[1]})
-                        if self.print_trace:
-                            print('Player ' + str(defender.num) + ' defends with ' + ', '.join([str(x) for x in defense[1]]))
-                        continue
-
-                    if defense[0] == Defense.take:
-                        # Break out and drop to shed phase.
-                        break
+        if profiler is not None:
+            start = profiler.lap('phase.defense', start)
 
         # Shed phase.
-        if defense[0] == Defense.take:
+        if take:
+            if profiler is not None:
+                mark = perf_counter()
             shed = attacker.shed(table, min((6 - attack_count, len(defender))), ranks)
+            if profiler is not None:
+                profiler.lap('strategy.shed', mark)
+            if self.recorder is not None:
+                self.recorder.shed(shed)
             if self.print_trace:
                 print('Player ' + str(attacker.num) + ' sheds: ' + ', '.join([str(x) for x in shed]))
             table += shed
+            table_mask = to_mask(table)
             defender.take_table(table)
+            knowledge.play(attacker.num, shed)
+            knowledge.take(defender.num)
             if self.print_trace:
                 print('Player : ' + str(defender.num) + ' picks up: ' + ', '.join([str(x) for x in table]))
-            if len(table) > len(set(table)):
+            if profiler is not None:
+                mark = perf_counter()
+            if len(table) > count(table_mask):
                 logging.debug([str(x) for x in table])
                 raise RuntimeError('ERROR: Duplicates in the table')
-        elif atk[0] == Attack.done or len(table) == 12:
+            if profiler is not None:
+                profiler.lap('check.table', mark)
+                start = profiler.lap('phase.shed', start)
+        elif done or len(table) == 12:
             if self.print_trace:
                 print('Player ' + str(attacker.num) + ' has ceased attack')
-            self.out_pile += table
-            if len(table) > len(set(table)):
+            if profiler is not None:
+                mark = perf_counter()
+            table_mask = to_mask(table)
+            if len(table) > count(table_mask):
                 logging.debug([str(x) for x in table])
                 raise RuntimeError('ERROR: Duplicates in the table')
+            if self.out_mask & table_mask:
+                raise RuntimeError('Out pile has duplicates.')
+            if profiler is not None:
+                profiler.lap('check.table', mark)
+            self.out_pile += table
+            self.out_mask |= table_mask
 
         elif len(attacker) == 0:
             logging.info('attacker')
@@ -263,46 +572,52 @@ class Game:
             logging.debug('table size %s', str(len(table)))
             logging.debug(str(len(attacker)))
             logging.debug(str(len(defender)))
-            logging.debug(str(atk))
-            logging.debug(str(defense))
             raise RuntimeError("Not a defense or done.")
 
+        if not take:
+            # Ceased attacks go out, a turn ended by an empty hand leaves its table behind, out of play all the same.
+            knowledge.out()
         del table
         del ranks
 
+        if profiler is not None:
+            if not take:
+                start = profiler.lap('phase.resolve', start)
+            mark = start
         for player in self.players:
             if not player.verify_hand():
                 raise RuntimeError("Player {} has duplicate cards".format(str(player.num)))
-
-        if len(self.out_pile) > len(set(self.out_pile)):
-            raise RuntimeError('Out pile has duplicates.')
+        if profiler is not None:
+            start = profiler.lap('check.verify_hand', mark)
 
         # Draw: Win condition.
         # Player is definitely a winner if, after drawing, they have zero cards.
         # Attacker draws first, so if deck empties then defender wins.
         # Payer draws up to 6 cards.
 
-        if len(attacker) < 6:
-            for _ in range(6 - len(attacker)):
-                attacker.take(self.deck.draw())
+        self.draw_up(attacker)
 
         if len(attacker) == 0:
             # Attacker has won.
+            if profiler is not None:
+                profiler.lap('phase.draw', start)
             return attacker
 
-        if len(defender) < 6:
-            for _ in range(6 - len(defender)):
-                defender.take(self.deck.draw())
+        self.draw_up(defender)
 
         if len(defender) == 0:
             # Defender has won.
+            if profiler is not None:
+                profiler.lap('phase.draw', start)
             return defender
 
-        if defense[0] == Defense.take:
+        if take:
             self.inc_attacker(2)
         else:
             self.inc_attacker(1)
 
+        if profiler is not None:
+            profiler.lap('phase.draw', start)
         return None
 
     def print_hands(self):
@@ -319,26 +634,64 @@ class Game:
         print(out)
 
 
-def main():
+def play_duplicate(strategies, deal, max_turns=None):
+    """Plays a deal twice, the second time with the two hands swapped.
+
+    Each strategy plays both hands of the deal, so the luck of the deal
+    mostly cancels out of the pair of results.
+
+    Args:
+        strategies: The instantiated strategies of the two players.
+        deal: Card ids from the bottom of the deck to the top.
+        max_turns: Optional turn limit of each game, as in Game.play.
+
+    Returns:
+        A (winner, turns) pair per game: the winning player, or None for a
+        stopped game, and the turns the game took.
+    """
+
+    ret = []
+    for cards in (deal, mirror_deal(deal)):
+        game = Game(strategies, False, cards)
+        ret.append((game.play(max_turns), game.turns))
+    return ret
+
+
+def main(seed=None):
     """The main function for the game.
+
+    Every (shed, play) cell plays the same deals of one DealStream, each in
+    duplicate, so the cells are compared on equal card luck.
+
+    Args:
+        seed: The seed of the shared deals, a random one by default.
     """
 
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    print('seed: ' + str(seed))
+    deals = DealStream(seed)
     step = pow(10, -1)
     shed = 0.
     max_score = (0, 0)
     while shed < 1:
         play = 0
         while play < 1:
-            turns = []
             s0_wins = 0
             s1_wins = 0
             s2_wins = 0
             ai_wins = 0
             num_games = 100
-            for _ in range(num_games):
-                game = Game([StratAI(shed, play), S0()], False)
-                game_instance = game.play()
-                turns.append(float(game.turns))
+            winners = []
+            turns = []
+            for index in range(num_games // 2):
+                for game_instance, game_turns in play_duplicate([StratAI(shed, play), S0()], deals.deal(index), 200):
+                    winners.append(game_instance)
+                    if game_instance is not None:
+                        turns.append(float(game_turns))
+            for game_instance in winners:
+                if game_instance is None:
+                    continue
                 if isinstance(game_instance.strategy, S0):
                     s0_wins += 1
                 elif isinstance(game_instance.strategy, S1):
@@ -348,14 +701,16 @@ def main():
                 elif isinstance(game_instance.strategy, StratAI):
                     ai_wins += 1
 
-            print('Finished ' + str(num_games) + ' averaging ' + str(sum(turns) / len(turns)) + ' turns')
+            average = sum(turns) / len(turns) if turns else float('nan')
+            print('Finished ' + str(num_games) + ' averaging ' + str(average) + ' turns with '
+                  + str(winners.count(None)) + ' stopped')
             print('s0 wins: ' + str(s0_wins))
             print('s1 wins: ' + str(s1_wins))
             print('s2 wins: ' + str(s2_wins))
             print('ai_wins: ' + str(ai_wins))
-            print('ai_ratio: ' + str(float(ai_wins) / s0_wins))
+            test = float(ai_wins) / s0_wins if s0_wins else float('inf')
+            print('ai_ratio: ' + str(test))
 
-            test = (float(ai_wins) / s0_wins)
             if test > max_score[0]:
                 max_score = (test, (shed, play))
             play += step
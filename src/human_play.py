@@ -1,7 +1,7 @@
 """A module used to simulate Model interaction as a human.
 """
 
-from durak_env import CARD_TO_OBS, DurakEnv, OPTIONS_DICT
+from durak_env import DurakEnv, OPTIONS_DICT
 
 
 class HumanInterface:
@@ -82,7 +82,7 @@ class HumanInterface:
         try:
             card_index = int(move)
             if 0 <= card_index < len(self.hand):
-                card = CARD_TO_OBS[self.hand[card_index]]
+                card = self.hand[card_index].id
                 print('Pl')
                 print('playing ' + str(OPTIONS_DICT[card]))
                 return card
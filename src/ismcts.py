@@ -0,0 +1,406 @@
+"""An information set Monte Carlo tree search strategy.
+
+Contains the ISMCTS class, a Strategy that decides by sampling hands for the
+other player consistent with everything it has seen, playing each candidate
+move out on a copy of the game with the fast heuristics, and keeping the move
+that UCB1 visited the most.
+
+Game drives strategies through attack, defend and shed callbacks, so a copy
+of the game can only be resumed from the decision being searched, not paused
+at later ones. The tree is therefore one level deep: the root's moves, each
+evaluated over many determinized rollouts.
+"""
+
+import math
+import random
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from bitboard import FULL_MASK, count, from_mask, to_mask
+from card import CARD_COMPARATORS, CARDS
+from game import Game, GameState
+from strategy import Attack, Defense, S0, Strategy, defense_options, lowest_defense
+
+
+class InfoSet(namedtuple('InfoSet', [
+        'seat', 'attacker', 'hand', 'table', 'ranks', 'phase', 'attack_count', 'dank', 'table_card', 'deck_len',
+        'out_pile', 'known', 'opponent_len', 'turns'])):
+    """What the searching player knows at a decision.
+
+    Attributes:
+        seat: The ID of the searching player.
+        attacker: The ID of the attacking player.
+        hand: The searching player's hand.
+        table: The cards on the table.
+        ranks: The ranks of passed and defending cards.
+        phase: The Game.resume_turn phase of the decision, or 'lead'.
+        attack_count: Count of passes and attacks after the first.
+        dank: The suit of the Dank card.
+        table_card: The card at the bottom of the deck.
+        deck_len: The number of cards left in the deck.
+        out_pile: The cards that are out of the game.
+        known: Bitboard of cards known to be in the other player's hand.
+        opponent_len: The number of cards in the other player's hand.
+        turns: A count of turns that have passed.
+    """
+
+    __slots__ = ()
+
+
+def determinize(info, rng):
+    """Deals the unseen cards into a full game state consistent with info.
+
+    Args:
+        info: The InfoSet of the searching player.
+        rng: The random.Random to shuffle with.
+
+    Returns:
+        A GameState for a two player Game.
+    """
+
+    seen = to_mask(info.hand) | to_mask(info.table) | to_mask(info.out_pile)
+    bottom = info.table_card.bit if info.deck_len else 0
+    # With the deck gone, an unseen table card can only be in the other hand.
+    known = (info.known | (info.table_card.bit & ~bottom)) & ~seen
+    unseen = from_mask(FULL_MASK & ~(seen | known | bottom))
+    rng.shuffle(unseen)
+    need = info.opponent_len - count(known)
+
+    opponent = sorted(from_mask(known) + unseen[:need], key=CARD_COMPARATORS[info.dank])
+    # A turn ended by an empty hand leaves its table behind in Game, so some
+    # unseen cards may be in neither the other hand nor the deck.
+    deck = [info.table_card] + unseen[need:need + info.deck_len - 1] if bottom else []
+    hands = [None, None]
+    hands[info.seat] = info.hand
+    hands[1 - info.seat] = tuple(opponent)
+    return GameState(
+        tuple(hands),
+        tuple(to_mask(hand) for hand in hands),
+        tuple(deck),
+        to_mask(deck),
+        info.out_pile,
+        to_mask(info.out_pile),
+        info.attacker,
+        info.turns,
+    )
+
+
+def as_return(move):
+    """Converts a move to the return value of the strategy call it answers.
+
+    Args:
+        move: A (kind, cards) tuple, kind one of 'play', 'done', 'pass',
+            'defend', 'take' or 'shed'.
+
+    Returns:
+        What attack, defend or shed returns for the move.
+    """
+
+    kind, cards = move
+    if kind == 'play':
+        return Attack.play, cards[0]
+    if kind == 'done':
+        return Attack.done, None
+    if kind == 'pass':
+        return Defense.pass_to, list(cards)
+    if kind == 'defend':
+        return Defense.defend, list(cards)
+    if kind == 'take':
+        return Defense.take, None
+    return list(cards)
+
+
+class Scripted(Strategy):
+    """Plays a given move at its next decision, then follows a heuristic.
+
+    Attributes:
+        move: The move to play next, or None.
+        rollout: The strategy used after the move.
+    """
+
+    def __init__(self, rollout):
+        super().__init__()
+        self.move = None
+        self.rollout = rollout
+
+    def _play(self, hand):
+        """Removes the scripted move's cards from the hand and returns it.
+        """
+
+        move, self.move = self.move, None
+        for card in move[1]:
+            hand.remove(card)
+        return as_return(move)
+
+    def attack(self, hand, table, dank, ranks):
+        if self.move is None:
+            return self.rollout.attack(hand, table, dank, ranks)
+        return self._play(hand)
+
+    def defend(self, hand, table, dank, pass_is_legal, cards_to_defend):
+        if self.move is None:
+            return self.rollout.defend(hand, table, dank, pass_is_legal, cards_to_defend)
+        return self._play(hand)
+
+    def shed(self, hand, table, dank, max_shed_allowed, ranks):
+        if self.move is None:
+            return self.rollout.shed(hand, table, dank, max_shed_allowed, ranks)
+        return self._play(hand)
+
+
+def search(info, moves, playouts, time_limit, exploration, rollout, max_turns, seed):
+    """Runs UCB1 over the root moves on determinized rollouts.
+
+    A module level function so that it can run in worker processes.
+
+    Args:
+        info: The InfoSet of the searching player.
+        moves: The candidate moves.
+        playouts: The maximum number of rollouts, or None.
+        time_limit: The maximum number of seconds, or None.
+        exploration: The UCB1 exploration constant.
+        rollout: The strategy both players follow after the root move.
+        max_turns: Rollouts still running after this many turns are draws.
+        seed: Seed of the determinization random.Random.
+
+    Returns:
+        The visit count and total reward of each move.
+    """
+
+    rng = random.Random(seed)
+    scripted = Scripted(rollout)
+    strategies = [rollout, rollout]
+    strategies[info.seat] = scripted
+    # Any deal with the right table card works, restore replaces the rest.
+    game = Game(strategies, False, [info.table_card.id] + [card.id for card in CARDS if card is not info.table_card])
+
+    visits = [0] * len(moves)
+    rewards = [0.] * len(moves)
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    total = 0
+    while (playouts is None or total < playouts) and (deadline is None or time.perf_counter() < deadline):
+        if total < len(moves):
+            index = total
+        else:
+            log_total = math.log(total)
+            index = max(range(len(moves)),
+                        key=lambda i: rewards[i] / visits[i] + exploration * math.sqrt(log_total / visits[i]))
+
+        game.restore(determinize(info, rng))
+        scripted.move = moves[index]
+        if info.phase == 'lead':
+            winner = game.turn2()
+        else:
+            winner = game.resume_turn(list(info.table), dict.fromkeys(info.ranks, 0), info.phase, info.attack_count)
+        if winner is None:
+            game.turns += 1
+            winner = game.play(info.turns + max_turns)
+
+        if winner is None:
+            rewards[index] += .5
+        elif winner.num == info.seat:
+            rewards[index] += 1.
+        visits[index] += 1
+        total += 1
+
+    return visits, rewards
+
+
+class ISMCTS(Strategy):
+    """Strategy class that searches each decision with determinized rollouts.
+
+    Needs Game to call watch, so it only plays in Game, not in DurakEnv.
+
+    Attributes:
+        playouts: The maximum number of rollouts per decision, or None.
+        time_limit: The maximum number of seconds per decision, or None.
+        workers: The number of processes searching each decision in parallel.
+        rollout: The strategy both players follow in rollouts.
+        exploration: The UCB1 exploration constant.
+        max_turns: Rollouts still running after this many turns are draws.
+        rng: The random.Random seeding every search.
+        game: The Game being played.
+        num: The ID of the player using this strategy.
+        stats: The visits and rewards of the last searched decision.
+    """
+
+    def __init__(self, playouts=None, time_limit=.1, workers=1, rollout=None, exploration=math.sqrt(2), max_turns=100,
+                 seed=None):
+        """Inits ISMCTS.
+
+        Args:
+            playouts: The maximum number of rollouts per decision, split
+                between the workers, or None for no limit.
+            time_limit: The maximum number of seconds per decision, or None.
+            workers: The number of processes to search in, 1 to search in
+                this process.
+            rollout: The strategy both players follow in rollouts, S0 by
+                default.
+            exploration: The UCB1 exploration constant.
+            max_turns: Rollouts still running after this many turns are draws.
+            seed: Optional seed for reproducible searches under a playout
+                budget.
+        """
+
+        super().__init__()
+        if playouts is None and time_limit is None:
+            raise RuntimeError('ISMCTS needs a playout or time budget.')
+        self.playouts = playouts
+        self.time_limit = time_limit
+        self.workers = workers
+        self.rollout = S0() if rollout is None else rollout
+        self.exploration = exploration
+        self.max_turns = max_turns
+        self.rng = random.Random(seed)
+        self.game = None
+        self.num = None
+        self.stats = None
+        self._executor = None
+
+    def close(self):
+        """Shuts down the worker processes, if any were started.
+        """
+
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def watch(self, game, num):
+        self.game = game
+        self.num = num
+
+    def _info(self, hand, table, ranks, phase, attack_count):
+        """Builds the InfoSet of a decision from the watched game.
+        """
+
+        if self.game is None:
+            raise RuntimeError('ISMCTS only plays in a Game, which calls watch.')
+
+        game = self.game
+        return InfoSet(self.num, game.attacker, tuple(hand), tuple(table), tuple(ranks), phase, attack_count, game.dank,
+                       game.table_card, len(game.deck), tuple(game.out_pile),
+                       game.knowledge[self.num].known_opponent,
+                       len(game.players[1 - self.num]), game.turns)
+
+    def _decide(self, hand, moves, info):
+        """Searches the moves, then plays the most visited one.
+
+        Args:
+            hand: The list of cards in the player's hand.
+            moves: The candidate moves, never empty.
+            info: The InfoSet of the decision.
+
+        Returns:
+            The return value of the strategy call for the move.
+        """
+
+        if len(moves) == 1:
+            move = moves[0]
+        else:
+            if self.workers > 1:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(self.workers)
+                playouts = None if self.playouts is None else -(-self.playouts // self.workers)
+                futures = [self._executor.submit(search, info, moves, playouts, self.time_limit, self.exploration,
+                                                 self.rollout, self.max_turns, self.rng.getrandbits(64))
+                           for _ in range(self.workers)]
+                visits = [0] * len(moves)
+                rewards = [0.] * len(moves)
+                for future in futures:
+                    result = future.result()
+                    visits = [x + y for x, y in zip(visits, result[0])]
+                    rewards = [x + y for x, y in zip(rewards, result[1])]
+            else:
+                visits, rewards = search(info, moves, self.playouts, self.time_limit, self.exploration, self.rollout,
+                                         self.max_turns, self.rng.getrandbits(64))
+            self.stats = (visits, rewards)
+            move = moves[max(range(len(moves)), key=visits.__getitem__)]
+
+        for card in move[1]:
+            hand.remove(card)
+        return as_return(move)
+
+    def attack(self, hand, table, dank, ranks):
+        """Searches the lead or a follow up attack.
+
+        Args:
+            hand: The list of cards in the player's hand.
+            table: The cards on the table.
+            dank: The suit of the Dank card.
+            ranks: The ranks of the cards on the table.
+
+        Returns:
+            Enumeration of what was done, a Card.
+        """
+
+        if len(table) == 0:
+            moves = [('play', (card,)) for card in hand]
+            return self._decide(hand, moves, self._info(hand, table, ranks, 'lead', 0))
+
+        moves = [('play', (card,)) for card in hand if card.rank in ranks] + [('done', ())]
+        # Every card is defended here, the table holds 2 per pass and attack.
+        return self._decide(hand, moves, self._info(hand, table, ranks, 'attack', len(table) // 2 - 1))
+
+    def defend(self, hand, table, dank, pass_is_legal, cards_to_defend):
+        """Searches passing, defending and taking.
+
+        When defending several cards after a pass, only the lowest defense
+        of each card is considered.
+
+        Args:
+            hand: The list of cards in the player's hand.
+            table: The cards on the table.
+            dank: The suit of the Dank card.
+            pass_is_legal: Whether or not a pass is legal.
+            cards_to_defend: The number of cards to defend against.
+
+        Returns:
+            Enumeration of what was done, a Card.
+        """
+
+        moves = [('take', ())]
+        if pass_is_legal:
+            moves += [('pass', (card,)) for card in hand if card.rank == table[-1].rank]
+
+        if cards_to_defend > 1:
+            rest = list(hand)
+            defense = []
+            for attack in table:
+                current_defense = lowest_defense(attack, rest, dank)
+                if current_defense is None:
+                    break
+                rest.remove(current_defense)
+                defense.append(current_defense)
+            else:
+                moves.append(('defend', tuple(defense)))
+        else:
+            moves += [('defend', (card,)) for card in defense_options(table[-1], hand, dank)]
+
+        # Defend is not given the ranks, but every card after the first attack
+        # is either ranked by Game or matches a rank that already is.
+        ranks = dict.fromkeys(card.rank for card in table[1:])
+        # The pass phase answers the whole table, the defense phase its last attack.
+        if cards_to_defend == len(table):
+            info = self._info(hand, table, ranks, 'pass', len(table) - 1)
+        else:
+            info = self._info(hand, table, ranks, 'defend', (len(table) + 1) // 2 - 1)
+        return self._decide(hand, moves, info)
+
+    def shed(self, hand, table, dank, max_shed_allowed, ranks):
+        """Searches how many of the lowest matching cards to shed.
+
+        Args:
+            hand: The list of cards in the player's hand.
+            table: The cards on the table.
+            dank: The suit of the Dank card.
+            max_shed_allowed: The maximum amount of cards to shed.
+            ranks: The ranks of the cards on the table.
+
+        Returns:
+            A list of cards to shed.
+        """
+
+        matches = [card for card in hand if card.rank in ranks]
+        moves = [('shed', tuple(matches[:size])) for size in range(min(max_shed_allowed, len(matches)) + 1)]
+        return self._decide(hand, moves, self._info(hand, table, ranks, 'shed', 6 - max_shed_allowed))
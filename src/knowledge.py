@@ -0,0 +1,228 @@
+"""Incrementally updated knowledge of where the cards of a game are.
+
+Contains the Knowledge class, what one seat has seen: its own hand, the
+table, the cards gone out of play, the cards it knows to be in another hand
+(picked up from the table, or the table card drawn from the bottom of the
+deck), and the cards it has never seen. Tracker holds the Knowledge of every
+seat of a game, and Game and DurakEnv feed it every draw, play, take and
+clear of the table, so strategies read card counts in O(1) instead of
+rebuilding them from the out pile at every decision.
+
+Every card is in exactly one of a seat's hand, table, gone, known_opponent,
+bottom and unseen bitboards.
+"""
+
+from bitboard import FULL_MASK, count, ids
+from card import CARDS, SUITS
+
+# SUIT_NUM_MASKS[suit_num] is the bitboard of every card of a suit.
+SUIT_NUM_MASKS = [sum(card.bit for card in CARDS if card.suit_num == suit_num) for suit_num in range(len(SUITS))]
+
+
+def suit_counts(mask):
+    """Counts the cards of a bitboard per suit.
+
+    Args:
+        mask: The bitboard.
+
+    Returns:
+        A list of the number of cards of each suit, by suit number.
+    """
+
+    return [count(mask & suit_mask) for suit_mask in SUIT_NUM_MASKS]
+
+
+class Knowledge:
+    """What one seat knows about where the cards are.
+
+    Attributes:
+        seat: The ID of the seat.
+        hand: Bitboard of the seat's own hand.
+        table: Bitboard of the cards on the table.
+        gone: Bitboard of the cards out of play: the out pile, and the table
+            left behind by a turn ended with an empty hand.
+        known_opponent: Bitboard of the cards known to be in another hand.
+        bottom: Bitboard of the table card while it is in the deck.
+        unseen: Bitboard of the cards the seat has not seen, each in the
+            deck or unknown in another hand.
+        unseen_suits: The number of unseen cards per suit number.
+        known_suits: The number of known_opponent cards per suit number.
+        gone_suits: The number of gone cards per suit number.
+    """
+
+    __slots__ = ('seat', 'hand', 'table', 'gone', 'known_opponent', 'bottom', 'unseen', 'unseen_suits', 'known_suits',
+                 'gone_suits')
+
+    def __init__(self, seat, hand, bottom=0, gone=0, known_opponent=0):
+        """Inits Knowledge from the state of a game between turns.
+
+        Args:
+            seat: The ID of the seat.
+            hand: Bitboard of the seat's hand.
+            bottom: Bitboard of the table card while it is in the deck.
+            gone: Bitboard of the cards out of play.
+            known_opponent: Bitboard of the cards known in another hand.
+        """
+
+        self.seat = seat
+        self.hand = hand
+        self.table = 0
+        self.gone = gone
+        self.known_opponent = known_opponent
+        self.bottom = bottom
+        self.unseen = FULL_MASK & ~(hand | gone | known_opponent | bottom)
+        self.unseen_suits = suit_counts(self.unseen)
+        self.known_suits = suit_counts(known_opponent)
+        self.gone_suits = suit_counts(gone)
+
+    def copy(self):
+        """Returns an independent copy.
+        """
+
+        ret = Knowledge.__new__(Knowledge)
+        for name in Knowledge.__slots__:
+            setattr(ret, name, getattr(self, name))
+        ret.unseen_suits = list(self.unseen_suits)
+        ret.known_suits = list(self.known_suits)
+        ret.gone_suits = list(self.gone_suits)
+        return ret
+
+    def possible_opponent(self):
+        """Returns the bitboard of the cards another hand may hold.
+        """
+
+        return self.known_opponent | self.unseen
+
+    def unknown_opponent(self, opponent_len):
+        """Returns the number of cards of another hand the seat has not seen.
+
+        Args:
+            opponent_len: The number of cards in the other hand.
+        """
+
+        return opponent_len - count(self.known_opponent)
+
+    def draw(self, card, own):
+        """Updates for a card drawn from the deck.
+
+        Args:
+            card: The card drawn.
+            own: Whether the seat drew it. Only the table card is known when
+                another seat draws.
+        """
+
+        bit = card.bit
+        if own:
+            if self.bottom & bit:
+                self.bottom = 0
+            else:
+                self.unseen &= ~bit
+                self.unseen_suits[card.suit_num] -= 1
+            self.hand |= bit
+        elif self.bottom & bit:
+            self.bottom = 0
+            self.known_opponent |= bit
+            self.known_suits[card.suit_num] += 1
+
+    def play(self, cards, own):
+        """Updates for cards put on the table.
+
+        Args:
+            cards: The cards played.
+            own: Whether the seat played them.
+        """
+
+        for card in cards:
+            bit = card.bit
+            if own:
+                self.hand &= ~bit
+            elif self.known_opponent & bit:
+                self.known_opponent &= ~bit
+                self.known_suits[card.suit_num] -= 1
+            else:
+                self.unseen &= ~bit
+                self.unseen_suits[card.suit_num] -= 1
+            self.table |= bit
+
+    def take(self, own):
+        """Updates for the table picked up.
+
+        Args:
+            own: Whether the seat picked it up.
+        """
+
+        if own:
+            self.hand |= self.table
+        else:
+            self.known_opponent |= self.table
+            for card_id in ids(self.table):
+                self.known_suits[CARDS[card_id].suit_num] += 1
+        self.table = 0
+
+    def out(self):
+        """Updates for the table going out of play.
+        """
+
+        self.gone |= self.table
+        for card_id in ids(self.table):
+            self.gone_suits[CARDS[card_id].suit_num] += 1
+        self.table = 0
+
+
+class Tracker:
+    """The Knowledge of every seat of a game, updated together.
+
+    Attributes:
+        seats: The Knowledge of each seat, by ID.
+    """
+
+    def __init__(self, hand_masks, table_card=None, gone=0):
+        """Inits Tracker from the state of a game between turns.
+
+        Args:
+            hand_masks: The bitboard of each seat's hand.
+            table_card: The table card while it is in the deck, else None.
+            gone: Bitboard of the cards out of play.
+        """
+
+        bottom = 0 if table_card is None else table_card.bit
+        self.seats = [Knowledge(seat, hand, bottom, gone) for seat, hand in enumerate(hand_masks)]
+
+    def __getitem__(self, seat):
+        return self.seats[seat]
+
+    def copy(self):
+        """Returns an independent copy.
+        """
+
+        ret = Tracker.__new__(Tracker)
+        ret.seats = [knowledge.copy() for knowledge in self.seats]
+        return ret
+
+    def draw(self, seat, card):
+        """A seat draws a card from the deck.
+        """
+
+        for knowledge in self.seats:
+            knowledge.draw(card, knowledge.seat == seat)
+
+    def play(self, seat, cards):
+        """A seat puts cards on the table.
+        """
+
+        for knowledge in self.seats:
+            knowledge.play(cards, knowledge.seat == seat)
+
+    def take(self, seat):
+        """A seat picks up the table.
+        """
+
+        for knowledge in self.seats:
+            knowledge.take(knowledge.seat == seat)
+
+    def out(self):
+        """The table goes out of play.
+        """
+
+        for knowledge in self.seats:
+            knowledge.out()
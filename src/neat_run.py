@@ -8,14 +8,18 @@ game until it reaches a completion state.
     Usage:
 
     python neat_run.py
-    python neat_run.py --config=FILEPATH --restore=FILEPATH
+    python neat_run.py --config=FILEPATH --restore=FILEPATH --seed=N
+    python neat_run.py --duplicate --games=10 --auto-play --macro-shed
 """
 
 import argparse
+import functools
 import os
 import random
 
 import neat
+# pylint: disable=import-error
+import numpy as np
 
 # pylint: disable=import-error
 from durak_env import DurakEnv
@@ -28,14 +32,32 @@ class Worker:
         genome: The genome to be tested.
         config: The configuration specifications for NEAT.
         env: The Durak environment.
+        num_games: The number of games per evaluation.
     """
 
-    def __init__(self, genome, config):
+    def __init__(self, genome, config, seed=None, duplicate=False, num_games=30, auto_play=False, macro_shed=False):
         """Inits a worker with a genome and the config.
+
+        Args:
+            genome: The genome to be tested.
+            config: The configuration specifications for NEAT.
+            seed: Optional deal stream seed; game i is then played on deal i.
+            duplicate: Whether to play every deal twice with the hands
+                swapped, which needs a seed.
+            num_games: The number of games per evaluation.
+            auto_play: Whether the environment plays forced moves itself, so
+                the network is only activated on real choices.
+            macro_shed: Whether the network sheds every card it rates above
+                .5 in a single step.
         """
         self.genome = genome
         self.config = config
         self.env = DurakEnv()
+        self.env.seed(seed)
+        self.env.duplicate = duplicate
+        self.env.auto_play = auto_play
+        self.env.macro_shed = macro_shed
+        self.num_games = num_games
         self.net = neat.nn.FeedForwardNetwork.create(self.genome, self.config)
 
     def work(self):
@@ -46,47 +68,44 @@ class Worker:
             the fitter it is and the more likely the genome is to reproduce.
         """
 
-        # Loads in a default Durak state.
-        self.env.reset()
-
-        # Takes the first step to get an observation ofn the current state.
-        observation, _, _, info = self.env.step(self.env.action_space.sample())
         total_reward = 0
-        done = False
-        reward = 0.
-        num_games = 30
-        # Loops through the game until the game is finished or the machine makes an unforgivable mistake.
+        num_games = self.num_games
         for _ in range(num_games):
-            while not done:
-                actions = self.net.activate(observation)
-                observation, reward, done, info = self.env.step(actions)
+            # Loads in a default Durak state, on the next deal when seeded.
+            self.env.reset()
+
+            # Plays the game through, the network choosing every move of the model.
+            reward, _, info = self.env.run_episode(self.net.activate)
 
             total_reward += reward
 
             if int(random.random() * 1000) == 1:
                 print(info, reward)
 
-            self.env.reset()
-
         return total_reward / num_games
 
 
-def eval_genomes(genome, config):
+def eval_genomes(genome, config, seed=None, duplicate=False, num_games=30, auto_play=False, macro_shed=False):
     """Evaluates the fitness of a genome by sending it to the worker.
 
     Args:
         genome: The genome to be tested.
         config: The configuration specifications for NEAT.
+        seed: Optional deal stream seed shared by every genome.
+        duplicate: Whether to play every deal twice with the hands swapped.
+        num_games: The number of games per genome.
+        auto_play: Whether the environment plays forced moves itself.
+        macro_shed: Whether a single step sheds a whole set of cards.
     Returns:
         A float that represents the fitness of a genome. The higher the number
         the fitter it is and the more likely the genome is to reproduce.
     """
 
-    worker = Worker(genome, config)
+    worker = Worker(genome, config, seed, duplicate, num_games, auto_play, macro_shed)
     return worker.work()
 
 
-def main(config_file, restore_file):
+def main(config_file, restore_file, seed=None, duplicate=False, num_games=30, auto_play=False, macro_shed=False):
     """The main function for the neat_run module.
 
     Loads in the NEAT configuration and creates the objects necessary for
@@ -95,8 +114,19 @@ def main(config_file, restore_file):
     Args:
         config_file: The location of the configuration file.
         restore_file: The location of the restore point file.
+        seed: Optional deal stream seed for reproducible evaluations.
+        duplicate: Whether genomes play every deal twice with the hands
+            swapped, on deals shared by every genome.
+        num_games: The number of games per genome.
+        auto_play: Whether the environment plays forced moves itself.
+        macro_shed: Whether a single step sheds a whole set of cards.
     """
 
+    if duplicate and seed is None:
+        # Duplicate deals are only comparable between genomes on a shared stream.
+        seed = np.random.SeedSequence().entropy
+        print('seed: ' + str(seed))
+
     # Loads configuration.
     config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet, neat.DefaultStagnation, config_file)
 
@@ -113,7 +143,9 @@ def main(config_file, restore_file):
     population.add_reporter(neat.Checkpointer(generation_interval=500, filename_prefix='../restores/neat-checkpoint-'))
 
     # Runs the learning in parallel.
-    evaluator = neat.ThreadedEvaluator(8, eval_genomes)
+    evaluator = neat.ThreadedEvaluator(8, functools.partial(eval_genomes, seed=seed, duplicate=duplicate,
+                                                            num_games=num_games, auto_play=auto_play,
+                                                            macro_shed=macro_shed))
     winner = population.run(evaluator.evaluate)
 
     print(winner)
@@ -124,6 +156,11 @@ if __name__ == '__main__':
     PARSER = argparse.ArgumentParser(description="Run NEAT on the Durak game.")
     PARSER.add_argument('--config', type=str, default="../config/.NEAT", required=False)
     PARSER.add_argument('--restore', type=str, default=None, required=False)
+    PARSER.add_argument('--seed', type=int, default=None, required=False)
+    PARSER.add_argument('--duplicate', action='store_true')
+    PARSER.add_argument('--games', type=int, default=30, required=False)
+    PARSER.add_argument('--auto-play', action='store_true')
+    PARSER.add_argument('--macro-shed', action='store_true')
     ARGS = PARSER.parse_args()
 
     LOCAL_DIR = os.path.dirname(__file__)
@@ -134,4 +171,4 @@ if __name__ == '__main__':
     else:
         RESTORE_PATH = os.path.normpath(os.path.join(LOCAL_DIR, "../restores/neat-checkpoint-" + str(ARGS.restore)))
 
-    main(CONFIG_PATH, RESTORE_PATH)
+    main(CONFIG_PATH, RESTORE_PATH, ARGS.seed, ARGS.duplicate, ARGS.games, ARGS.auto_play, ARGS.macro_shed)
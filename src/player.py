@@ -1,7 +1,11 @@
 """A module used to store classes related the the representation of a player.
 """
 
-from card import CARD_COMPARATORS
+from bisect import insort_right
+
+from bitboard import count, to_mask
+from card import CARD_COMPARATORS, CARDS
+from strategy import HandView, PureStrategy, from_decision
 
 
 class Player:
@@ -9,9 +13,15 @@ class Player:
 
     Attributes:
         hand: The list of cards in the player's hand.
+        hand_mask: Bitboard of the cards in the player's hand.
         num : The Player's ID.
         dank: The suit of the Dank card.
         strategy: The strategy the bot uses.
+        pure: Whether the strategy is a PureStrategy, whose decisions the
+            player applies to its hand itself, see apply.
+        hand_sorted: Whether the hand is in sort order, so that a drawn card
+            can be inserted in place. A hand dealt before the dank is known
+            stays in deal order until it is first sorted.
     """
 
     def __init__(self, num, strategy):
@@ -23,9 +33,12 @@ class Player:
         """
 
         self.hand = []
+        self.hand_mask = 0
         self.num = num
         self.dank = None
         self.strategy = strategy
+        self.pure = isinstance(strategy, PureStrategy)
+        self.hand_sorted = False
 
     def __len__(self):
         return len(self.hand)
@@ -39,8 +52,42 @@ class Player:
 
     def verify_hand(self):
         """Method to ensure that the hand contains 0 duplicates.
+
+        The strategies edit the hand list directly, so a duplicated or lost card
+        shows up as a mismatch between the list and the bitboard.
+        """
+        return len(self.hand) == count(self.hand_mask)
+
+    def apply(self, decision):
+        """Applies a decision of a PureStrategy to the hand.
+
+        The cards played are checked against hand_mask and cleared from it
+        first. A single card is then removed from the hand list directly, and
+        several are dropped in one pass that keeps the cards still in the
+        mask, which leaves the hand in order.
+
+        Args:
+            decision: The Decision.
+
+        Returns:
+            The decision in the return format of Strategy.
         """
-        return len(self.hand) == len(set(self.hand))
+
+        cards = [CARDS[card_id] for card_id in decision.cards]
+        if len(cards) == 1:
+            card = cards[0]
+            if not card.bit & self.hand_mask:
+                raise RuntimeError('Decision plays a card not in the hand of player ' + str(self.num))
+            self.hand_mask ^= card.bit
+            self.hand.remove(card)
+        elif cards:
+            played = to_mask(cards)
+            if played & ~self.hand_mask or len(cards) != count(played):
+                raise RuntimeError('Decision plays cards not in the hand of player ' + str(self.num))
+            self.hand_mask ^= played
+            mask = self.hand_mask
+            self.hand[:] = [card for card in self.hand if card.bit & mask]
+        return from_decision(decision, cards)
 
     def attack(self, table, ranks):
         """Does an attack action.
@@ -52,7 +99,12 @@ class Player:
         Returns:
             The return of the strategy's attack.
         """
-        return self.strategy.attack(self.hand, table, self.dank, ranks)
+        if self.pure:
+            return self.apply(self.strategy.decide_attack(HandView(self.hand, self.hand_mask), table, self.dank, ranks))
+        atk = self.strategy.attack(self.hand, table, self.dank, ranks)
+        if atk[1] is not None:
+            self.hand_mask &= ~atk[1].bit
+        return atk
 
     def defend(self, table, pass_is_legal, cards_to_defend):
         """Does a defense action.
@@ -66,13 +118,20 @@ class Player:
             The return of the strategy's defend.
         """
 
-        return self.strategy.defend(self.hand, table, self.dank, pass_is_legal, cards_to_defend)
+        if self.pure:
+            return self.apply(self.strategy.decide_defend(HandView(self.hand, self.hand_mask), table, self.dank,
+                                                          pass_is_legal, cards_to_defend))
+        defense = self.strategy.defend(self.hand, table, self.dank, pass_is_legal, cards_to_defend)
+        if defense[1]:
+            self.hand_mask &= ~to_mask(defense[1])
+        return defense
 
     def sort(self):
         """Sorts the player's hand.
         """
 
         self.hand.sort(key=CARD_COMPARATORS[self.dank])
+        self.hand_sorted = True
 
     def take(self, card):
         """Adds card to the player's hand.
@@ -82,20 +141,28 @@ class Player:
         """
 
         if card is not None:
+            self.hand_mask |= card.bit
+            if self.hand_sorted:
+                # Inserts in place so the hand stays sorted without a full sort per draw.
+                insort_right(self.hand, card, key=CARD_COMPARATORS[self.dank])
+                return
             self.hand.append(card)
-
-        if self.dank is not None:
-            # This might be more efficient than constantly iterating over hands over and over to find least valuable card.
+        if self.dank is not None and not self.hand_sorted:
+            # The first draw once the dank is known sorts the dealt hand.
             self.sort()
 
     def take_table(self, cards):
         """Adds cards to the player's hand.
 
+        A single sort on the integer key beats inserting up to 12 cards one at a
+        time, and also re-sorts cards a strategy appended back after a failed defense.
+
         Args:
             cards: The list of cards to add to the player's hand.
         """
 
         self.hand += cards
+        self.hand_mask |= to_mask(cards)
         self.sort()
 
     def shed(self, table, max_shed_allowed, ranks):
@@ -109,4 +176,9 @@ class Player:
         Returns:
             The return of the strategy's shed.
         """
-        return self.strategy.shed(self.hand, table, self.dank, max_shed_allowed, ranks)
+        if self.pure:
+            return self.apply(self.strategy.decide_shed(HandView(self.hand, self.hand_mask), table, self.dank,
+                                                        max_shed_allowed, ranks))
+        shed = self.strategy.shed(self.hand, table, self.dank, max_shed_allowed, ranks)
+        self.hand_mask &= ~to_mask(shed)
+        return shed
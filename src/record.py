@@ -0,0 +1,327 @@
+"""A compact binary record format for games.
+
+Contains the RecordWriter class, which Game and DurakEnv feed every decision
+of a game to and which writes one record per finished game to a binary
+stream, read_records, which reads them back, and replay, which plays a
+record through its engine again.
+
+A record is a fixed header, the strategy names, then one byte per action:
+
+    header   '<4sBBB16sq36sBH': magic, engine, first attacker, dank suit
+             index, seed (128 bit little endian to fit SeedSequence entropy,
+             NO_SEED if none), deal index (-1 if none), the deal as card ids
+             from the bottom of the deck, the number of strategies and the
+             number of actions
+    names    per strategy, a length byte and its utf-8 name
+    actions  a card id, DONE, TAKE, or PASS | card id for a pass
+    footer   '<BH': the winning seat (NO_WINNER if stopped) and turns
+
+An attack is a card or DONE, a defense is TAKE, a pass or its cards followed
+by DONE, and a shed is its cards followed by DONE.
+
+    Usage:
+
+    python record.py FILE
+"""
+
+import argparse
+import struct
+from collections import namedtuple
+
+from card import CARDS, SUITS
+from strategy import Attack, Defense, DONE, PASS, Strategy, TAKE
+
+MAGIC = b'DRK1'
+HEADER = struct.Struct('<4sBBB16sq36sBH')
+FOOTER = struct.Struct('<BH')
+
+# Engines.
+GAME = 0
+ENV = 1
+
+# Action bytes are card ids, DONE, TAKE and PASS | card id as in strategy.
+NO_WINNER = 0xff
+NO_SEED = b'\xff' * 16
+
+
+class Record(namedtuple('Record', ['engine', 'attacker', 'dank', 'seed', 'deal_index', 'deal', 'strategies', 'actions',
+                                   'winner', 'turns'])):
+    """A game read back from a record stream.
+
+    Attributes:
+        engine: GAME or ENV.
+        attacker: The seat that attacked first.
+        dank: The dank suit.
+        seed: The DealStream seed of the deal, or None.
+        deal_index: The index of the deal in its DealStream, or None.
+        deal: The card ids of the deck from bottom to top.
+        strategies: The name of each seat's strategy.
+        actions: The action bytes.
+        winner: The winning seat, or None for a stopped game.
+        turns: A count of turns that have passed.
+    """
+
+    __slots__ = ()
+
+
+def strategy_name(strategy):
+    """Returns the name a strategy is recorded under.
+
+    Args:
+        strategy: A Strategy, or a string naming a non Strategy seat.
+    """
+
+    if isinstance(strategy, str):
+        return strategy
+    name = type(strategy).__name__
+    if hasattr(strategy, 'shed_val'):
+        name += '(' + str(strategy.shed_val) + ',' + str(strategy.play_val) + ')'
+    return name
+
+
+class RecordWriter:
+    """Writes game records to a binary stream.
+
+    An engine given a RecordWriter calls start when the game is dealt, the
+    action methods after every decision, and end when the game is over,
+    which writes the whole record at once.
+
+    Attributes:
+        stream: The binary file object records are written to.
+        seed: The DealStream seed to record for the next game, or None.
+        deal_index: The deal index to record for the next game, or None.
+        games: The number of records written.
+    """
+
+    def __init__(self, stream):
+        """Inits RecordWriter.
+
+        Args:
+            stream: The binary file object records are written to.
+        """
+
+        self.stream = stream
+        self.seed = None
+        self.deal_index = None
+        self.games = 0
+        self._header = None
+        self._actions = bytearray()
+
+    def start(self, engine, deal, strategies, attacker):
+        """Starts the record of a game.
+
+        Args:
+            engine: GAME or ENV.
+            deal: The card ids of the deck from bottom to top, before dealing.
+            strategies: The Strategy, or name, of each seat.
+            attacker: The seat that attacks first.
+        """
+
+        names = b''
+        for strategy in strategies:
+            name = strategy_name(strategy).encode()
+            names += bytes([len(name)]) + name
+        dank = SUITS.index(CARDS[deal[0]].suit)
+        seed = NO_SEED if self.seed is None else self.seed.to_bytes(16, 'little')
+        deal_index = -1 if self.deal_index is None else self.deal_index
+        self._header = (engine, attacker, dank, seed, deal_index, bytes(deal), len(strategies), names)
+        self._actions = bytearray()
+
+    def action(self, code):
+        """Records a single action byte.
+        """
+
+        self._actions.append(code)
+
+    def attack(self, atk):
+        """Records the return of an attack.
+        """
+
+        self._actions.append(atk[1].id if atk[0] == Attack.play else DONE)
+
+    def defend(self, defense):
+        """Records the return of a defense.
+        """
+
+        if defense[0] == Defense.pass_to:
+            self._actions.append(PASS | defense[1][0].id)
+        elif defense[0] == Defense.defend:
+            self._actions.extend([card.id for card in defense[1]])
+            self._actions.append(DONE)
+        else:
+            self._actions.append(TAKE)
+
+    def shed(self, shed):
+        """Records the return of a shed.
+        """
+
+        self._actions.extend([card.id for card in shed])
+        self._actions.append(DONE)
+
+    def end(self, winner, turns):
+        """Writes the record of the game.
+
+        Args:
+            winner: The winning seat, or None for a stopped game.
+            turns: A count of turns that have passed.
+        """
+
+        engine, attacker, dank, seed, deal_index, deal, num_strategies, names = self._header
+        self.stream.write(HEADER.pack(MAGIC, engine, attacker, dank, seed, deal_index, deal, num_strategies,
+                                      len(self._actions))
+                          + names + self._actions + FOOTER.pack(NO_WINNER if winner is None else winner, turns))
+        self.games += 1
+        self._header = None
+
+
+def read_records(stream):
+    """Reads game records until the end of a binary stream.
+
+    Args:
+        stream: A binary file object positioned at the start of a record.
+
+    Yields:
+        A Record per game.
+    """
+
+    while True:
+        data = stream.read(HEADER.size)
+        if not data:
+            return
+        if len(data) < HEADER.size:
+            raise RuntimeError('Truncated record header.')
+        magic, engine, attacker, dank, seed, deal_index, deal, num_strategies, num_actions = HEADER.unpack(data)
+        if magic != MAGIC:
+            raise RuntimeError('Not a game record: {}'.format(magic))
+
+        strategies = []
+        for _ in range(num_strategies):
+            size = stream.read(1)[0]
+            strategies.append(stream.read(size).decode())
+        actions = stream.read(num_actions)
+        winner, turns = FOOTER.unpack(stream.read(FOOTER.size))
+        yield Record(engine, attacker, SUITS[dank], None if seed == NO_SEED else int.from_bytes(seed, 'little'),
+                     None if deal_index == -1 else deal_index, tuple(deal), tuple(strategies), actions,
+                     None if winner == NO_WINNER else winner, turns)
+
+
+class Replay(Strategy):
+    """Strategy class that plays the decisions of a record.
+
+    Every seat of a replayed game shares one iterator over the action bytes,
+    since the engine asks for decisions in the order they were recorded.
+
+    Attributes:
+        actions: The shared iterator over the action bytes.
+    """
+
+    def __init__(self, actions):
+        super().__init__()
+        self.actions = actions
+
+    def _card(self, hand, code):
+        """Removes the card of an action byte from the hand and returns it.
+        """
+
+        card = CARDS[code]
+        hand.remove(card)
+        return card
+
+    def attack(self, hand, table, dank, ranks):
+        code = next(self.actions)
+        if code == DONE:
+            return Attack.done, None
+        return Attack.play, self._card(hand, code)
+
+    def defend(self, hand, table, dank, pass_is_legal, cards_to_defend):
+        code = next(self.actions)
+        if code == TAKE:
+            return Defense.take, None
+        if code & PASS:
+            return Defense.pass_to, [self._card(hand, code & ~PASS)]
+        defense = []
+        while code != DONE:
+            defense.append(self._card(hand, code))
+            code = next(self.actions)
+        return Defense.defend, defense
+
+    def shed(self, hand, table, dank, max_shed_allowed, ranks):
+        shed = []
+        for code in self.actions:
+            if code == DONE:
+                break
+            shed.append(self._card(hand, code))
+        return shed
+
+
+def replay(record, print_trace=False):
+    """Plays a record through its engine again.
+
+    Args:
+        record: The Record to replay.
+        print_trace: Whether or not Game prints a human readable trace.
+
+    Returns:
+        The winning seat, or None for a stopped game.
+
+    Raises:
+        RuntimeError: The replay does not end as the record did.
+    """
+
+    # Game and DurakEnv import this module for their recorder hooks.
+    # pylint: disable=import-outside-toplevel
+    actions = iter(record.actions)
+    if record.engine == GAME:
+        from game import Game
+        game = Game([Replay(actions) for _ in record.strategies], print_trace, record.deal)
+        winning_player = game.play(record.turns if record.winner is None else None)
+        winner = None if winning_player is None else winning_player.num
+        turns = game.turns
+    else:
+        from deck import Deck
+        from durak_env import DurakEnv
+        from player import Player
+        env = DurakEnv()
+        env.reset()
+        env.deck = Deck(record.deal)
+        env.opponent = Player("Bot", Replay(actions))
+        action = [0.] * 38
+        action[0] = float(record.attacker)
+        _, _, done, info = env.step(action)
+        while not done:
+            action = [0.] * 38
+            action[next(actions)] = 1.
+            _, _, done, info = env.step(action)
+        winner = 0 if info['end_condition'] == 'WIN' else 1
+        turns = env.turns
+
+    if winner != record.winner or turns != record.turns:
+        raise RuntimeError('Replay ended with winner {} after {} turns, the record with winner {} after {} turns.'
+                           .format(winner, turns, record.winner, record.turns))
+    return winner
+
+
+def main(path, print_trace):
+    """Replays every record of a file and prints a summary.
+
+    Args:
+        path: The record file.
+        print_trace: Whether or not to print a human readable trace.
+    """
+
+    wins = {}
+    with open(path, 'rb') as stream:
+        for record in read_records(stream):
+            winner = replay(record, print_trace)
+            name = 'stopped' if winner is None else record.strategies[winner]
+            wins[name] = wins.get(name, 0) + 1
+    print(wins)
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description="Replay Durak game records.")
+    PARSER.add_argument('file', type=str)
+    PARSER.add_argument('--trace', action='store_true')
+    ARGS = PARSER.parse_args()
+
+    main(ARGS.file, ARGS.trace)
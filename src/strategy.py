@@ -2,13 +2,34 @@
 
 The Strategy class is an interface for for the various strategies.
 All strategies need an attack, defense, and shed.
+
+The batch methods of Strategy decide for many games at once from arrays, in
+the action indices of DurakEnv. Their defaults loop over the single game
+methods, so batch simulators and vector environments can call any strategy.
+
+The PureStrategy class is a second interface whose methods return a Decision
+of card ids from a read-only HandView instead of editing the hand. Player
+applies the decision to its hand, and Adapter lets code written against the
+second interface use any Strategy.
 """
 
 import enum
 import logging
 import random
+from collections import OrderedDict, namedtuple
+
+# pylint: disable=import-error
+import numpy as np
 
-from card import dank_float_order, RANK_NUM
+from bitboard import BEATS, rank_mask, to_mask
+from card import CARDS, dank_float_order, RANK_NUM, RANKS, SORT_KEYS, SUIT_NUM, SUITS
+
+# Action indices besides card ids, as in the DurakEnv action space.
+DONE = 36
+TAKE = 37
+NUM_ACTIONS = 38
+# Flag of a pass in the actions of defend_batch, as PASS | card id.
+PASS = 0x40
 
 
 def rank_matches(cards, rank):
@@ -36,20 +57,8 @@ def defense_options(attack, hand, dank):
         list of cards
 
     """
-    options = []
-    low = RANK_NUM[attack.rank]
-    if attack.suit == dank:
-        for card in hand:
-            rank = RANK_NUM[card.rank]
-            if card.suit == dank and rank > low:
-                options.append(card)
-
-    else:
-        for card in hand:
-            rank = RANK_NUM[card.rank]
-            if (card.suit == attack.suit and rank > low) or card.suit == dank:
-                options.append(card)
-    return options
+    beats = BEATS[dank][attack.id]
+    return [card for card in hand if card.bit & beats]
 
 
 def lowest_defense(attack, hand, dank):
@@ -66,21 +75,10 @@ def lowest_defense(attack, hand, dank):
         The lowest card that can defend or None if there is not a valid card.
     """
 
-    low = RANK_NUM[attack.rank]
-    # Can only defend in dank suit.
-    if attack.suit == dank:
-        for card in hand:
-            rank = RANK_NUM[card.rank]
-            if card.suit == dank and rank > low:
-                return card
-
-    # Can defend with any dank or higher in same suit.
-    else:
-        for card in hand:
-            rank = RANK_NUM[card.rank]
-            if (card.suit == attack.suit and rank > low) or card.suit == dank:
-                return card
-
+    beats = BEATS[dank][attack.id]
+    for card in hand:
+        if card.bit & beats:
+            return card
     return None
 
 
@@ -101,14 +99,73 @@ class Attack(enum.Enum):
     done = 1
 
 
+def batch_hand(hand, dank_num):
+    """Returns a hand list from a row of a batch.
+
+    Args:
+        hand: Bool array (36,) of the hand by Card.id.
+        dank_num: The index of the dank suit.
+
+    Returns:
+        The cards sorted as Player sorts them, equal keys by suit.
+    """
+
+    return sorted([CARDS[card_id] for card_id in np.flatnonzero(hand)], key=SORT_KEYS[SUITS[dank_num]].__getitem__)
+
+
+def batch_table(table):
+    """Returns a table list from a row of a batch.
+
+    Args:
+        table: Int array of card ids in play order, -1 after the last.
+    """
+
+    return [CARDS[card_id] for card_id in table if card_id >= 0]
+
+
+def batch_ranks(ranks):
+    """Returns a ranks dict from a row of a batch.
+
+    Args:
+        ranks: Bool array (9,) of the ranks in play by rank number.
+    """
+
+    return {RANKS[rank_num]: 0 for rank_num in np.flatnonzero(ranks)}
+
+
 class Strategy:
     """An interface for strategies.
+
+    The batch methods take K games at once: hands as a bool array (K, 36)
+    by Card.id, tables as an int array (K, T) of card ids in play order with
+    -1 after the last, the dank suit index of each game, ranks as a bool
+    array (K, 9) by rank number and legal as a bool array (K, NUM_ACTIONS) of
+    the cards that can be played, DONE and TAKE. The defaults ignore legal
+    and loop over the single game methods.
+
+    Attributes:
+        defends_all: Whether a defense after a pass covers every card on the
+            table, as S0 does, or only the last one, as StratRandom does.
     """
 
+    defends_all = True
+
     def __init__(self):
         """Inits Strategy.
         """
 
+    def watch(self, game, num):
+        """Called by Game once the cards are dealt.
+
+        Strategies that need more than their own hand, such as the out pile
+        or the size of the other hand, keep the game to read it from. Card
+        counts are kept up to date in game.knowledge[num].
+
+        Args:
+            game: The Game being played.
+            num: The ID of the player using this strategy.
+        """
+
     def attack(self, hand, table, dank, ranks):
         """An attack turn.
 
@@ -141,6 +198,79 @@ class Strategy:
             ranks: The ranks of the cards on the table.
         """
 
+    def attack_batch(self, hands, tables, danks, ranks, legal):
+        """Attack turns of many games.
+
+        Args:
+            hands: Bool array (K, 36) of each hand.
+            tables: Int array (K, T) of each table, empty for a first attack.
+            danks: The dank suit index of each game.
+            ranks: Bool array (K, 9) of the ranks in play.
+            legal: Bool array (K, NUM_ACTIONS) of the legal actions.
+
+        Returns:
+            Int array (K,) of the card id played, or DONE.
+        """
+
+        ret = np.full(len(hands), DONE)
+        for row, hand in enumerate(hands):
+            atk = self.attack(batch_hand(hand, danks[row]), batch_table(tables[row]), SUITS[danks[row]],
+                              batch_ranks(ranks[row]))
+            if atk[0] == Attack.play:
+                ret[row] = atk[1].id
+        return ret
+
+    def defend_batch(self, hands, tables, danks, pass_is_legal, cards_to_defend, legal):
+        """Defense turns of many games.
+
+        Args:
+            hands: Bool array (K, 36) of each hand.
+            tables: Int array (K, T) of each table.
+            danks: The dank suit index of each game.
+            pass_is_legal: Bool array (K,) of whether a pass is legal.
+            cards_to_defend: Int array (K,) of the number of cards to defend.
+            legal: Bool array (K, NUM_ACTIONS) of the legal actions.
+
+        Returns:
+            Int array (K, max(cards_to_defend)) of the defending card ids in
+            the order of the cards they defend, -1 after the last. The first
+            column holds TAKE for a take and PASS | card id for a pass.
+        """
+
+        ret = np.full((len(hands), max(int(np.max(cards_to_defend, initial=1)), 1)), -1)
+        for row, hand in enumerate(hands):
+            defense = self.defend(batch_hand(hand, danks[row]), batch_table(tables[row]), SUITS[danks[row]],
+                                  bool(pass_is_legal[row]), int(cards_to_defend[row]))
+            if defense[0] == Defense.take:
+                ret[row, 0] = TAKE
+            elif defense[0] == Defense.pass_to:
+                ret[row, 0] = PASS | defense[1][0].id
+            else:
+                ret[row, :len(defense[1])] = [card.id for card in defense[1]]
+        return ret
+
+    def shed_batch(self, hands, tables, danks, max_shed_allowed, ranks, legal):
+        """Shed turns of many games.
+
+        Args:
+            hands: Bool array (K, 36) of each hand.
+            tables: Int array (K, T) of each table.
+            danks: The dank suit index of each game.
+            max_shed_allowed: Int array (K,) of the most cards to shed.
+            ranks: Bool array (K, 9) of the ranks in play.
+            legal: Bool array (K, NUM_ACTIONS) of the legal actions.
+
+        Returns:
+            Bool array (K, 36) of the cards shed.
+        """
+
+        ret = np.zeros(hands.shape, dtype=bool)
+        for row, hand in enumerate(hands):
+            shed = self.shed(batch_hand(hand, danks[row]), batch_table(tables[row]), SUITS[danks[row]],
+                             int(max_shed_allowed[row]), batch_ranks(ranks[row]))
+            ret[row, [card.id for card in shed]] = True
+        return ret
+
 
 class S0(Strategy):
     """Most basic strategy class
@@ -464,7 +594,7 @@ class S2(Strategy):
 
         card_list = []
         for card in hand:
-            if card.suit != dank and len(card_list) < max_shed_allowed and (card.rank in ranks and RANK_NUM[card.rank] < RANK_NUM['J']):
+            if card.suit != dank and len(card_list) < max_shed_allowed and (card.rank in ranks and card.rank_num < RANK_NUM['J']):
                 card_list.append(card)
         for card in card_list:
             hand.remove(card)
@@ -609,6 +739,8 @@ class StratRandom(Strategy):
     """Strategy class that implements a random player
     """
 
+    defends_all = False
+
     def attack(self, hand, table, dank, ranks):
         """random legal move
 
@@ -693,3 +825,378 @@ class StratRandom(Strategy):
                 plays.append(card)
 
         return plays
+
+
+def card_key(cards):
+    """Returns the ids of a list of cards packed into bytes, in order.
+    """
+
+    return bytes([card.id for card in cards])
+
+
+class Cached(Strategy):
+    """Strategy class that memoizes the decisions of a deterministic strategy.
+
+    Decisions are kept in an LRU cache keyed on a compact encoding of every
+    input of the decision: the hand and the table as card_key bytes, which
+    keep their order, the table ranks as their bitboard, the suit number of
+    the dank and the other arguments as small integers. A hand_mask would
+    not do for the hand, since cards of one rank tie on the sort key and
+    their order in the hand can change the decision. Only wrap strategies
+    whose decisions depend on nothing else, such as S0, S1, S2 and StratAI,
+    never StratRandom or a strategy that watches the game.
+
+    Strategies remove the cards they play from the hand, and a failed
+    defense can reorder it, so the cache keeps the resulting hand with the
+    decision and a hit leaves the caller's hand exactly as a call would.
+
+    Positions rarely repeat between fresh deals. The cache pays off where
+    the same deals are played again, as in a parameter sweep on a shared
+    deal set, by one Cached instance shared by every game. Even a hit costs
+    the encoding of the inputs, so for strategies as cheap as S0 only
+    defend, which costs the most, is worth caching. Check hit_rate and the
+    decision latency on the workload before keeping it.
+
+    Attributes:
+        strategy: The wrapped strategy.
+        max_size: The number of decisions kept.
+        methods: The names of the decision methods that are cached, the
+            others call the strategy directly.
+        hits: The number of decisions answered from the cache.
+        misses: The number of decisions passed to the strategy.
+        evictions: The number of decisions dropped to make room.
+    """
+
+    def __init__(self, strategy, max_size=1 << 16, methods=('attack', 'defend', 'shed')):
+        super().__init__()
+        self.strategy = strategy
+        self.defends_all = strategy.defends_all
+        self.max_size = max_size
+        self.methods = tuple(methods)
+        self._attack = 'attack' in self.methods
+        self._defend = 'defend' in self.methods
+        self._shed = 'shed' in self.methods
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def hit_rate(self):
+        """Returns the fraction of decisions answered from the cache.
+        """
+
+        calls = self.hits + self.misses
+        return float(self.hits) / calls if calls else 0.
+
+    def stats(self):
+        """Returns the cache statistics as a dict.
+        """
+
+        return {'size': len(self._cache), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'hit_rate': self.hit_rate()}
+
+    def clear(self):
+        """Drops every cached decision, keeping the statistics.
+        """
+
+        self._cache.clear()
+
+    def _store(self, key, ret, hand):
+        """Caches a decision with the hand it left behind.
+        """
+
+        cache = self._cache
+        cache[key] = (ret, tuple(hand))
+        if len(cache) > self.max_size:
+            cache.popitem(last=False)
+            self.evictions += 1
+
+    def watch(self, game, num):
+        self.strategy.watch(game, num)
+
+    # The keys of attack, defend and shed differ in length, so they never collide.
+
+    def attack(self, hand, table, dank, ranks):
+        if not self._attack:
+            return self.strategy.attack(hand, table, dank, ranks)
+        key = (card_key(hand), card_key(table), SUIT_NUM[dank], rank_mask(ranks))
+        entry = self._cache.get(key)
+        if entry is None:
+            self.misses += 1
+            ret = self.strategy.attack(hand, table, dank, ranks)
+            self._store(key, ret, hand)
+            return ret
+        self._cache.move_to_end(key)
+        self.hits += 1
+        hand[:] = entry[1]
+        return entry[0]
+
+    def defend(self, hand, table, dank, pass_is_legal, cards_to_defend):
+        if not self._defend:
+            return self.strategy.defend(hand, table, dank, pass_is_legal, cards_to_defend)
+        key = (card_key(hand), card_key(table), SUIT_NUM[dank] | pass_is_legal << 2 | cards_to_defend << 3)
+        entry = self._cache.get(key)
+        if entry is None:
+            self.misses += 1
+            ret = self.strategy.defend(hand, table, dank, pass_is_legal, cards_to_defend)
+            self._store(key, (ret[0], None if ret[1] is None else tuple(ret[1])), hand)
+            return ret
+        self._cache.move_to_end(key)
+        self.hits += 1
+        hand[:] = entry[1]
+        ret = entry[0]
+        return ret[0], None if ret[1] is None else list(ret[1])
+
+    def shed(self, hand, table, dank, max_shed_allowed, ranks):
+        if not self._shed:
+            return self.strategy.shed(hand, table, dank, max_shed_allowed, ranks)
+        key = (card_key(hand), card_key(table), SUIT_NUM[dank], rank_mask(ranks), max_shed_allowed)
+        entry = self._cache.get(key)
+        if entry is None:
+            self.misses += 1
+            ret = self.strategy.shed(hand, table, dank, max_shed_allowed, ranks)
+            self._store(key, tuple(ret), hand)
+            return ret
+        self._cache.move_to_end(key)
+        self.hits += 1
+        hand[:] = entry[1]
+        return list(entry[0])
+
+
+class HandView(namedtuple('HandView', ['cards', 'mask'])):
+    """A read-only view of a hand for PureStrategy.
+
+    The view shares the hand list rather than copying it, so it is only
+    valid until the decision is applied, and a strategy must not edit it.
+
+    Attributes:
+        cards: The cards of the hand, in the hand's order.
+        mask: Bitboard of the hand.
+    """
+
+    __slots__ = ()
+
+
+def hand_view(hand):
+    """Returns a HandView of a hand list.
+    """
+
+    return HandView(hand, to_mask(hand))
+
+
+class Decision(namedtuple('Decision', ['action', 'cards'])):
+    """A decision of a PureStrategy.
+
+    Attributes:
+        action: The Attack or Defense member, or None for a shed.
+        cards: A tuple of the ids of the cards played, empty for Attack.done
+            and Defense.take.
+    """
+
+    __slots__ = ()
+
+
+def apply_decision(decision, hand):
+    """Removes the cards of a decision from a hand list.
+
+    Args:
+        decision: A Decision.
+        hand: The list of cards in the hand, edited in place.
+
+    Returns:
+        The decision in the return format of Strategy: (Attack, card) or
+        (Attack.done, None) for an attack, (Defense, cards) or
+        (Defense.take, None) for a defense, or a list of cards for a shed.
+    """
+
+    cards = [CARDS[card_id] for card_id in decision.cards]
+    for card in cards:
+        hand.remove(card)
+    return from_decision(decision, cards)
+
+
+def from_decision(decision, cards):
+    """Converts a Decision to the return format of Strategy.
+
+    Args:
+        decision: The Decision.
+        cards: The cards of the decision's card ids, in order.
+
+    Returns:
+        (Attack, card) or (Attack.done, None) for an attack, (Defense, cards)
+        or (Defense.take, None) for a defense, or a list of cards for a shed.
+    """
+
+    if decision.action is None:
+        return cards
+    if not cards:
+        return decision.action, None
+    if isinstance(decision.action, Attack):
+        return decision.action, cards[0]
+    return decision.action, cards
+
+
+def to_decision(action, ret):
+    """Converts the return of a Strategy method to a Decision.
+
+    Args:
+        action: Attack or Defense for the return of attack or defend, None
+            for the return of shed.
+        ret: The return of the Strategy method.
+
+    Returns:
+        The Decision.
+    """
+
+    if action is None:
+        return Decision(None, tuple(card.id for card in ret))
+    if ret[1] is None:
+        return Decision(ret[0], ())
+    if action is Attack:
+        return Decision(ret[0], (ret[1].id,))
+    return Decision(ret[0], tuple(card.id for card in ret[1]))
+
+
+class PureStrategy(Strategy):
+    """An interface for strategies that never edit the hand.
+
+    The decide methods get the hand as a HandView and return a Decision.
+    Player applies decisions itself, and the Strategy methods apply them to
+    the hand list they are given, so a PureStrategy also works wherever a
+    Strategy is expected.
+    """
+
+    def decide_attack(self, hand, table, dank, ranks):
+        """An attack turn.
+
+        Args:
+            hand: The HandView of the player's hand.
+            table: The cards on the table.
+            dank: The suit of the Dank card.
+            ranks: The ranks of the cards on the table.
+
+        Returns:
+            A Decision of Attack.play and one card, or Attack.done.
+        """
+
+    def decide_defend(self, hand, table, dank, pass_is_legal, cards_to_defend):
+        """A defense turn.
+
+        Args:
+            hand: The HandView of the player's hand.
+            table: The cards on the table.
+            dank: The suit of the Dank card.
+            pass_is_legal: Whether or not a pass is legal.
+            cards_to_defend: The number of cards to defend against.
+
+        Returns:
+            A Decision of Defense.pass_to and one card, Defense.defend and
+            cards_to_defend cards, or Defense.take.
+        """
+
+    def decide_shed(self, hand, table, dank, max_shed_allowed, ranks):
+        """A shed turn.
+
+        Args:
+            hand: The HandView of the player's hand.
+            table: The cards on the table.
+            dank: The suit of the Dank card.
+            max_shed_allowed: The maximum amount of cards to shed.
+            ranks: The ranks of the cards on the table.
+
+        Returns:
+            A Decision of None and the cards to shed.
+        """
+
+    def attack(self, hand, table, dank, ranks):
+        return apply_decision(self.decide_attack(hand_view(hand), table, dank, ranks), hand)
+
+    def defend(self, hand, table, dank, pass_is_legal, cards_to_defend):
+        return apply_decision(self.decide_defend(hand_view(hand), table, dank, pass_is_legal, cards_to_defend), hand)
+
+    def shed(self, hand, table, dank, max_shed_allowed, ranks):
+        return apply_decision(self.decide_shed(hand_view(hand), table, dank, max_shed_allowed, ranks), hand)
+
+
+class Adapter(PureStrategy):
+    """PureStrategy class that decides with a Strategy.
+
+    The strategy plays on a copy of the hand, so code written against
+    PureStrategy, such as searches sharing one hand between candidates, can
+    use any existing strategy.
+
+    Attributes:
+        strategy: The adapted strategy.
+    """
+
+    def __init__(self, strategy):
+        super().__init__()
+        self.strategy = strategy
+        self.defends_all = strategy.defends_all
+
+    def watch(self, game, num):
+        self.strategy.watch(game, num)
+
+    def decide_attack(self, hand, table, dank, ranks):
+        return to_decision(Attack, self.strategy.attack(list(hand.cards), table, dank, ranks))
+
+    def decide_defend(self, hand, table, dank, pass_is_legal, cards_to_defend):
+        return to_decision(Defense, self.strategy.defend(list(hand.cards), table, dank, pass_is_legal,
+                                                         cards_to_defend))
+
+    def decide_shed(self, hand, table, dank, max_shed_allowed, ranks):
+        return to_decision(None, self.strategy.shed(list(hand.cards), table, dank, max_shed_allowed, ranks))
+
+
+def as_pure(strategy):
+    """Returns a strategy as a PureStrategy, adapting it if needed.
+    """
+
+    return strategy if isinstance(strategy, PureStrategy) else Adapter(strategy)
+
+
+class PureS0(PureStrategy):
+    """S0 written against PureStrategy.
+
+    Makes the same decisions as S0 from the same hand, using the hand mask
+    to skip cards already chosen instead of removing them. A failed defense
+    leaves the hand as it was, where S0 moves the cards it tried to the end,
+    so games can differ later where cards of equal sort key swap places.
+    """
+
+    def decide_attack(self, hand, table, dank, ranks):
+        if len(table) == 0:
+            return Decision(Attack.play, (hand.cards[0].id,))  # Must play, 1st attack.
+
+        for card in hand.cards:
+            if card.rank in ranks:
+                return Decision(Attack.play, (card.id,))
+        return Decision(Attack.done, ())
+
+    def decide_defend(self, hand, table, dank, pass_is_legal, cards_to_defend):
+        if pass_is_legal:
+            rank = table[-1].rank
+            for card in hand.cards:
+                if card.rank == rank:
+                    return Decision(Defense.pass_to, (card.id,))
+
+        # Came from pass, every card on the table needs its own defense.
+        attacks = table if cards_to_defend > 1 else table[-1:]
+        free = hand.mask
+        defense = []
+        for attack in attacks:
+            beats = BEATS[dank][attack.id] & free
+            if not beats:
+                return Decision(Defense.take, ())
+            for card in hand.cards:
+                if card.bit & beats:
+                    free &= ~card.bit
+                    defense.append(card.id)
+                    break
+        return Decision(Defense.defend, tuple(defense))
+
+    def decide_shed(self, hand, table, dank, max_shed_allowed, ranks):
+        return Decision(None, tuple(card.id for card in hand.cards if card.rank in ranks)[:max_shed_allowed])
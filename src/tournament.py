@@ -0,0 +1,240 @@
+"""Runs bot vs bot tournaments over every core.
+
+Splits a tournament into (strategy pair, parameter cell, seed block) work
+units, plays them on a ProcessPoolExecutor and aggregates the results per
+cell as they stream back. The parameter cells are the (shed, play) grid of
+game.main, given to any 'ai' seat of a pair.
+
+Every cell of a pair plays the same deals: block b of the seed's DealStream.
+
+    Usage:
+
+    python tournament.py
+    python tournament.py --pairs ai:s0 ai:s1 --games=1000 --workers=8 --seed=N
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# pylint: disable=import-error
+import numpy as np
+
+from batch_game import BatchGame, BatchS0, BatchS1, BatchS2, BatchStratAI, BatchStratRandom
+from deck import DealStream
+from game import Game
+from strategy import S0, S1, S2, StratAI, StratRandom
+
+# Strategy name to its Game and BatchGame classes.
+STRATEGIES = {
+    'ai': (StratAI, BatchStratAI),
+    's0': (S0, BatchS0),
+    's1': (S1, BatchS1),
+    's2': (S2, BatchS2),
+    'random': (StratRandom, BatchStratRandom),
+}
+MAX_TURNS = 200
+
+
+class Tally:
+    """The aggregated results of one (strategy pair, parameter cell).
+
+    Attributes:
+        games: The number of games played.
+        wins: The number of wins of seat 0 and seat 1.
+        stopped: The number of games stopped at the turn limit.
+        turns: The sum of turns over finished games.
+    """
+
+    def __init__(self):
+        self.games = 0
+        self.wins = [0, 0]
+        self.stopped = 0
+        self.turns = 0
+
+    def add(self, result):
+        """Adds the result of a work unit.
+
+        Args:
+            result: The dict returned by play_unit.
+        """
+
+        self.games += result['games']
+        self.wins[0] += result['wins'][0]
+        self.wins[1] += result['wins'][1]
+        self.stopped += result['stopped']
+        self.turns += result['turns']
+
+    def win_ratio(self):
+        """Returns seat 0 wins over seat 1 wins.
+        """
+
+        return float(self.wins[0]) / self.wins[1] if self.wins[1] else float('inf')
+
+    def average_turns(self):
+        """Returns the average turns of finished games.
+        """
+
+        finished = self.games - self.stopped
+        return float(self.turns) / finished if finished else 0.
+
+
+def make_strategies(pair, cell, engine, rng):
+    """Instantiates the strategies of a pair.
+
+    Args:
+        pair: Two strategy names from STRATEGIES.
+        cell: The (shed, play) parameters for 'ai' seats.
+        engine: 'batch' or 'game'.
+        rng: The numpy Generator for BatchStratRandom.
+
+    Returns:
+        The strategies of seat 0 and seat 1.
+    """
+
+    ret = []
+    for name in pair:
+        strategy = STRATEGIES[name][engine == 'batch']
+        if name == 'ai':
+            ret.append(strategy(*cell))
+        elif name == 'random' and engine == 'batch':
+            ret.append(strategy(rng))
+        else:
+            ret.append(strategy())
+    return ret
+
+
+def play_unit(pair, cell, seed, block_index, block_size, engine):
+    """Plays one work unit: every deal of a seed block for a pair and cell.
+
+    Args:
+        pair: Two strategy names from STRATEGIES.
+        cell: The (shed, play) parameters for 'ai' seats.
+        seed: The root seed of the DealStream.
+        block_index: The block of the DealStream to play.
+        block_size: The number of deals per block.
+        engine: 'batch' to play the block as one BatchGame, 'game' to play
+            a Game per deal.
+
+    Returns:
+        A dict of the unit and its games, wins per seat, stopped games and
+        total turns of finished games.
+    """
+
+    deals = DealStream(seed, block_size).block(block_index)
+    rng = np.random.default_rng([seed, block_index])
+    strategies = make_strategies(pair, cell, engine, rng)
+    if engine == 'batch':
+        batch = BatchGame(strategies, deals)
+        winners = batch.play(MAX_TURNS)
+        turns = int(batch.turns[winners >= 0].sum())
+    else:
+        winners = []
+        turns = 0
+        for deal in deals:
+            game = Game(strategies, False, deal)
+            winning_player = game.play(MAX_TURNS)
+            if winning_player is None:
+                winners.append(-1)
+            else:
+                winners.append(winning_player.num)
+                turns += game.turns
+        winners = np.array(winners)
+
+    return {
+        'pair': pair,
+        'cell': cell,
+        'block': block_index,
+        'games': len(winners),
+        'wins': [int((winners == 0).sum()), int((winners == 1).sum())],
+        'stopped': int((winners < 0).sum()),
+        'turns': turns,
+    }
+
+
+def run(pairs, cells, num_games, seed, block_size=100, engine='batch', workers=None):
+    """Runs a tournament, yielding results as work units finish.
+
+    Args:
+        pairs: A list of strategy name pairs.
+        cells: A list of (shed, play) cells. Pairs without an 'ai' seat play
+            a single cell.
+        num_games: The number of games per (pair, cell), rounded up to whole
+            blocks.
+        seed: The root seed of the DealStream.
+        block_size: The number of deals per work unit.
+        engine: 'batch' or 'game'.
+        workers: The number of processes, every core by default.
+
+    Yields:
+        The done and total count of work units, the result of the unit and
+        the Tally of its (pair, cell) so far.
+    """
+
+    num_blocks = -(-num_games // block_size)
+    units = [(tuple(pair), cell if 'ai' in pair else (), seed, block_index, block_size, engine)
+             for pair in pairs
+             for cell in (cells if 'ai' in pair else [()])
+             for block_index in range(num_blocks)]
+    tallies = {}
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(play_unit, *unit) for unit in units]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            tally = tallies.setdefault((result['pair'], result['cell']), Tally())
+            tally.add(result)
+            yield done, len(units), result, tally
+
+
+def main(pairs, grid, num_games, seed, block_size, engine, workers):
+    """The main function for the tournament module.
+
+    Prints progress as units finish, then a summary per (pair, cell) and the
+    best cell of each pair.
+
+    Args:
+        pairs: A list of strategy name pairs.
+        grid: The number of steps per axis of the (shed, play) grid.
+        num_games: The number of games per (pair, cell).
+        seed: The root seed, a random one by default.
+        block_size: The number of deals per work unit.
+        engine: 'batch' or 'game'.
+        workers: The number of processes, every core by default.
+    """
+
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    print('seed: ' + str(seed))
+    cells = [(shed / grid, play / grid) for shed in range(grid) for play in range(grid)]
+
+    tallies = {}
+    for done, total, result, tally in run(pairs, cells, num_games, seed, block_size, engine, workers):
+        tallies[(result['pair'], result['cell'])] = tally
+        print('[' + str(done) + '/' + str(total) + '] ' + ':'.join(result['pair']) + ' ' + str(result['cell'])
+              + ' block ' + str(result['block']) + ' ratio so far: ' + str(tally.win_ratio()))
+
+    max_score = {}
+    for (pair, cell), tally in sorted(tallies.items()):
+        print(':'.join(pair) + ' ' + str(cell) + ' games: ' + str(tally.games) + ' wins: ' + str(tally.wins)
+              + ' stopped: ' + str(tally.stopped) + ' ratio: ' + str(tally.win_ratio())
+              + ' averaging ' + str(tally.average_turns()) + ' turns')
+        if tally.win_ratio() > max_score.get(pair, (-1, None))[0]:
+            max_score[pair] = (tally.win_ratio(), cell)
+    for pair, score in max_score.items():
+        print(':'.join(pair) + ' best: ' + str(score))
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description="Run a Durak bot tournament on every core.")
+    PARSER.add_argument('--pairs', type=str, nargs='+', default=['ai:s0'], required=False,
+                        help="seat0:seat1 strategy names from " + ', '.join(STRATEGIES))
+    PARSER.add_argument('--grid', type=int, default=10, required=False)
+    PARSER.add_argument('--games', type=int, default=100, required=False)
+    PARSER.add_argument('--seed', type=int, default=None, required=False)
+    PARSER.add_argument('--block-size', type=int, default=100, required=False)
+    PARSER.add_argument('--engine', type=str, default='batch', choices=['batch', 'game'], required=False)
+    PARSER.add_argument('--workers', type=int, default=os.cpu_count(), required=False)
+    ARGS = PARSER.parse_args()
+
+    main([pair.split(':') for pair in ARGS.pairs], ARGS.grid, ARGS.games, ARGS.seed, ARGS.block_size, ARGS.engine,
+         ARGS.workers)
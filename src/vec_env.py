@@ -0,0 +1,697 @@
+"""A vectorized DurakEnv that steps many games per call.
+
+Contains the VecEnv class, which keeps N games of DurakEnv in stacked numpy
+arrays and steps them in lock step, as batch_game.BatchGame plays bot vs bot
+games. Every step filters the N actions against the legal moves and plays each
+kind of move, such as an attack or a take, for all games making it at once.
+The opponents answer through the BatchStrategy methods of batch_game.
+Observations, rewards and dones come back stacked, and a finished game is
+reset and started again in the same call.
+
+The action encoding (36 cards, then done and take) and the observation layout
+are those of DurakEnv.step and DurakEnv.gen_obs, and every move plays out as in
+DurakEnv.apply_action.
+
+A DurakEnv opponent keeps its dealt hand in deal order until its first draw or
+pick up, so until then VecEnv asks the single game version of the strategy
+(BatchStrategy.scalar) on the hand in deal order, as Player does. From then on
+the batch strategies read hands in sort order, ties (same rank, different non
+dank suits) by suit, where Player keeps ties in the order they were drawn. So
+an opponent can pick the other card of a tie, and a seeded game can go another
+way than the same deal in a DurakEnv. A strategy without a single game version,
+such as BatchStratRandom, reads the hand in sort order from the deal on.
+
+    Usage:
+
+    python vec_env.py --envs=256 --steps=1000 --seed=N
+"""
+
+import argparse
+import time
+
+# pylint: disable=import-error
+import numpy as np
+
+from batch_game import BEATS_POS, CARD_IDS, CARD_SUITS, NUM_CARDS, POS_RANK, POSITIONS, Turn, first
+from batch_game import BatchS0, BatchS1, BatchS2, BatchStrategy, BatchStratRandom, ScalarStrategy
+from bitboard import to_mask
+from card import CARDS, RANKS, SUITS
+from deck import DealStream, mirror_deal, shuffled_deals
+from durak_env import MODEL, NO_OBS, OBS_SIZE, OBS_STATE, OPPONENT, TOTAL_OPTIONS, WIN_REWARD
+from player import Player
+from strategy import DONE, TAKE, Defense
+
+# The state of a game, in the order of the state values of the observation.
+ATTACK = 0
+SHED = 1
+DEFEND = 2
+
+# The result of a move.
+RUNNING = 0
+WON = 1
+LOST = 2
+END_CONDITIONS = ['N/A', 'WIN', 'LOSE']
+# POS_CARDS[dank_num][position] is the Card of a position for a dank suit.
+POS_CARDS = [[CARDS[card_id] for card_id in card_ids[:NUM_CARDS]] for card_ids in CARD_IDS.tolist()]
+
+
+class VecEnv:
+    """N independent DurakEnv games stepped together in lock step.
+
+    The games are kept in arrays as in BatchGame, with cards by their
+    position in the dank relative sort order and the model in seat MODEL of
+    hands. The table of every game is a row of one Turn that lasts across
+    turns, so a ScalarStrategy opponent reads it as it would in a BatchGame.
+
+    When seeded, the games share one deal stream. The first N games play
+    deal indices 0 to N - 1, then every game that finishes is replaced by
+    the next index, so indices go to slots in the order games finish. Each
+    deal index is played against the opponent a seeded DurakEnv picks for
+    it. In duplicate mode, every deal is played twice as in DurakEnv, the
+    second time mirrored.
+
+    Attributes:
+        num_envs: The number of games.
+        strategies: The BatchStrategy opponents, a Strategy given is played
+            through a ScalarStrategy.
+        opponent: The index in strategies of the opponent of each game.
+        current: The Turn holding the table of every game.
+        dank: The dank suit index of each game.
+        table_card: The card id of the table card of each game.
+        deck: Int array (N, 36) of card positions from bottom to top.
+        deck_len: The number of cards left in each deck.
+        hands: Bool array (N, 2, 36) of the cards in each hand, by position.
+        sizes: Int array (N, 2) of the number of cards in each hand.
+        dealt: Int array (N, 6) of the positions dealt to the opponent, in
+            deal order.
+        dealt_order: Whether the opponent's hand is still in deal order,
+            before its first draw or pick up.
+        out: Bool array (N, 36) of each game's out pile, by position.
+        state: The state of each game, ATTACK, SHED or DEFEND.
+        shed_left: The number of cards the model may still shed in a SHED.
+        mirrored: Whether each game plays the mirror of its deal.
+        takes: The number of takes of the model in each game.
+        legal_moves: The number of moves of the model in each game.
+        successful_attacks: The number of attacks the opponent took.
+        successful_defenses: The number of turns the model defended.
+        observations: Float array (N, 219) of the latest observation of each
+            game.
+        legal: Bool array (N, 38) of the legal moves of each game.
+        duplicate: Whether every deal is played twice with the hands swapped.
+        auto_play: Whether a step plays the forced moves that follow, as
+            DurakEnv.auto_play.
+        macro_shed: Whether a step sheds a whole set of cards, as
+            DurakEnv.macro_shed.
+        rng: The numpy Generator of who attacks first, of unseeded deals and
+            opponents, and of the default BatchStratRandom.
+        deals: The DealStream of a seeded VecEnv, else None.
+        next_deal: The deal index the next seeded game plays.
+        episodes: The number of games finished so far.
+    """
+
+    def __init__(self, num_envs, seed=None, duplicate=False, strategies=None, auto_play=False, macro_shed=False):
+        """Inits VecEnv.
+
+        Args:
+            num_envs: The number of games.
+            seed: Optional deal stream seed shared by every game.
+            duplicate: Whether to play every deal twice with the hands
+                swapped, which needs a seed.
+            strategies: Optional list of opponent strategies, batch versions
+                of DurakEnv's by default.
+            auto_play: Whether every game plays its forced moves itself, as
+                DurakEnv.auto_play.
+            macro_shed: Whether a step sheds a whole set of cards, as
+                DurakEnv.macro_shed.
+        """
+
+        if duplicate and seed is None:
+            raise RuntimeError('Duplicate deals need a seeded environment.')
+        self.num_envs = num_envs
+        self.rng = np.random.default_rng(seed)
+        if strategies is None:
+            strategies = [BatchS0(), BatchS1(), BatchS2(), BatchStratRandom(self.rng)]
+        self.strategies = [strategy if isinstance(strategy, BatchStrategy) else ScalarStrategy(strategy)
+                           for strategy in strategies]
+        for strategy in self.strategies:
+            if isinstance(strategy, ScalarStrategy):
+                strategy.batch = self
+        self.duplicate = duplicate
+        self.auto_play = auto_play
+        self.macro_shed = macro_shed
+        self.deals = None if seed is None else DealStream(seed)
+        self.next_deal = 0
+        self.episodes = 0
+
+        self._games = np.arange(num_envs)
+        self.current = Turn(self._games, np.full(num_envs, MODEL))
+        self.opponent = np.zeros(num_envs, dtype=np.int64)
+        self.dank = np.zeros(num_envs, dtype=np.int64)
+        self.table_card = np.zeros(num_envs, dtype=np.int64)
+        self.deck = np.zeros((num_envs, NUM_CARDS), dtype=np.int64)
+        self.deck_len = np.zeros(num_envs, dtype=np.int64)
+        self.hands = np.zeros((num_envs, 2, NUM_CARDS), dtype=bool)
+        self.sizes = np.zeros((num_envs, 2), dtype=np.int64)
+        self.dealt = np.zeros((num_envs, 6), dtype=np.int64)
+        self.dealt_order = np.zeros(num_envs, dtype=bool)
+        self.out = np.zeros((num_envs, NUM_CARDS), dtype=bool)
+        self.state = np.zeros(num_envs, dtype=np.int64)
+        self.shed_left = np.zeros(num_envs, dtype=np.int64)
+        self.mirrored = np.zeros(num_envs, dtype=bool)
+        self.takes = np.zeros(num_envs, dtype=np.int64)
+        self.legal_moves = np.zeros(num_envs, dtype=np.int64)
+        self.successful_attacks = np.zeros(num_envs, dtype=np.int64)
+        self.successful_defenses = np.zeros(num_envs, dtype=np.int64)
+        self.observations = np.zeros((num_envs, OBS_SIZE))
+        self.legal = np.zeros((num_envs, TOTAL_OPTIONS), dtype=bool)
+
+    def _deals(self, games):
+        """Picks the deal and opponent of a new game in each given slot.
+
+        Returns:
+            Int array (K, 36) of the card ids of each deal, bottom to top.
+        """
+
+        if self.deals is None:
+            self.opponent[games] = self.rng.integers(len(self.strategies), size=len(games))
+            self.mirrored[games] = False
+            return shuffled_deals(self.rng, len(games))
+
+        deals = np.empty((len(games), NUM_CARDS), dtype=np.int64)
+        for row, game in enumerate(games):
+            deal_index = self.next_deal
+            self.next_deal += 1
+            mirrored = False
+            if self.duplicate:
+                deal_index, mirrored = divmod(deal_index, 2)
+            deal = self.deals.deal(deal_index)
+            deals[row] = mirror_deal(deal) if mirrored else deal
+            self.opponent[game] = deal_index % len(self.strategies)
+            self.mirrored[game] = mirrored
+        return deals
+
+    def _start(self, games):
+        """Deals a new game in each given slot and plays up to the model's
+        first decision, as DurakEnv.begin.
+        """
+
+        deals = self._deals(games)
+        self.table_card[games] = deals[:, 0]
+        self.dank[games] = CARD_SUITS[deals[:, 0]]
+        self.deck[games] = POSITIONS[self.dank[games, None], deals]
+        self.deck_len[games] = NUM_CARDS - 12
+        # The top 12 cards are dealt one at a time, the opponent first.
+        self.dealt[games] = self.deck[games, NUM_CARDS - 1:NUM_CARDS - 13:-2]
+        self.dealt_order[games] = True
+        self.hands[games] = False
+        self.hands[games[:, None], OPPONENT, self.dealt[games]] = True
+        self.hands[games[:, None], MODEL, self.deck[games, NUM_CARDS - 2:NUM_CARDS - 13:-2]] = True
+        self.sizes[games] = 6
+        self.out[games] = False
+        self.current.clear(games)
+        self.state[games] = ATTACK
+        self.shed_left[games] = 0
+        self.takes[games] = 0
+        self.legal_moves[games] = 0
+        self.successful_attacks[games] = 0
+        self.successful_defenses[games] = 0
+
+        # The first action of a DurakEnv game only decides who attacks first.
+        if self.duplicate:
+            # The mirrored game swaps the first attacker along with the hands.
+            model_first = ~self.mirrored[games]
+        else:
+            model_first = self.rng.random(len(games)) < .5
+        self._lead(games[~model_first])
+
+    def _decide(self, method, games, *args):
+        """Asks the opponent of each game to decide for it.
+
+        Opponents whose hand is still in deal order decide through
+        _decide_dealt when their strategy has a single game version.
+
+        Args:
+            method: The name of the BatchStrategy method.
+            games: The game indices.
+            *args: Per game arrays passed on to the method.
+
+        Returns:
+            The decisions, in the order of games.
+        """
+
+        if method == 'shed':
+            ret = np.zeros((len(games), NUM_CARDS), dtype=bool)
+        else:
+            ret = np.full(len(games), -1)
+        opponents = self.opponent[games]
+        batch = np.ones(len(games), dtype=bool)
+        for row in np.flatnonzero(self.dealt_order[games]).tolist():
+            game = int(games[row])
+            strategy = self.strategies[opponents[row]].scalar(game)
+            if strategy is not None:
+                ret[row] = self._decide_dealt(method, game, strategy, *[arg[row] for arg in args])
+                batch[row] = False
+
+        for index, strategy in enumerate(self.strategies):
+            sel = batch & (opponents == index)
+            if not sel.any():
+                continue
+            sub = games[sel]
+            ret[sel] = getattr(strategy, method)(self.hands[sub, OPPONENT], *[arg[sel] for arg in args], sub)
+        return ret
+
+    def _decide_dealt(self, method, game, strategy, *args):
+        """Asks a Strategy to decide for the opponent of a game on its hand in
+        deal order, as a DurakEnv opponent decides before its first draw.
+
+        Args:
+            method: The name of the BatchStrategy method.
+            game: The game index.
+            strategy: The Strategy of the opponent.
+            *args: The row of the game of each array passed to _decide.
+
+        Returns:
+            The decision as the BatchStrategy method returns it for the row.
+        """
+
+        dank = int(self.dank[game])
+        cards = POS_CARDS[dank]
+        dealt = self.dealt[game]
+        player = Player('Bot', strategy)
+        player.dank = SUITS[dank]
+        player.hand = [cards[pos] for pos in dealt[self.hands[game, OPPONENT, dealt]].tolist()]
+        player.hand_mask = to_mask(player.hand)
+        table = [cards[pos] for pos in self.current.table[game, :self.current.table_len[game]].tolist()]
+        ranks = {rank: 0 for rank, held in zip(RANKS, self.current.ranks[game].tolist()) if held}
+
+        if method == 'shed':
+            ret = np.zeros(NUM_CARDS, dtype=bool)
+            ret[[POSITIONS[dank, card.id] for card in player.shed(table, int(args[1]), ranks)]] = True
+            return ret
+        if method == 'defend':
+            defense = player.defend(table, False, 1)
+            card = defense[1][0] if defense[0] == Defense.defend else None
+        else:
+            card = player.attack(table, ranks)[1]
+        return -1 if card is None else POSITIONS[dank, card.id]
+
+    def _draw_up(self, games, seat):
+        """Draws a hand of each given game up to 6 cards, as DurakEnv.player_draw.
+
+        Returns:
+            Whether each hand is still empty, which wins its game.
+        """
+
+        need = np.minimum(np.maximum(6 - self.sizes[games, seat], 0), self.deck_len[games])
+        if seat == OPPONENT:
+            # Player sorts its hand on the first card drawn.
+            self.dealt_order[games[need > 0]] = False
+        rows, index = np.nonzero(np.arange(6) < need[:, None])
+        drawn = self.deck[games[rows], self.deck_len[games[rows]] - 1 - index]
+        self.hands[games[rows], seat, drawn] = True
+        self.sizes[games, seat] += need
+        self.deck_len[games] -= need
+        return self.sizes[games, seat] == 0
+
+    def _remove(self, games, seat, pos):
+        """Takes a card out of a hand of each given game.
+        """
+
+        self.hands[games, seat, pos] = False
+        self.sizes[games, seat] -= 1
+
+    def _attack(self, games, seat, pos):
+        """Plays an attack of each given game, as DurakEnv.add_attack.
+        """
+
+        self._remove(games, seat, pos)
+        self.current.add(games, pos)
+        self.current.attack_count[games] += 1
+
+    def _clear(self, games, out):
+        """Clears the tables of the given games.
+
+        Args:
+            games: The game indices.
+            out: Whether the table goes to the out pile, rather than to a
+                hand that already picked it up.
+        """
+
+        if out:
+            self.out[games] |= self.current.table_mask(games)
+        self.current.clear(games)
+
+    def _lead(self, games):
+        """Plays the opponent's first attack of a turn in each given game.
+        """
+
+        if len(games):
+            self._attack(games, OPPONENT, self._decide('lead', games))
+            self.state[games] = DEFEND
+
+    def _attack_with(self, games, pos):
+        """The model attacks with a card and the opponent defends or takes.
+        """
+
+        result = np.full(len(games), RUNNING)
+        self._attack(games, MODEL, pos)
+        defense = self._decide('defend', games, self.hands[games, OPPONENT] & BEATS_POS[pos])
+        took = defense < 0
+        taking = games[took]
+        self.state[taking] = SHED
+        self.shed_left[taking] = np.minimum(6 - self.current.attack_count[taking], self.sizes[taking, OPPONENT])
+        self.successful_attacks[taking] += 1
+
+        rows = np.flatnonzero(~took)
+        held = games[rows]
+        self._remove(held, OPPONENT, defense[rows])
+        self.current.add(held, defense[rows])
+        # The turn ends on a full table or an empty hand, the model draws first.
+        rows = rows[(self.current.table_len[held] == 12) | (self.sizes[held] == 0).any(axis=1)]
+        self._clear(games[rows], True)
+        won = self._draw_up(games[rows], MODEL)
+        result[rows[won]] = WON
+        rows = rows[~won]
+        lost = self._draw_up(games[rows], OPPONENT)
+        result[rows[lost]] = LOST
+        self._lead(games[rows[~lost]])
+        return result
+
+    def _cease(self, games, _):
+        """The model ceases its attack and the opponent leads the next turn.
+        """
+
+        self._clear(games, True)
+        if self._draw_up(games, MODEL).any() or self._draw_up(games, OPPONENT).any():
+            raise RuntimeError('Win condition: a player won during done')
+        self._lead(games)
+        return np.full(len(games), RUNNING)
+
+    def _defend_with(self, games, pos):
+        """The model defends with a card and the opponent attacks again or
+        ceases.
+        """
+
+        result = np.full(len(games), RUNNING)
+        # Unlike the opponent's defenses, the model's do not join the ranks.
+        self._remove(games, MODEL, pos)
+        self.current.add(games, pos, ranked=False)
+        over = (self.current.table_len[games] == 12) | (self.sizes[games] == 0).any(axis=1)
+
+        # The turn ends on a full table or an empty hand, the opponent draws first.
+        rows = np.flatnonzero(over)
+        self._clear(games[rows], True)
+        lost = self._draw_up(games[rows], OPPONENT)
+        result[rows[lost]] = LOST
+        rows = rows[~lost]
+        won = self._draw_up(games[rows], MODEL)
+        result[rows[won]] = WON
+        self.state[games[rows[~won]]] = ATTACK
+
+        attacking = games[~over]
+        if len(attacking):
+            matches = self.hands[attacking, OPPONENT] & self.current.ranks[attacking][:, POS_RANK]
+            atk = self._decide('attack', attacking, matches)
+            play = atk >= 0
+            self._attack(attacking[play], OPPONENT, atk[play])
+            ceased = attacking[~play]
+            self._clear(ceased, True)
+            if self._draw_up(ceased, OPPONENT).any() or self._draw_up(ceased, MODEL).any():
+                raise RuntimeError('Win condition in defense phase: a player won after ceasing attack.')
+            self.successful_defenses[ceased] += 1
+            self.state[ceased] = ATTACK
+        return result
+
+    def _take(self, games, _):
+        """The model takes, after the opponent sheds, and the opponent leads.
+        """
+
+        result = np.full(len(games), RUNNING)
+        self.takes[games] += 1
+        matches = self.hands[games, OPPONENT] & self.current.ranks[games][:, POS_RANK]
+        max_shed_allowed = np.minimum(6 - self.current.attack_count[games], self.sizes[games, MODEL])
+        shed = self._decide('shed', games, matches, max_shed_allowed)
+        shed_len = shed.sum(axis=1)
+        self.hands[games, OPPONENT] &= ~shed
+        self.sizes[games, OPPONENT] -= shed_len
+        lost = self._draw_up(games, OPPONENT)
+        result[lost] = LOST
+
+        taking = games[~lost]
+        self.hands[taking, MODEL] |= self.current.table_mask(taking) | shed[~lost]
+        self.sizes[taking, MODEL] += self.current.table_len[taking] + shed_len[~lost]
+        self._clear(taking, False)
+        self._lead(taking)
+        return result
+
+    def _shed_card(self, games, pos):
+        """The model sheds a card onto the table the opponent takes.
+        """
+
+        self._attack(games, MODEL, pos)
+        self.shed_left[games] -= 1
+        return np.full(len(games), RUNNING)
+
+    def _end_shed(self, games, _):
+        """The opponent picks up the table and the model draws.
+        """
+
+        result = np.full(len(games), RUNNING)
+        self.hands[games, OPPONENT] |= self.current.table_mask(games)
+        self.sizes[games, OPPONENT] += self.current.table_len[games]
+        self.dealt_order[games] = False
+        self._clear(games, False)
+        self.state[games] = ATTACK
+        self.shed_left[games] = 0
+        result[self._draw_up(games, MODEL)] = WON
+        return result
+
+    def _apply(self, games, moves):
+        """Plays a move of the model in each given game, as
+        DurakEnv.apply_action.
+
+        Args:
+            games: The game indices.
+            moves: The index in the action space of each game's move.
+
+        Returns:
+            RUNNING, WON or LOST for each game.
+
+        Raises:
+            RuntimeError: A move is not legal.
+        """
+
+        if not self.legal[games, moves].all():
+            raise RuntimeError('Model made an illegal move')
+        result = np.full(len(games), RUNNING)
+        self.legal_moves[games] += 1
+        state = self.state[games]
+        card = moves < NUM_CARDS
+        pos = POSITIONS[self.dank[games], np.where(card, moves, 0)]
+        for phase, plays_card, play in ((ATTACK, True, self._attack_with), (ATTACK, False, self._cease),
+                                        (DEFEND, True, self._defend_with), (DEFEND, False, self._take),
+                                        (SHED, True, self._shed_card), (SHED, False, self._end_shed)):
+            rows = np.flatnonzero((state == phase) & (card == plays_card))
+            if len(rows):
+                result[rows] = play(games[rows], pos[rows])
+        return result
+
+    def _apply_shed(self, games, actions):
+        """Sheds a whole set of cards in each given game and ends the shed,
+        as DurakEnv.shed_choice and DurakEnv.apply_shed.
+
+        Args:
+            games: The game indices, every game in a SHED.
+            actions: Array (K, 38) of the action of each game, card entries
+                above .5 asking to shed the card.
+
+        Returns:
+            RUNNING, WON or LOST for each game.
+        """
+
+        # The legal cards asked for, the highest rated ones if more are asked
+        # for than may be shed, lower ids first among equal ratings.
+        values = np.where(self.legal[games, :NUM_CARDS] & (actions[:, :NUM_CARDS] > .5), actions[:, :NUM_CARDS],
+                          -np.inf)
+        order = np.argsort(-values, axis=1, kind='stable')
+        place = np.empty_like(order)
+        place[np.arange(len(games))[:, None], order] = np.arange(NUM_CARDS)
+        chosen = (values > -np.inf) & (place < self.shed_left[games, None])
+        chosen = chosen[np.arange(len(games))[:, None], CARD_IDS[self.dank[games], :NUM_CARDS]]
+        rows = np.flatnonzero(chosen.any(axis=1))
+        while len(rows):
+            pos = first(chosen[rows])
+            chosen[rows, pos] = False
+            self._attack(games[rows], MODEL, pos)
+            rows = rows[chosen[rows].any(axis=1)]
+        # Done ends the shed as it does when shedding card by card.
+        return self._apply(games, np.full(len(games), DONE))
+
+    def _play_forced(self, games, result):
+        """Plays forced moves until each game's model has a choice or the
+        game ends, as DurakEnv.play_forced.
+
+        Args:
+            games: The game indices.
+            result: RUNNING, WON or LOST for each game, updated in place.
+
+        Returns:
+            The number of forced moves played in each game.
+        """
+
+        skipped = np.zeros(len(games), dtype=np.int64)
+        rows = np.flatnonzero(result == RUNNING)
+        while len(rows):
+            self._update_legal(games[rows])
+            legal = self.legal[games[rows]]
+            forced = legal.sum(axis=1) == 1
+            rows = rows[forced]
+            if not len(rows):
+                break
+            result[rows] = self._apply(games[rows], legal[forced].argmax(axis=1))
+            skipped[rows] += 1
+            rows = rows[result[rows] == RUNNING]
+        return skipped
+
+    def _update_legal(self, games):
+        """Updates the legal moves of the given games, as
+        DurakEnv.update_legal.
+        """
+
+        state = self.state[games]
+        table_len = self.current.table_len[games]
+        last = self.current.table[games, np.maximum(table_len - 1, 0)]
+        matching = self.current.ranks[games][:, POS_RANK] | ((state == ATTACK) & (table_len == 0))[:, None]
+        allowed = np.where((state == DEFEND)[:, None], BEATS_POS[last], matching)
+        allowed &= ~((state == SHED) & (self.shed_left[games] <= 0))[:, None]
+        cards = self.hands[games, MODEL] & allowed
+        self.legal[games, :NUM_CARDS] = cards[np.arange(len(games))[:, None], POSITIONS[self.dank[games]]]
+        self.legal[games, DONE] = (state == SHED) | ((state == ATTACK) & (table_len > 0))
+        self.legal[games, TAKE] = state == DEFEND
+
+    def _observe(self, games):
+        """Builds the observations of the given games, as DurakEnv.gen_obs.
+        """
+
+        rows = np.arange(len(games))
+        by_id = POSITIONS[self.dank[games]]
+        codes = (self.current.table_mask(games)[rows[:, None], by_id].astype(np.int64)
+                 + 2 * self.hands[games, MODEL][rows[:, None], by_id] + 3 * self.out[games][rows[:, None], by_id])
+        codes[rows, self.table_card[games]] = 4
+        obs = np.zeros((len(games), OBS_SIZE))
+        obs[:, :5 * NUM_CARDS] = (codes[:, None, :] == np.arange(5)[:, None]).reshape(len(games), 5 * NUM_CARDS)
+        state = self.state[games]
+        defending = np.flatnonzero(state == DEFEND)
+        last = self.current.table[games[defending], self.current.table_len[games[defending]] - 1]
+        obs[defending, 5 * NUM_CARDS + CARD_IDS[self.dank[games[defending]], last]] = 1.
+        obs[rows, OBS_STATE + state] = 1.
+        self.observations[games] = obs
+
+    def _infos(self, result, skipped):
+        """Builds the info dict of every game, as DurakEnv.gen_info.
+        """
+
+        infos = [{'takes': takes, 'legal_moves': legal_moves, 'successful_attacks': attacks,
+                  'successful_defends': defenses, 'end_condition': END_CONDITIONS[condition], 'player1': True}
+                 for takes, legal_moves, attacks, defenses, condition
+                 in zip(self.takes.tolist(), self.legal_moves.tolist(), self.successful_attacks.tolist(),
+                        self.successful_defenses.tolist(), result.tolist())]
+        if skipped is not None:
+            for info, count in zip(infos, skipped.tolist()):
+                info['skipped_steps'] = count
+        return infos
+
+    def reset(self):
+        """Starts a new game in every slot.
+
+        Returns:
+            Float array (N, 219) of the first observations.
+        """
+
+        self._start(self._games)
+        if self.auto_play:
+            self._play_forced(self._games, np.full(self.num_envs, RUNNING))
+        self._update_legal(self._games)
+        self._observe(self._games)
+        return self.observations.copy()
+
+    def step(self, actions):
+        """Steps every game once.
+
+        Args:
+            actions: Array (N, 38) of the action of each game, as in
+                DurakEnv.step.
+
+        Returns:
+            The observations (N, 219), the rewards (N,), the dones (N,) and
+            the list of N info dicts. A finished game is reset at once: its
+            row of observations is the first of the next game, its info gets
+            the last observation of the finished game as
+            'terminal_observation'.
+        """
+
+        actions = np.asarray(actions, dtype=float)
+        games = self._games
+        # The legal move an action rates highest, the lowest index winning ties.
+        moves = np.where(self.legal, np.abs(actions + .01), -1.).argmax(axis=1)
+        if self.macro_shed:
+            result = np.full(self.num_envs, RUNNING)
+            shedding = self.state == SHED
+            if shedding.any():
+                result[shedding] = self._apply_shed(games[shedding], actions[shedding])
+            if not shedding.all():
+                result[~shedding] = self._apply(games[~shedding], moves[~shedding])
+        else:
+            result = self._apply(games, moves)
+        skipped = self._play_forced(games, result) if self.auto_play else None
+
+        dones = result != RUNNING
+        rewards = np.where(result == WON, float(WIN_REWARD), 0.)
+        infos = self._infos(result, skipped)
+        finished = np.flatnonzero(dones)
+        if len(finished):
+            for index in finished:
+                infos[index]['terminal_observation'] = NO_OBS
+            self.episodes += len(finished)
+            self._start(finished)
+            if self.auto_play:
+                self._play_forced(finished, np.full(len(finished), RUNNING))
+        self._update_legal(games)
+        self._observe(games)
+        return self.observations.copy(), rewards, dones, infos
+
+    def close(self):
+        """Does nothing, every game lives in the arrays of the VecEnv.
+        """
+
+
+def main(num_envs, num_steps, seed):
+    """Steps random legal actions and prints the throughput.
+
+    Args:
+        num_envs: The number of games.
+        num_steps: The number of VecEnv steps.
+        seed: The deal stream seed.
+    """
+
+    vec_env = VecEnv(num_envs, seed)
+    rng = np.random.default_rng(seed)
+    vec_env.reset()
+    wins = 0
+    start = time.perf_counter()
+    for _ in range(num_steps):
+        _, rewards, _, _ = vec_env.step(rng.random((num_envs, TOTAL_OPTIONS)))
+        wins += int((rewards > 0).sum())
+    elapsed = time.perf_counter() - start
+    print('envs: ' + str(num_envs) + ' steps/s: ' + '{:.1f}'.format(num_envs * num_steps / elapsed)
+          + ' episodes: ' + str(vec_env.episodes) + ' wins: ' + str(wins))
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description="Step random actions in a vectorized Durak environment.")
+    PARSER.add_argument('--envs', type=int, default=256, required=False)
+    PARSER.add_argument('--steps', type=int, default=1000, required=False)
+    PARSER.add_argument('--seed', type=int, default=0, required=False)
+    ARGS = PARSER.parse_args()
+
+    main(ARGS.envs, ARGS.steps, ARGS.seed)
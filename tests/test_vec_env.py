@@ -0,0 +1,244 @@
+"""Checks VecEnv against DurakEnv, game by game and step by step.
+
+Every opponent decision VecEnv makes is recorded and fed to a DurakEnv
+opponent playing the same deal, so both play the same game and every return
+of every step can be compared. Each recorded decision is also checked against
+what the opponent's strategy decides on the DurakEnv hand: the very card while
+the hand is in deal order, and a card of the same sort key, a tie, once
+sorted.
+
+    Usage:
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+from collections import deque
+
+# pylint: disable=import-error
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# pylint: disable=wrong-import-position
+from batch_game import CARD_IDS, BatchStrategy, BatchStratAI
+from bitboard import BEATS
+from card import CARDS, SORT_KEYS
+from deck import Deck
+from durak_env import NO_OBS, TOTAL_OPTIONS, DurakEnv
+from player import Player
+from strategy import Attack, Defense, S0, S1, S2, StratRandom
+from vec_env import ATTACK, VecEnv
+
+
+class Recorder(BatchStrategy):
+    """Plays a BatchStrategy and queues its decisions, by card id, per game.
+    """
+
+    def __init__(self, strategy, vec_env, queues):
+        self.strategy = strategy
+        self.vec_env = vec_env
+        self.queues = queues
+        self.defends_all = strategy.defends_all
+
+    def _record(self, kind, games, decisions):
+        for row, game in enumerate(games):
+            dank = self.vec_env.dank[game]
+            if kind == 'shed':
+                value = [int(CARD_IDS[dank, pos]) for pos in np.flatnonzero(decisions[row])]
+            else:
+                value = int(CARD_IDS[dank, decisions[row]]) if decisions[row] >= 0 else -1
+            self.queues[game].append((kind, value))
+        return decisions
+
+    def lead(self, hands, games):
+        return self._record('attack', games, self.strategy.lead(hands, games))
+
+    def attack(self, hands, matches, games):
+        return self._record('attack', games, self.strategy.attack(hands, matches, games))
+
+    def defend(self, hands, options, games):
+        return self._record('defend', games, self.strategy.defend(hands, options, games))
+
+    def shed(self, hands, matches, max_shed_allowed, games):
+        return self._record('shed', games, self.strategy.shed(hands, matches, max_shed_allowed, games))
+
+    def scalar(self, game):
+        strategy = self.strategy.scalar(game)
+        return None if strategy is None else ScalarRecorder(strategy, self.queues[game])
+
+
+class ScalarRecorder:
+    """Plays a Strategy for VecEnv and queues its decisions, by card id.
+    """
+
+    defends_all = True
+
+    def __init__(self, strategy, queue):
+        self.strategy = strategy
+        self.queue = queue
+
+    def attack(self, hand, table, dank, ranks):
+        atk = self.strategy.attack(hand, table, dank, ranks)
+        self.queue.append(('attack', -1 if atk[1] is None else atk[1].id))
+        return atk
+
+    def defend(self, hand, table, dank, pass_is_legal, cards_to_defend):
+        defense = self.strategy.defend(hand, table, dank, pass_is_legal, cards_to_defend)
+        self.queue.append(('defend', defense[1][0].id if defense[0] == Defense.defend else -1))
+        return defense
+
+    def shed(self, hand, table, dank, max_shed_allowed, ranks):
+        shed = self.strategy.shed(hand, table, dank, max_shed_allowed, ranks)
+        self.queue.append(('shed', sorted(card.id for card in shed)))
+        return shed
+
+
+class Replay:
+    """Plays the decisions a Recorder queued for a game in a DurakEnv.
+
+    Attributes:
+        queue: The decisions left, by card id.
+        strategy: The Strategy to check each decision against, or None.
+        player: The DurakEnv opponent playing the decisions.
+    """
+
+    defends_all = True
+
+    def __init__(self, queue, strategy):
+        self.queue = queue
+        self.strategy = None if isinstance(strategy, StratRandom) else strategy
+        self.player = None
+
+    def _pop(self, kind):
+        got, value = self.queue.popleft()
+        assert got == kind
+        return value
+
+    def _check(self, dank, played, expected):
+        """Checks the cards played against the cards the strategy plays.
+        """
+
+        if self.strategy is None:
+            return
+        if not self.player.hand_sorted:
+            assert sorted(card.id for card in played) == sorted(card.id for card in expected)
+        assert sorted(SORT_KEYS[dank][card] for card in played) == sorted(SORT_KEYS[dank][card] for card in expected)
+
+    def attack(self, hand, table, dank, ranks):
+        card_id = self._pop('attack')
+        card = None if card_id < 0 else CARDS[card_id]
+        if self.strategy is not None:
+            expected = self.strategy.attack(list(hand), table, dank, ranks)[1]
+            self._check(dank, [card] if card else [], [expected] if expected else [])
+        if card is None:
+            return Attack.done, None
+        assert not table or card.rank in ranks
+        hand.remove(card)
+        return Attack.play, card
+
+    def defend(self, hand, table, dank, pass_is_legal, cards_to_defend):
+        card_id = self._pop('defend')
+        card = None if card_id < 0 else CARDS[card_id]
+        if self.strategy is not None:
+            defense = self.strategy.defend(list(hand), table, dank, pass_is_legal, cards_to_defend)
+            self._check(dank, [card] if card else [], defense[1] if defense[0] == Defense.defend else [])
+        if card is None:
+            return Defense.take, None
+        assert BEATS[dank][table[-1].id] & card.bit
+        hand.remove(card)
+        return Defense.defend, [card]
+
+    def shed(self, hand, table, dank, max_shed_allowed, ranks):
+        cards = [CARDS[card_id] for card_id in self._pop('shed')]
+        if self.strategy is not None:
+            self._check(dank, cards, self.strategy.shed(list(hand), table, dank, max_shed_allowed, ranks))
+        assert len(cards) <= max_shed_allowed
+        for card in cards:
+            assert card.rank in ranks
+            hand.remove(card)
+        return cards
+
+
+def play_both(num_envs, num_steps, seed, strategies=None, duplicate=False, auto_play=False, macro_shed=False):
+    """Steps a VecEnv with random actions and replays every game in a DurakEnv.
+
+    Returns:
+        The number of games finished.
+    """
+
+    vec_env = VecEnv(num_envs, seed, duplicate, strategies, auto_play, macro_shed)
+    queues = [deque() for _ in range(num_envs)]
+    vec_env.strategies = [Recorder(strategy, vec_env, queues) for strategy in vec_env.strategies]
+    started = {}
+    start = vec_env._start  # pylint: disable=protected-access
+
+    def record_start(games):
+        for game in games:
+            queues[game] = deque()
+        start(games)
+        for game in games:
+            started[int(game)] = (CARD_IDS[vec_env.dank[game], vec_env.deck[game]],
+                                  vec_env.state[game] == ATTACK, queues[game],
+                                  vec_env.strategies[vec_env.opponent[game]].strategy.scalar(int(game)))
+
+    vec_env._start = record_start  # pylint: disable=protected-access
+
+    def replay(game):
+        deal, model_first, queue, strategy = started.pop(game)
+        env = DurakEnv()
+        env.auto_play = auto_play
+        env.macro_shed = macro_shed
+        env.reset()
+        env.deck = Deck(deal)
+        replayed = Replay(queue, strategy)
+        env.opponent = Player('Bot', replayed)
+        replayed.player = env.opponent
+        action = np.zeros(TOTAL_OPTIONS)
+        action[0] = 0. if model_first else 1.
+        obs, _, done, _ = env.step(action)
+        assert not done
+        return env, obs
+
+    observations = vec_env.reset()
+    envs = []
+    for game in range(num_envs):
+        env, obs = replay(game)
+        assert np.array_equal(obs, observations[game])
+        assert np.array_equal(env.legal, vec_env.legal[game])
+        envs.append(env)
+
+    rng = np.random.default_rng(seed)
+    finished = 0
+    for _ in range(num_steps):
+        actions = rng.random((num_envs, TOTAL_OPTIONS))
+        observations, rewards, dones, infos = vec_env.step(actions)
+        for game in range(num_envs):
+            obs, reward, done, info = envs[game].step(actions[game])
+            assert reward == rewards[game]
+            assert done == dones[game]
+            vec_info = dict(infos[game])
+            if done:
+                assert vec_info.pop('terminal_observation') is NO_OBS
+                assert not envs[game].opponent.strategy.queue
+                envs[game], obs = replay(game)
+                finished += 1
+            assert vec_info == info
+            assert np.array_equal(obs, observations[game])
+            assert np.array_equal(envs[game].legal, vec_env.legal[game])
+    return finished
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'auto_play': True},
+    {'macro_shed': True},
+    {'auto_play': True, 'macro_shed': True},
+    {'duplicate': True},
+    {'strategies': [S0(), S1(), S2(), StratRandom()]},
+    {'strategies': [BatchStratAI(.5, .3), BatchStratAI(.7, .8)]},
+])
+def test_vec_env_plays_as_durak_env(options):
+    assert play_both(16, 200, 7, **options) > 0